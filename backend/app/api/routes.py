@@ -1,23 +1,76 @@
 ### app/api/routes.py
-from fastapi import APIRouter, Depends
-from typing import List
+from fastapi import APIRouter, Depends, Query, Response
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from uuid import UUID
+from datetime import date
 
 from app.schemas.schemas import (
     UserLogin, TenantCreate, DashboardCreate,
-    TenantOut, DashboardOut, CostFilterParams, CostGroupResult,
+    TenantOut, DashboardOut, CostFilterParams, CostGroupResult, CostQuery, CostQueryResult,
     FolderCreate, FolderOut, SaasLicenseCreate, SaasLicenseOut,
-    ChartCreate, ChartOut
+    ChartCreate, ChartOut, TagKeyOut, BudgetCreate, BudgetOut, BudgetAlertEventOut,
+    CostAnomalyOut, SavingsRecommendationOut, RawUsageOut
 )
 from app.services.dashboard import (
     login_user, create_tenant, get_tenants,
     get_dashboards, create_dashboard, get_costs_by_group, get_db,
     create_folder, get_folders, get_folders_and_dashboards,
     create_saas_license, get_saas_licenses,
-    create_chart, get_charts, get_dashboard_data
+    create_chart, get_charts, get_dashboard_data, get_cache_stats, get_async_db,
+    stream_ndjson, get_cost_query, get_dashboard_widgets_data, get_tag_keys, get_tag_values,
+    create_budget, get_budgets, get_budget_alert_events, get_anomalies,
+    get_savings_recommendations, get_raw_usage,
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 )
+from app.services.export import export_costs, MEDIA_TYPES
+from app.models.models import Tenant, Dashboard, DashFolder, SaasLicense, Chart, Budget
+from app.core.metrics import request_tenant
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-router = APIRouter()
+router = APIRouter(dependencies=[Depends(request_tenant)])
+
+
+class ListParams:
+    def __init__(
+        self,
+        tenant_id: UUID,
+        cursor: Optional[str] = None,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        format: str = Query("json", pattern="^(json|ndjson)$")
+    ):
+        self.tenant_id = tenant_id
+        self.cursor = cursor
+        self.limit = limit
+        self.format = format
+
+
+# /tenants is the one listing that spans tenants, so its tenant_id stays optional.
+class TenantListParams(ListParams):
+    def __init__(
+        self,
+        tenant_id: Optional[UUID] = None,
+        cursor: Optional[str] = None,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        format: str = Query("json", pattern="^(json|ndjson)$")
+    ):
+        super().__init__(tenant_id, cursor, limit, format)
+
+
+async def _list(fetch, model, schema, params: ListParams, db: AsyncSession, response: Response):
+    # ndjson streams every row after the cursor; json returns one page and puts
+    # the cursor for the next one in X-Next-Cursor.
+    if params.format == "ndjson":
+        return StreamingResponse(
+            stream_ndjson(model, schema, params.tenant_id, params.cursor),
+            media_type="application/x-ndjson"
+        )
+    items, next_cursor = await fetch(db, params.tenant_id, params.cursor, params.limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return items
+
 
 @router.post("/login")
 def login(user: UserLogin):
@@ -28,30 +81,120 @@ def new_tenant(tenant: TenantCreate, db: Session = Depends(get_db)):
     return create_tenant(tenant, db)
 
 @router.get("/tenants", response_model=List[TenantOut])
-def tenants(db: Session = Depends(get_db)):
-    return get_tenants(db)
+async def tenants(response: Response, params: TenantListParams = Depends(), db: AsyncSession = Depends(get_async_db)):
+    return await _list(get_tenants, Tenant, TenantOut, params, db, response)
 
 @router.get("/dashboards", response_model=List[DashboardOut])
-def dashboards(db: Session = Depends(get_db)):
-    return get_dashboards(db)
+async def dashboards(response: Response, params: ListParams = Depends(), db: AsyncSession = Depends(get_async_db)):
+    return await _list(get_dashboards, Dashboard, DashboardOut, params, db, response)
+
+@router.get("/dashboards/{dashboard_id}/data")
+async def dashboard_widgets_data(
+    dashboard_id: UUID,
+    tenant_id: UUID,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await get_dashboard_widgets_data(dashboard_id, tenant_id, db, start_date, end_date)
 
 @router.post("/dashboards", response_model=DashboardOut)
 def new_dashboard(dashboard: DashboardCreate, db: Session = Depends(get_db)):
     return create_dashboard(dashboard, db)
 
 @router.post("/costs", response_model=List[CostGroupResult])
-def costs_by_group(filter: CostFilterParams, db: Session = Depends(get_db)):
-    return get_costs_by_group(filter, db)
+async def costs_by_group(filter: CostFilterParams, db: AsyncSession = Depends(get_async_db)):
+    return await get_costs_by_group(filter, db)
+
+
+@router.post("/costs/query", response_model=CostQueryResult)
+async def cost_query(query: CostQuery, db: AsyncSession = Depends(get_async_db)):
+    return await get_cost_query(query, db)
+
+
+@router.get("/tags", response_model=List[TagKeyOut])
+async def tag_keys(
+    tenant_id: UUID,
+    prefix: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await get_tag_keys(db, tenant_id, prefix, limit)
+
+
+@router.get("/tags/{tag_key}/values")
+async def tag_values(
+    tag_key: str,
+    tenant_id: UUID,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await get_tag_values(db, tenant_id, tag_key, limit)
+
+
+@router.get("/anomalies", response_model=List[CostAnomalyOut])
+async def anomalies(
+    tenant_id: UUID,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    min_score: Optional[float] = Query(None, ge=0),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await get_anomalies(db, tenant_id, start_date, end_date, min_score, limit)
+
+
+@router.get("/savings", response_model=List[SavingsRecommendationOut])
+async def savings_recommendations(
+    tenant_id: UUID,
+    kind: Optional[str] = Query(None, pattern="^(idle|rightsize|k8s_requests)$"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await get_savings_recommendations(db, tenant_id, kind, limit)
+
+
+@router.get("/raw-usage", response_model=List[RawUsageOut])
+async def raw_usage(
+    tenant_id: UUID,
+    start_date: date,
+    end_date: date,
+    service: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Typed rows with their original provider payload, rehydrated from the raw archive.
+    return await get_raw_usage(db, tenant_id, start_date, end_date, service, limit)
+
+
+@router.post("/costs/export")
+def export_cost_rows(
+    filter: CostFilterParams,
+    format: str = Query("csv", pattern="^(csv|parquet)$"),
+    after_date: Optional[date] = None,
+    after_id: Optional[UUID] = None
+):
+    # Resume an interrupted export by passing the cost_date and id of the last row received.
+    return StreamingResponse(
+        export_costs(filter, format, after_date, after_id),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="costs-{filter.tenant_id}.{format}"'}
+    )
 
 
 @router.get("/dashboard")
-def dashboard_summary(db: Session = Depends(get_db)):
-    return get_dashboard_data(db)
+async def dashboard_summary(tenant_id: UUID, db: AsyncSession = Depends(get_async_db)):
+    return await get_dashboard_data(db, tenant_id)
+
+
+@router.get("/cache/stats")
+async def cache_stats():
+    return await get_cache_stats()
 
 
 @router.get("/folders", response_model=List[FolderOut])
-def folders(db: Session = Depends(get_db)):
-    return get_folders(db)
+async def folders(response: Response, params: ListParams = Depends(), db: AsyncSession = Depends(get_async_db)):
+    return await _list(get_folders, DashFolder, FolderOut, params, db, response)
 
 
 @router.post("/folders", response_model=FolderOut)
@@ -60,13 +203,13 @@ def new_folder(folder: FolderCreate, db: Session = Depends(get_db)):
 
 
 @router.get("/folders-and-dashboards")
-def folders_and_dashboards(db: Session = Depends(get_db)):
-    return get_folders_and_dashboards(db)
+async def folders_and_dashboards(tenant_id: UUID, db: AsyncSession = Depends(get_async_db)):
+    return await get_folders_and_dashboards(db, tenant_id)
 
 
 @router.get("/saas-licenses", response_model=List[SaasLicenseOut])
-def saas_licenses(db: Session = Depends(get_db)):
-    return get_saas_licenses(db)
+async def saas_licenses(response: Response, params: ListParams = Depends(), db: AsyncSession = Depends(get_async_db)):
+    return await _list(get_saas_licenses, SaasLicense, SaasLicenseOut, params, db, response)
 
 
 @router.post("/saas-licenses", response_model=SaasLicenseOut)
@@ -75,10 +218,30 @@ def new_saas_license(license: SaasLicenseCreate, db: Session = Depends(get_db)):
 
 
 @router.get("/charts", response_model=List[ChartOut])
-def charts(db: Session = Depends(get_db)):
-    return get_charts(db)
+async def charts(response: Response, params: ListParams = Depends(), db: AsyncSession = Depends(get_async_db)):
+    return await _list(get_charts, Chart, ChartOut, params, db, response)
 
 
 @router.post("/charts", response_model=ChartOut)
 def new_chart(chart: ChartCreate, db: Session = Depends(get_db)):
-    return create_chart(chart, db)
\ No newline at end of file
+    return create_chart(chart, db)
+
+
+@router.get("/budgets", response_model=List[BudgetOut])
+async def budgets(response: Response, params: ListParams = Depends(), db: AsyncSession = Depends(get_async_db)):
+    return await _list(get_budgets, Budget, BudgetOut, params, db, response)
+
+
+@router.post("/budgets", response_model=BudgetOut)
+def new_budget(budget: BudgetCreate, db: Session = Depends(get_db)):
+    return create_budget(budget, db)
+
+
+@router.get("/budgets/{budget_id}/alerts", response_model=List[BudgetAlertEventOut])
+async def budget_alert_events(
+    budget_id: UUID,
+    tenant_id: UUID,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await get_budget_alert_events(db, tenant_id, budget_id, limit)
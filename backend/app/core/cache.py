@@ -0,0 +1,125 @@
+from collections import OrderedDict
+import json
+import os
+import pickle
+import threading
+import time
+
+CACHE_TTL = float(os.getenv("CACHE_TTL", "300"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# e.g. "redis://cache:6379/0" to share results between API workers; unset keeps them in-process
+CACHE_URL = os.getenv("CACHE_URL")
+
+_MISSING = object()
+
+
+# Backends are awaited from async routes: get, set, clear and count are coroutines.
+
+# In-process LRU with a TTL per entry and a bound on the pickled size of all values.
+class LocalCache:
+    def __init__(self, ttl: float = CACHE_TTL, max_bytes: int = CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            value, size, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                self.size -= size
+                return _MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    async def set(self, key: str, value):
+        size = len(pickle.dumps(value))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[key] = (value, size, time.monotonic() + self.ttl)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted, _) = self._entries.popitem(last=False)
+                self.size -= evicted
+
+    async def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    async def count(self) -> int:
+        return len(self._entries)
+
+
+# Shared between API workers; Redis applies the TTL and its own maxmemory LRU policy.
+class RedisCache:
+    def __init__(self, url: str, ttl: float = CACHE_TTL):
+        # The asyncio client, so a cache round trip never blocks the event loop.
+        import redis.asyncio as redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    async def get(self, key: str):
+        raw = await self.client.get(key)
+        return _MISSING if raw is None else pickle.loads(raw)
+
+    async def set(self, key: str, value):
+        await self.client.set(key, pickle.dumps(value), ex=int(self.ttl))
+
+    async def clear(self):
+        async for key in self.client.scan_iter("nukae:*"):
+            await self.client.delete(key)
+
+    async def count(self) -> int:
+        return sum([1 async for _ in self.client.scan_iter("nukae:*")])
+
+
+class QueryCache:
+    # Keys embed the tenant's data generation, so a finished import makes every
+    # older entry for that tenant unreachable without any explicit purge.
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(namespace: str, tenant_id, generation: int, params: dict = None) -> str:
+        normalized = json.dumps(params or {}, sort_keys=True, default=str)
+        return f"nukae:{namespace}:{tenant_id or '*'}:{generation}:{normalized}"
+
+    async def aget_or_compute(self, namespace: str, tenant_id, generation: int, params: dict, compute):
+        key = self.key(namespace, tenant_id, generation, params)
+        value = await self.backend.get(key)
+        with self._lock:
+            if value is not _MISSING:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if value is not _MISSING:
+            return value
+        value = await compute()
+        await self.backend.set(key, value)
+        return value
+
+    async def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": await self.backend.count(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0
+        }
+
+
+query_cache = QueryCache(RedisCache(CACHE_URL) if CACHE_URL else LocalCache())
@@ -1,14 +1,96 @@
-### app/core/database.py
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 import os
+import time
 
 SQLALCHEMY_DATABASE_URL = os.getenv(
     "DATABASE_URL",
     "postgresql://nukae:secret123@db:5432/nukae_db"
 )
+ASYNC_DATABASE_URL = os.getenv(
+    "ASYNC_DATABASE_URL",
+    SQLALCHEMY_DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
+)
+
+POOL_OPTIONS = {
+    "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+    # Recycle before typical proxy/load balancer idle timeouts drop the socket
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() == "true",
+}
+# The two engines serve different callers and are sized apart. The sync one runs
+# import jobs, which hold a connection each (a dispatcher worker needs at least
+# IMPORT_MAX_WORKERS + 1), and the API's sync routes, which are bounded by the
+# threadpool. The async one serves the API's async routes, where dashboards run
+# their widget groups concurrently.
+SYNC_POOL_OPTIONS = {
+    **POOL_OPTIONS,
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+}
+ASYNC_POOL_OPTIONS = {
+    **POOL_OPTIONS,
+    "pool_size": int(os.getenv("DB_ASYNC_POOL_SIZE", "20")),
+    "max_overflow": int(os.getenv("DB_ASYNC_MAX_OVERFLOW", "10")),
+}
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **SYNC_POOL_OPTIONS)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **ASYNC_POOL_OPTIONS)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+# A session given a deadline (e.g. one import job's) can never work past it:
+# every transaction starts with statement_timeout set to the time left, writers
+# cap each COPY at the time left, and importers call check_deadline between
+# network reads.
+def set_deadline(db_session, seconds: float):
+    db_session.info["deadline"] = time.monotonic() + seconds
+
+
+def time_left(db_session):
+    # Seconds until the session's deadline, or None if it has none
+    deadline = db_session.info.get("deadline")
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def _time_left_ms(db_session):
+    left = time_left(db_session)
+    if left is None:
+        return None
+    # Never 0, which would mean no timeout at all
+    return max(1, int(left * 1000))
+
+
+def check_deadline(db_session):
+    # No SQL: cheap enough to call per page, file or few thousand rows.
+    left = time_left(db_session)
+    if left is not None and left <= 0.001:
+        raise DeadlineExceeded("session deadline passed")
+
+
+def limit_statement_timeout(db_session):
+    # For a statement about to run in an already open transaction, whose
+    # statement_timeout was set when it began.
+    check_deadline(db_session)
+    left = _time_left_ms(db_session)
+    if left is not None:
+        db_session.execute(text("SELECT set_config('statement_timeout', :ms, true)"), {"ms": str(left)})
+
+
+@event.listens_for(Session, "after_begin")
+def _apply_deadline(session, transaction, connection):
+    left = _time_left_ms(session)
+    if left is not None:
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {left}")
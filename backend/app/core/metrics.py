@@ -0,0 +1,195 @@
+from contextvars import ContextVar
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+from sqlalchemy import event
+from starlette.requests import Request
+from starlette.responses import Response
+from app.core.database import engine, async_engine
+import logging
+import os
+import re
+import time
+
+logger = logging.getLogger("nukae.metrics")
+
+# Statements slower than this are logged with their normalized SQL
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_SECONDS", "0.5"))
+# Requests slower than this are logged with their route, tenant and DB totals
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "2"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Request latency by route template",
+    ("method", "route", "status"), buckets=LATENCY_BUCKETS
+)
+REQUEST_DB_STATEMENTS = Histogram(
+    "http_request_db_statements", "SQL statements executed per request",
+    ("route",), buckets=(0, 1, 2, 5, 10, 20, 50, 100, 500)
+)
+REQUEST_DB_SECONDS = Histogram(
+    "http_request_db_seconds", "Time spent in SQL per request", ("route",), buckets=LATENCY_BUCKETS
+)
+DB_STATEMENT_SECONDS = Histogram(
+    "db_statement_duration_seconds", "SQL statement latency", buckets=LATENCY_BUCKETS
+)
+SLOW_QUERIES = Counter("db_slow_queries_total", "Statements slower than SLOW_QUERY_SECONDS")
+
+IMPORT_ROWS = Counter("import_rows_total", "Rows loaded by import jobs", ("provider",))
+IMPORT_BYTES = Counter("import_bytes_total", "Bytes sent to COPY by import jobs", ("provider",))
+IMPORT_SECONDS = Histogram(
+    "import_job_duration_seconds", "Import job duration", ("provider", "status"),
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+)
+IMPORT_JOBS = Counter("import_jobs_total", "Import jobs finished", ("provider", "status"))
+IMPORT_ATTEMPTS = Histogram(
+    "import_job_attempt", "Attempt number import jobs finished on", ("provider", "status"),
+    buckets=(1, 2, 3, 4, 5, 10)
+)
+
+# [statement count, seconds in SQL, route, tenant] for the request being served.
+# A mutable list, so updates made in threadpool copies of the context still land.
+_request_stats = ContextVar("request_stats", default=None)
+
+_LITERALS = (
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)"), "(?, ...)"),
+    (re.compile(r"(?:\(\?, \.\.\.\)\s*,\s*)+\(\?, \.\.\.\)"), "(?, ...), ..."),
+    (re.compile(r"\s+"), " "),
+)
+
+
+def normalize_statement(statement: str, limit: int = 1000) -> str:
+    # Literals and value lists collapse to placeholders so one query shape logs as one line.
+    for pattern, replacement in _LITERALS:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()[:limit]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    DB_STATEMENT_SECONDS.observe(elapsed)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats[0] += 1
+        stats[1] += elapsed
+    if elapsed >= SLOW_QUERY_SECONDS:
+        SLOW_QUERIES.inc()
+        route, tenant = (stats[2], stats[3]) if stats else (None, None)
+        logger.warning("slow query %.3fs route=%s tenant=%s: %s",
+                       elapsed, route, tenant, normalize_statement(statement))
+
+
+def _handle_error(context):
+    started = context.connection.info.get("query_started") if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def instrument_engine(engine):
+    # Async engines expose their events through the underlying sync engine.
+    engine = getattr(engine, "sync_engine", engine)
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+def _route_template(scope) -> str:
+    # The router leaves the matched route in the scope; requests no route
+    # matched (404s) have none.
+    route = scope.get("route")
+    return route.path if route is not None else "unmatched"
+
+
+def _tenant(scope):
+    for part in scope.get("query_string", b"").decode("latin-1").split("&"):
+        if part.startswith("tenant_id="):
+            return part[len("tenant_id="):]
+    return None
+
+
+async def request_tenant(request: Request):
+    # Router dependency: the middleware only sees the query string, so the tenant
+    # of routes taking it in the path or a JSON body (POST /costs...) is recorded
+    # here. FastAPI has already parsed the body, so request.json() is cached.
+    stats = _request_stats.get()
+    if stats is None:
+        return
+    # Routed by now, so slow queries from here on are logged with their route
+    stats[2] = _route_template(request.scope)
+    tenant = request.path_params.get("tenant_id") or request.query_params.get("tenant_id")
+    if tenant is None and request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            body = await request.json()
+        except ValueError:
+            body = None
+        if isinstance(body, dict) and body.get("tenant_id") is not None:
+            tenant = str(body["tenant_id"])
+    if tenant is not None:
+        stats[3] = tenant
+
+
+# Plain ASGI middleware: no per-request task or body buffering, and streaming
+# responses are timed until their last chunk is sent.
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        stats = [0, 0.0, None, _tenant(scope)]
+        token = _request_stats.set(stats)
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_stats.reset(token)
+            # Read once the request has been routed, rather than matching every route up front
+            route = _route_template(scope)
+            REQUEST_SECONDS.labels(scope["method"], route, str(status[0])).observe(elapsed)
+            REQUEST_DB_STATEMENTS.labels(route).observe(stats[0])
+            REQUEST_DB_SECONDS.labels(route).observe(stats[1])
+            if elapsed >= SLOW_REQUEST_SECONDS:
+                logger.warning("slow request %.3fs %s %s tenant=%s status=%s db_statements=%d db_seconds=%.3f",
+                               elapsed, scope["method"], route, stats[3], status[0], stats[0], stats[1])
+
+
+def record_import(provider: str, stats: dict, seconds: float, status: str = "ok", job: dict = None):
+    # job: job_id, integration_id, tenant_id and attempt of the run. Those are too
+    # many label values for Prometheus, so each job gets a log line instead.
+    rows, size = (stats.get("rows", 0), stats.get("bytes", 0)) if stats else (0, 0)
+    IMPORT_ROWS.labels(provider).inc(rows)
+    IMPORT_BYTES.labels(provider).inc(size)
+    IMPORT_SECONDS.labels(provider, status).observe(seconds)
+    IMPORT_JOBS.labels(provider, status).inc()
+    if job:
+        IMPORT_ATTEMPTS.labels(provider, status).observe(job.get("attempt") or 1)
+        logger.info("import job=%s integration=%s tenant=%s provider=%s attempt=%s status=%s "
+                    "seconds=%.3f rows=%d bytes=%d",
+                    job.get("job_id"), job.get("integration_id"), job.get("tenant_id"), provider,
+                    job.get("attempt"), status, seconds, rows, size)
+
+
+def metrics_endpoint(request: Request):
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+def add_metrics(app):
+    instrument_engine(engine)
+    instrument_engine(async_engine)
+    app.add_middleware(MetricsMiddleware)
+    # An API route, so it is labelled by its path like every other route
+    app.add_api_route("/metrics", metrics_endpoint, include_in_schema=False)
@@ -0,0 +1,191 @@
+from datetime import date
+from functools import lru_cache
+from urllib.parse import urlparse
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+import io
+import json
+import os
+import uuid
+
+# Where original provider rows are archived as Parquet, e.g.
+# file:///var/lib/nukae/raw-archive or s3://bucket/prefix. Empty (the default)
+# keeps the old behaviour of storing each row as JSON in cloud_usage_raw.raw_data;
+# docker-compose.yml turns archiving on for the dev stack, on its own volume.
+RAW_ARCHIVE_URL = os.getenv("RAW_ARCHIVE_URL", "")
+# Rows per Parquet row group; rehydrating one row reads only its group
+ROW_GROUP_ROWS = int(os.getenv("RAW_ARCHIVE_ROW_GROUP_ROWS", "10000"))
+COMPRESSION = os.getenv("RAW_ARCHIVE_COMPRESSION", "zstd")
+
+
+class LocalStore:
+    def __init__(self, root: str):
+        self.root = root
+
+    def put(self, key: str, data: bytes):
+        # Written under a temporary name and renamed, so a reader never sees half a file.
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def open(self, key: str):
+        return open(os.path.join(self.root, key), 'rb')
+
+    def delete(self, key: str):
+        try:
+            os.remove(os.path.join(self.root, key))
+        except FileNotFoundError:
+            pass
+
+
+class S3Store:
+    def __init__(self, bucket: str, prefix: str = ''):
+        import boto3
+        self.client = boto3.client('s3', endpoint_url=os.getenv("RAW_ARCHIVE_S3_ENDPOINT") or None)
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def put(self, key: str, data: bytes):
+        self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=data)
+
+    def open(self, key: str):
+        # Batch files are a few MB, so they are fetched whole.
+        body = self.client.get_object(Bucket=self.bucket, Key=self._key(key))['Body']
+        return io.BytesIO(body.read())
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+
+@lru_cache(maxsize=None)
+def get_store(url: str = RAW_ARCHIVE_URL):
+    # None when archiving is off.
+    if not url:
+        return None
+    parsed = urlparse(url)
+    if parsed.scheme == 's3':
+        return S3Store(parsed.netloc, parsed.path)
+    if parsed.scheme in ('', 'file'):
+        return LocalStore(parsed.path if parsed.scheme else url)
+    raise ValueError(f"Unsupported RAW_ARCHIVE_URL scheme: {parsed.scheme}")
+
+
+def _text(value):
+    # Every column is archived as text: provider rows are heterogeneous and
+    # mostly text already (CUR is CSV), and dictionary encoding does the rest.
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value, default=str)
+
+
+# Collects the raw rows of one COPY batch and writes them as one Parquet file.
+# add() returns the (file, row group, offset) pointer stored on the typed row.
+class RawArchiveBatch:
+    def __init__(self, store, tenant_id, provider: str):
+        self.store = store
+        self.prefix = f"{tenant_id}/{provider}"
+        self.bytes = 0
+        self.files = 0
+        self._start()
+
+    def _start(self):
+        self.key = f"{self.prefix}/{date.today():%Y/%m/%d}/{uuid.uuid4().hex}.parquet"
+        self._rows = []
+
+    def add(self, raw: dict):
+        offset = len(self._rows)
+        self._rows.append(raw or {})
+        return self.key, offset // ROW_GROUP_ROWS, offset % ROW_GROUP_ROWS
+
+    def write(self):
+        # Called before the batch's COPY, so a committed row never points at a
+        # missing file. Returns the key written, or None for an empty batch.
+        if not self._rows:
+            return None
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        names = list(dict.fromkeys(name for row in self._rows for name in row))
+        table = pa.table({
+            name: pa.array([_text(row.get(name)) for row in self._rows], type=pa.string()) for name in names
+        })
+        sink = io.BytesIO()
+        pq.write_table(table, sink, compression=COMPRESSION, row_group_size=ROW_GROUP_ROWS)
+        self.store.put(self.key, sink.getvalue())
+        self.bytes += sink.tell()
+        self.files += 1
+        key = self.key
+        self._start()
+        return key
+
+
+def read_rows(pointers, store=None) -> dict:
+    # pointers: iterable of (file, row_group, offset). Each file's row groups are
+    # read once however many rows they serve. Returns {pointer: raw row dict}.
+    import pyarrow.parquet as pq
+    store = store or get_store()
+    groups = {}
+    for pointer in pointers:
+        groups.setdefault(pointer[0], {}).setdefault(pointer[1], []).append(pointer)
+    rows = {}
+    for key, by_group in groups.items():
+        with store.open(key) as f:
+            parquet = pq.ParquetFile(f)
+            for group, wanted in by_group.items():
+                records = parquet.read_row_group(group).to_pylist()
+                for pointer in wanted:
+                    rows[pointer] = {k: v for k, v in records[pointer[2]].items() if v is not None}
+    return rows
+
+
+# Session.info keys of the files to delete once the session's transaction
+# commits, and of the files written for rows the transaction has not committed
+_PENDING_DELETES = 'raw_archive_deletes'
+_UNCOMMITTED = 'raw_archive_written'
+
+
+def track_written(db_session, key):
+    # A file written for rows that are then rolled back is referenced by nothing,
+    # so it is deleted with the rollback.
+    if key:
+        db_session.info.setdefault(_UNCOMMITTED, set()).add(key)
+
+
+def delete_unreferenced(db_session, keys):
+    # Called after deleting rows that pointed at `keys`. A file holds a whole COPY
+    # batch, which can span more days than were deleted, so only files no
+    # remaining row points at are removed, and only once the delete commits.
+    keys = {key for key in keys if key}
+    if not keys:
+        return
+    referenced = db_session.execute(
+        text("SELECT DISTINCT raw_file FROM cloud_usage_raw WHERE raw_file = ANY(:keys)"), {'keys': list(keys)}
+    ).scalars()
+    db_session.info.setdefault(_PENDING_DELETES, set()).update(keys.difference(referenced))
+
+
+def _delete_files(keys):
+    store = get_store() if keys else None
+    for key in keys or ():
+        # A file left behind only costs storage, so a failed delete is not an error.
+        try:
+            store.delete(key)
+        except Exception as e:
+            print(f"[⚠️] Could not delete raw archive file {key}: {e}")
+
+
+@event.listens_for(Session, "after_commit")
+def _delete_pending(session):
+    session.info.pop(_UNCOMMITTED, None)
+    _delete_files(session.info.pop(_PENDING_DELETES, None))
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_pending(session, previous_transaction):
+    session.info.pop(_PENDING_DELETES, None)
+    _delete_files(session.info.pop(_UNCOMMITTED, None))
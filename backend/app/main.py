@@ -1,14 +1,15 @@
 ### app/main.py
 from fastapi import FastAPI
 from app.core.config import add_cors
+from app.core.metrics import add_metrics
 from app.api.routes import router
-from app.core.database import engine, Base
 
 app = FastAPI()
 
 add_cors(app)
+add_metrics(app)
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+# The schema is owned by db/init.sql (scripts/create_schema.py for databases
+# created without it); nothing touches the database at import time.
 
 app.include_router(router, prefix="/api")
\ No newline at end of file
@@ -1,6 +1,6 @@
 ### app/models/models.py
-from sqlalchemy import Column, String, Date, DateTime, Numeric, ForeignKey, JSON
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, String, Date, DateTime, Numeric, ForeignKey, JSON, BigInteger, Integer
+from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.sql import func
 import uuid
 from app.core.database import Base
@@ -9,6 +9,7 @@ class Tenant(Base):
     __tablename__ = "tenants"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     name = Column(String, nullable=False)
+    data_generation = Column(BigInteger, nullable=False, default=0)
     created_at = Column(DateTime, default=func.now())
 
 
@@ -36,18 +37,34 @@ class CloudResource(Base):
     created_at = Column(DateTime, default=func.now())
 
 
+class Integration(Base):
+    __tablename__ = "integrations"
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id", ondelete="CASCADE"))
+    provider = Column(String, nullable=False)
+    type = Column(String, nullable=False)
+    config = Column(JSON, nullable=False)
+    watermark = Column(JSON, nullable=False, default=dict)
+    load_generation = Column(Integer, nullable=False, default=0)
+    load_generation_started = Column(Integer, nullable=False, default=0)
+    connected_at = Column(DateTime, default=func.now())
+    last_imported_at = Column(DateTime)
+
+
 class CloudUsageRaw(Base):
     __tablename__ = "cloud_usage_raw"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id", ondelete="CASCADE"))
+    tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id", ondelete="CASCADE"), primary_key=True)
+    integration_id = Column(UUID(as_uuid=True), ForeignKey("integrations.id", ondelete="CASCADE"))
     provider = Column(String, nullable=False)
-    usage_date = Column(Date, nullable=False)
+    usage_date = Column(Date, primary_key=True)
     billing_period_start = Column(Date)
     billing_period_end = Column(Date)
     account_id = Column(UUID(as_uuid=True), ForeignKey("cloud_accounts.id"))
     service = Column(String)
     resource_id = Column(String)
     resource_type = Column(String)
+    product_family = Column(String)
     usage_type = Column(String)
     operation = Column(String)
     usage_quantity = Column(Numeric)
@@ -55,8 +72,12 @@ class CloudUsageRaw(Base):
     cost = Column(Numeric)
     amortized_cost = Column(Numeric)
     currency = Column(String, default='USD')
-    tags = Column(JSON)
+    tags = Column(JSONB)
     raw_data = Column(JSON)
+    raw_file = Column(String)
+    raw_row_group = Column(Integer)
+    raw_offset = Column(Integer)
+    load_generation = Column(Integer, nullable=False, default=0)
     imported_at = Column(DateTime, default=func.now())
 
 
@@ -96,10 +117,11 @@ class Dashboard(Base):
 class FocusCost(Base):
     __tablename__ = "finops_focus_cost_data"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id", ondelete="CASCADE"))
+    tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id", ondelete="CASCADE"), primary_key=True)
+    integration_id = Column(UUID(as_uuid=True), ForeignKey("integrations.id", ondelete="CASCADE"))
     provider = Column(String, nullable=False)
     account_id = Column(UUID(as_uuid=True), ForeignKey("cloud_accounts.id"))
-    cost_date = Column(Date, nullable=False)
+    cost_date = Column(Date, primary_key=True)
     service = Column(String)
     resource_id = Column(String)
     environment = Column(String)
@@ -109,10 +131,75 @@ class FocusCost(Base):
     quantity = Column(Numeric)
     cost = Column(Numeric)
     currency = Column(String, default='USD')
-    tags = Column(JSON)
+    tags = Column(JSONB)
     generated_at = Column(DateTime, default=func.now())
 
 
+class CostDailyRollup(Base):
+    __tablename__ = "cost_daily_rollup"
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id", ondelete="CASCADE"))
+    provider = Column(String, nullable=False)
+    account_id = Column(UUID(as_uuid=True), ForeignKey("cloud_accounts.id"))
+    service = Column(String)
+    cost_date = Column(Date, nullable=False)
+    cost = Column(Numeric, nullable=False)
+    row_count = Column(BigInteger, nullable=False)
+
+
+class CostTagRollup(Base):
+    __tablename__ = "cost_tag_rollup"
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id", ondelete="CASCADE"))
+    tag_key = Column(String, nullable=False)
+    tag_value = Column(String, nullable=False)
+    provider = Column(String, nullable=False)
+    account_id = Column(UUID(as_uuid=True), ForeignKey("cloud_accounts.id"))
+    service = Column(String)
+    cost_date = Column(Date, nullable=False)
+    cost = Column(Numeric, nullable=False)
+    row_count = Column(BigInteger, nullable=False)
+
+
+class TagKey(Base):
+    __tablename__ = "tag_keys"
+    tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id", ondelete="CASCADE"), primary_key=True)
+    tag_key = Column(String, primary_key=True)
+    value_count = Column(Integer, nullable=False)
+    first_seen = Column(Date)
+    last_seen = Column(Date)
+
+
+class NormalizationQueue(Base):
+    __tablename__ = "normalization_queue"
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id", ondelete="CASCADE"))
+    integration_id = Column(UUID(as_uuid=True), ForeignKey("integrations.id", ondelete="CASCADE"))
+    start_date = Column(Date, nullable=False)
+    end_date = Column(Date, nullable=False)
+    queued_at = Column(DateTime, default=func.now())
+
+
+class ImportJob(Base):
+    __tablename__ = "import_jobs"
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id", ondelete="CASCADE"))
+    integration_id = Column(UUID(as_uuid=True), ForeignKey("integrations.id", ondelete="CASCADE"))
+    provider = Column(String, nullable=False)
+    priority = Column(Integer, nullable=False, default=0)
+    status = Column(String, nullable=False, default="queued")
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    run_after = Column(DateTime, nullable=False, default=func.now())
+    leased_by = Column(String)
+    lease_expires_at = Column(DateTime)
+    last_error = Column(String)
+    stats = Column(JSONB)
+    created_at = Column(DateTime, default=func.now())
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+
 class KubernetesCluster(Base):
     __tablename__ = "kubernetes_clusters"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -140,6 +227,60 @@ class KubernetesUsage(Base):
     created_at = Column(DateTime, default=func.now())
 
 
+class KubernetesCostAllocation(Base):
+    __tablename__ = "kubernetes_cost_allocation"
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id", ondelete="CASCADE"))
+    cluster_id = Column(UUID(as_uuid=True), ForeignKey("kubernetes_clusters.id", ondelete="CASCADE"))
+    provider = Column(String, nullable=False)
+    cost_date = Column(Date, nullable=False)
+    namespace = Column(String, nullable=False)
+    workload = Column(String)
+    cpu_cost = Column(Numeric, nullable=False)
+    memory_cost = Column(Numeric, nullable=False)
+    cost = Column(Numeric, nullable=False)
+    generated_at = Column(DateTime, default=func.now())
+
+
+class CostAnomaly(Base):
+    __tablename__ = "cost_anomalies"
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id", ondelete="CASCADE"))
+    provider = Column(String, nullable=False)
+    account_id = Column(UUID(as_uuid=True), ForeignKey("cloud_accounts.id"))
+    service = Column(String)
+    cost_date = Column(Date, nullable=False)
+    actual_cost = Column(Numeric, nullable=False)
+    expected_cost = Column(Numeric, nullable=False)
+    z_score = Column(Numeric, nullable=False)
+    detected_at = Column(DateTime, default=func.now())
+
+
+class SavingsRecommendation(Base):
+    __tablename__ = "savings_recommendations"
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id", ondelete="CASCADE"))
+    provider = Column(String)
+    resource_id = Column(String, nullable=False)
+    service = Column(String)
+    kind = Column(String, nullable=False)
+    cpu_p95 = Column(Numeric)
+    memory_p95 = Column(Numeric)
+    samples = Column(BigInteger)
+    monthly_cost = Column(Numeric, nullable=False)
+    estimated_monthly_savings = Column(Numeric, nullable=False)
+    details = Column(JSONB)
+    generated_at = Column(DateTime, default=func.now())
+
+
+class SavingsSummary(Base):
+    __tablename__ = "savings_summary"
+    tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id", ondelete="CASCADE"), primary_key=True)
+    estimated_monthly_savings = Column(Numeric, nullable=False)
+    recommendation_count = Column(BigInteger, nullable=False)
+    generated_at = Column(DateTime, default=func.now())
+
+
 class SoftwareProduct(Base):
     __tablename__ = "software_products"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -170,6 +311,9 @@ class Budget(Base):
     start_date = Column(Date, nullable=False)
     end_date = Column(Date, nullable=False)
     amount = Column(Numeric, nullable=False)
+    actual_spend = Column(Numeric)
+    forecast_spend = Column(Numeric)
+    evaluated_at = Column(DateTime)
     created_at = Column(DateTime, default=func.now())
 
 
@@ -190,9 +334,22 @@ class BudgetAlert(Base):
     budget_id = Column(UUID(as_uuid=True), ForeignKey("budgets.id", ondelete="CASCADE"))
     threshold_percent = Column(Numeric, nullable=False)
     alert_type = Column(String, nullable=False)
+    triggered_at = Column(DateTime)
     created_at = Column(DateTime, default=func.now())
 
 
+class BudgetAlertEvent(Base):
+    __tablename__ = "budget_alert_events"
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    alert_id = Column(UUID(as_uuid=True), ForeignKey("budget_alerts.id", ondelete="CASCADE"))
+    budget_id = Column(UUID(as_uuid=True), ForeignKey("budgets.id", ondelete="CASCADE"))
+    alert_type = Column(String, nullable=False)
+    threshold_percent = Column(Numeric, nullable=False)
+    spend_percent = Column(Numeric)
+    spend = Column(Numeric)
+    fired_at = Column(DateTime, default=func.now())
+
+
 class DashFolder(Base):
     __tablename__ = "dash_folders"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
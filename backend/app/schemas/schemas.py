@@ -1,8 +1,8 @@
 ### app/schemas/schemas.py
-from pydantic import BaseModel
-from typing import Optional, List, Dict
+from pydantic import BaseModel, Field
+from typing import Optional, List, Dict, Literal
 from uuid import UUID
-from datetime import date
+from datetime import date, datetime
 
 class UserLogin(BaseModel):
     username: str
@@ -31,7 +31,7 @@ class CloudAccountOut(BaseModel):
     provider: str
     account_identifier: str
     name: Optional[str]
-    created_at: Optional[str]
+    created_at: Optional[datetime]
 
     class Config:
         orm_mode = True
@@ -50,7 +50,7 @@ class DashboardOut(BaseModel):
     folder_id: Optional[UUID]
     description: Optional[str]
     config: dict
-    created_at: Optional[str]
+    created_at: Optional[datetime]
     class Config:
         orm_mode = True
 
@@ -60,13 +60,54 @@ class CostFilterParams(BaseModel):
     account_id: Optional[UUID] = None
     start_date: Optional[date] = None
     end_date: Optional[date] = None
-    group_by: Optional[str] = None
+    group_by: Optional[str] = None  # a FOCUS column or "tag:<key>"
+    tags: Dict[str, str] = {}
 
 class CostGroupResult(BaseModel):
     group: str
     total_cost: float
 
 
+class CostQuery(BaseModel):
+    tenant_id: UUID
+    provider: Optional[str] = None
+    account_id: Optional[UUID] = None
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    tags: Dict[str, str] = {}
+    dimensions: List[str] = []
+    granularity: Optional[Literal["day", "week", "month"]] = None
+    top_n: Optional[int] = Field(None, ge=1, le=1000)
+    sort: Literal["cost_desc", "cost_asc", "dimension"] = "cost_desc"
+
+
+class CostQueryResult(BaseModel):
+    columns: List[str]
+    data: Dict[str, list]
+
+
+class TagKeyOut(BaseModel):
+    tag_key: str
+    value_count: int
+    first_seen: Optional[date]
+    last_seen: Optional[date]
+
+    class Config:
+        orm_mode = True
+
+
+class BudgetItemCreate(BaseModel):
+    provider: Optional[str] = None
+    service: Optional[str] = None
+    product_id: Optional[UUID] = None
+    target_amount: Optional[float] = None
+
+
+class BudgetAlertCreate(BaseModel):
+    threshold_percent: float = Field(gt=0)
+    alert_type: Literal["actual", "forecast"] = "actual"
+
+
 class BudgetCreate(BaseModel):
     tenant_id: UUID
     name: str
@@ -74,6 +115,8 @@ class BudgetCreate(BaseModel):
     start_date: date
     end_date: date
     amount: float
+    items: List[BudgetItemCreate] = []
+    alerts: List[BudgetAlertCreate] = []
 
 
 class BudgetOut(BaseModel):
@@ -84,12 +127,78 @@ class BudgetOut(BaseModel):
     start_date: date
     end_date: date
     amount: float
-    created_at: Optional[str]
+    actual_spend: Optional[float] = None
+    forecast_spend: Optional[float] = None
+    evaluated_at: Optional[datetime] = None
+    created_at: Optional[datetime]
 
     class Config:
         orm_mode = True
 
 
+class BudgetAlertEventOut(BaseModel):
+    id: int
+    alert_id: UUID
+    budget_id: UUID
+    alert_type: str
+    threshold_percent: float
+    spend_percent: Optional[float]
+    spend: Optional[float]
+    fired_at: datetime
+
+    class Config:
+        orm_mode = True
+
+
+class CostAnomalyOut(BaseModel):
+    id: int
+    tenant_id: UUID
+    provider: str
+    account_id: Optional[UUID]
+    service: Optional[str]
+    cost_date: date
+    actual_cost: float
+    expected_cost: float
+    z_score: float
+    detected_at: Optional[datetime]
+
+    class Config:
+        orm_mode = True
+
+
+class SavingsRecommendationOut(BaseModel):
+    id: int
+    provider: Optional[str]
+    resource_id: str
+    service: Optional[str]
+    kind: str
+    cpu_p95: Optional[float]
+    memory_p95: Optional[float]
+    monthly_cost: float
+    estimated_monthly_savings: float
+    details: Optional[Dict]
+    generated_at: Optional[datetime]
+
+    class Config:
+        orm_mode = True
+
+
+class RawUsageOut(BaseModel):
+    id: UUID
+    integration_id: Optional[UUID]
+    provider: str
+    usage_date: date
+    service: Optional[str]
+    resource_id: Optional[str]
+    usage_type: Optional[str]
+    usage_quantity: Optional[float]
+    usage_unit: Optional[str]
+    cost: Optional[float]
+    currency: Optional[str]
+    tags: Optional[Dict]
+    raw_data: Optional[Dict]
+
+
 class FolderCreate(BaseModel):
     tenant_id: UUID
     name: str
@@ -99,7 +208,7 @@ class FolderOut(BaseModel):
     id: UUID
     tenant_id: UUID
     name: str
-    created_at: Optional[str]
+    created_at: Optional[datetime]
 
     class Config:
         orm_mode = True
@@ -128,7 +237,7 @@ class SaasLicenseOut(BaseModel):
     renewal_date: Optional[date]
     status: Optional[str]
     category: Optional[str]
-    created_at: Optional[str]
+    created_at: Optional[datetime]
 
     class Config:
         orm_mode = True
@@ -149,7 +258,7 @@ class ChartOut(BaseModel):
     chart_type: str
     fields: List[str]
     folder_id: Optional[UUID]
-    created_at: Optional[str]
+    created_at: Optional[datetime]
 
     class Config:
         orm_mode = True
\ No newline at end of file
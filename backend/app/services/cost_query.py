@@ -0,0 +1,153 @@
+from fastapi import HTTPException
+from sqlalchemy import Date, String, and_, case, cast, func, literal, literal_column, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.models import FocusCost, CostDailyRollup, CostTagRollup, KubernetesCostAllocation
+from app.schemas.schemas import CostQuery
+
+# Columns a query may group by, besides "tag:<key>"; anything else is rejected before it reaches SQL
+DIMENSIONS = (
+    "provider", "account_id", "service", "resource_id", "environment",
+    "product_family", "usage_type", "unit", "currency"
+)
+# Dimensions the daily rollup keeps; queries limited to these skip the fact table
+ROLLUP_DIMENSIONS = {"provider", "account_id", "service"}
+# Kubernetes allocation dimensions; queries using one read kubernetes_cost_allocation
+K8S_DIMENSIONS = {"cluster_id", "namespace", "workload"}
+TAG_PREFIX = "tag:"
+
+OTHER = "Other"
+UNTAGGED = "(untagged)"
+
+
+def _tag_source(key: str, value=None):
+    # Tag totals come from cost_tag_rollup. Untagged cost is the daily total minus
+    # what carries the key, produced in the same scan by adding the rollup rows
+    # and subtracting the tagged ones.
+    label = f"{TAG_PREFIX}{key}"
+    common = (CostTagRollup.tenant_id, CostTagRollup.provider, CostTagRollup.account_id,
+              CostTagRollup.service, CostTagRollup.cost_date)
+    tagged = select(*common, CostTagRollup.tag_value.label(label), CostTagRollup.cost).where(
+        CostTagRollup.tag_key == key
+    )
+    if value is not None:
+        return tagged.where(CostTagRollup.tag_value == value).subquery("source")
+    totals = select(
+        CostDailyRollup.tenant_id, CostDailyRollup.provider, CostDailyRollup.account_id,
+        CostDailyRollup.service, CostDailyRollup.cost_date, literal(UNTAGGED).label(label), CostDailyRollup.cost
+    )
+    subtracted = select(*common, literal(UNTAGGED).label(label), (-CostTagRollup.cost).label("cost")).where(
+        CostTagRollup.tag_key == key
+    )
+    return union_all(tagged, totals, subtracted).subquery("source")
+
+
+def _source(dimensions, tags: dict):
+    if K8S_DIMENSIONS & set(dimensions):
+        other = [d for d in dimensions if d not in K8S_DIMENSIONS and d != "provider"]
+        if other or tags:
+            raise HTTPException(
+                status_code=400,
+                detail="Kubernetes dimensions combine only with provider and cluster_id/namespace/workload"
+            )
+        return KubernetesCostAllocation.__table__, {}
+    tag_keys = [d[len(TAG_PREFIX):] for d in dimensions if d.startswith(TAG_PREFIX)]
+    plain = {d for d in dimensions if not d.startswith(TAG_PREFIX)}
+    if not plain <= ROLLUP_DIMENSIONS:
+        return FocusCost.__table__, tags
+    if not tag_keys and not tags:
+        return CostDailyRollup.__table__, {}
+    if len(tag_keys) == 1 and set(tags) <= set(tag_keys):
+        return _tag_source(tag_keys[0], tags.get(tag_keys[0])), {}
+    return FocusCost.__table__, tags
+
+
+def _dimension(source, name: str):
+    # Dimensions come back as text so the "Other" bucket shares a type with real values.
+    if name in source.c:
+        return cast(source.c[name], String)
+    return func.coalesce(source.c.tags[name[len(TAG_PREFIX):]].astext, UNTAGGED)
+
+
+def compile_cost_query(query: CostQuery):
+    unknown = [
+        d for d in query.dimensions
+        if d not in DIMENSIONS and d not in K8S_DIMENSIONS and not d.startswith(TAG_PREFIX)
+    ]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown dimensions: {', '.join(unknown)}")
+    dimensions = list(dict.fromkeys(query.dimensions))
+
+    source, tag_filters = _source(dimensions, query.tags)
+    keys = []
+    if query.granularity:
+        keys.append(cast(func.date_trunc(query.granularity, source.c.cost_date), Date).label("period"))
+    keys.extend(_dimension(source, d).label(d) for d in dimensions)
+
+    conditions = [source.c.tenant_id == query.tenant_id]
+    if query.provider:
+        conditions.append(source.c.provider == query.provider)
+    if query.account_id:
+        if "account_id" not in source.c:
+            raise HTTPException(status_code=400, detail="account_id cannot filter Kubernetes allocations")
+        conditions.append(source.c.account_id == query.account_id)
+    if query.start_date:
+        conditions.append(source.c.cost_date >= query.start_date)
+    if query.end_date:
+        conditions.append(source.c.cost_date <= query.end_date)
+    if tag_filters:
+        # tags @> '{...}' is answered by the GIN index on finops_focus_cost_data.tags
+        conditions.append(source.c.tags.contains(tag_filters))
+
+    base = select(*keys, func.sum(source.c.cost).label("cost")).where(*conditions)
+    if keys:
+        # By position: expressions with bound parameters (granularity, tag keys) would
+        # not match their select-list copies textually.
+        base = base.group_by(*(literal_column(str(i + 1)) for i in range(len(keys))))
+    base = base.cte("base")
+
+    period = [base.c.period] if query.granularity else []
+    if query.top_n and dimensions:
+        # Rank dimension combinations by their total over the whole range, then
+        # fold everything past top_n into a single "Other" series.
+        ranked = (
+            select(
+                *(base.c[d] for d in dimensions),
+                func.row_number().over(order_by=func.sum(base.c.cost).desc()).label("rank")
+            )
+            .group_by(*(base.c[d] for d in dimensions))
+            .cte("ranked")
+        )
+        top_n, other = literal_column(str(query.top_n)), literal_column(f"'{OTHER}'")
+        labels = [case((ranked.c.rank <= top_n, base.c[d]), else_=other).label(d) for d in dimensions]
+        joined = base.join(ranked, and_(*(base.c[d].is_not_distinct_from(ranked.c[d]) for d in dimensions)))
+        statement = (
+            select(*period, *labels, func.sum(base.c.cost).label("cost"))
+            .select_from(joined)
+            .group_by(*period, *labels)
+        )
+        columns = period + labels
+    else:
+        columns = period + [base.c[d] for d in dimensions]
+        statement = select(*columns, base.c.cost)
+
+    order = [columns[0]] if query.granularity else []
+    if query.sort == "dimension":
+        order.extend(columns[len(order):])
+    elif query.sort == "cost_asc":
+        order.append(func.sum(base.c.cost).asc() if query.top_n and dimensions else base.c.cost.asc())
+    else:
+        order.append(func.sum(base.c.cost).desc() if query.top_n and dimensions else base.c.cost.desc())
+    return statement.order_by(*order), [c.name for c in columns] + ["cost"]
+
+
+async def run_cost_query(query: CostQuery, db: AsyncSession) -> dict:
+    statement, columns = compile_cost_query(query)
+    rows = (await db.execute(statement)).all()
+    data = {name: [] for name in columns}
+    for row in rows:
+        for name, value in zip(columns, row):
+            data[name].append(value)
+    if "period" in data:
+        data["period"] = [p.isoformat() for p in data["period"]]
+    data["cost"] = [float(c or 0) for c in data["cost"]]
+    return {"columns": columns, "data": data}
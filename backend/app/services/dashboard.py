@@ -2,20 +2,35 @@
 ### app/services/dashboard.py
 from fastapi import HTTPException, Depends
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from app.core.database import SessionLocal
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, or_, select
+from app.core.database import SessionLocal, AsyncSessionLocal
+from app.core.cache import query_cache
+from app.core.raw_archive import read_rows
+from app.services.cost_query import run_cost_query
+from app.services.budget_engine import evaluate_budgets
+from app.services.dashboard_data import load_widget_specs, evaluate_widgets
 from app.schemas.schemas import (
     UserLogin, TenantCreate, DashboardCreate, CostFilterParams,
-    FolderCreate, SaasLicenseCreate, ChartCreate
+    FolderCreate, SaasLicenseCreate, ChartCreate, CostQuery, BudgetCreate
 )
 from app.models.models import (
-    Tenant, Dashboard, FocusCost, DashFolder,
-    SaasLicense, Chart
+    Tenant, Dashboard, DashFolder,
+    SaasLicense, Chart, CostDailyRollup, CostTagRollup, TagKey,
+    Budget, BudgetItem, BudgetAlert, BudgetAlertEvent, CostAnomaly,
+    SavingsRecommendation, SavingsSummary, CloudUsageRaw, Integration
 )
 from typing import List
+import asyncio
+import base64
+import uuid
 
 users = {"admin": "admin"}
 
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 1000
+
 def get_db():
     db = SessionLocal()
     try:
@@ -23,6 +38,45 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def encode_cursor(last_id) -> str:
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    try:
+        return uuid.UUID(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _list_query(model, tenant_id=None, cursor=None):
+    # Keyset on the primary key: each page is an index range scan, however deep.
+    query = select(model).order_by(model.id)
+    if tenant_id:
+        query = query.where((model.id if model is Tenant else model.tenant_id) == tenant_id)
+    if cursor:
+        query = query.where(model.id > decode_cursor(cursor))
+    return query
+
+
+async def list_page(db: AsyncSession, model, tenant_id=None, cursor=None, limit: int = DEFAULT_PAGE_SIZE):
+    rows = (await db.scalars(_list_query(model, tenant_id, cursor).limit(limit + 1))).all()
+    next_cursor = encode_cursor(rows[limit - 1].id) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+async def stream_ndjson(model, schema, tenant_id=None, cursor=None):
+    # Runs after the request's own session is gone, so it opens one for the
+    # lifetime of the stream; asyncpg fetches from a server-side cursor.
+    async with AsyncSessionLocal() as db:
+        query = _list_query(model, tenant_id, cursor).execution_options(yield_per=STREAM_BATCH_SIZE)
+        async for row in await db.stream_scalars(query):
+            yield schema.model_validate(row, from_attributes=True).model_dump_json() + "\n"
+
 def login_user(user: UserLogin):
     if users.get(user.username) == user.password:
         return {"message": "Login successful"}
@@ -35,8 +89,8 @@ def create_tenant(tenant: TenantCreate, db: Session):
     db.refresh(db_tenant)
     return db_tenant
 
-def get_tenants(db: Session):
-    return db.query(Tenant).all()
+async def get_tenants(db: AsyncSession, tenant_id=None, cursor=None, limit: int = DEFAULT_PAGE_SIZE):
+    return await list_page(db, Tenant, tenant_id, cursor, limit)
 
 def create_dashboard(dashboard: DashboardCreate, db: Session):
     db_dashboard = Dashboard(**dashboard.dict())
@@ -45,22 +99,37 @@ def create_dashboard(dashboard: DashboardCreate, db: Session):
     db.refresh(db_dashboard)
     return db_dashboard
 
-def get_dashboards(db: Session):
-    return db.query(Dashboard).all()
+async def get_dashboards(db: AsyncSession, tenant_id=None, cursor=None, limit: int = DEFAULT_PAGE_SIZE):
+    return await list_page(db, Dashboard, tenant_id, cursor, limit)
 
-def get_costs_by_group(filter: CostFilterParams, db: Session):
-    query = db.query(
-        getattr(FocusCost, filter.group_by).label("group"),
-        func.sum(FocusCost.cost).label("total_cost")
-    ).filter(FocusCost.tenant_id == filter.tenant_id)
+async def data_generation(db: AsyncSession, tenant_id=None):
+    query = select(func.coalesce(func.sum(Tenant.data_generation), 0))
+    if tenant_id:
+        query = query.where(Tenant.id == tenant_id)
+    return await db.scalar(query)
 
-    if filter.provider:
-        query = query.filter(FocusCost.provider == filter.provider)
-    if filter.start_date and filter.end_date:
-        query = query.filter(FocusCost.cost_date.between(filter.start_date, filter.end_date))
 
-    query = query.group_by(getattr(FocusCost, filter.group_by))
-    return query.all()
+async def get_cost_query(query: CostQuery, db: AsyncSession):
+    return await query_cache.aget_or_compute(
+        "cost_query", query.tenant_id, await data_generation(db, query.tenant_id),
+        query.dict(), lambda: run_cost_query(query, db)
+    )
+
+
+async def get_costs_by_group(filter: CostFilterParams, db: AsyncSession):
+    # Single-column grouping kept for existing clients; cost_date maps to a daily series.
+    params = filter.dict(exclude={"group_by"})
+    if filter.group_by == "cost_date":
+        query = CostQuery(**params, granularity="day", sort="dimension")
+    else:
+        query = CostQuery(**params, dimensions=[filter.group_by] if filter.group_by else [])
+    data = (await get_cost_query(query, db))["data"]
+    key = "period" if query.granularity else filter.group_by
+    groups = data[key] if key else ["All"] * len(data["cost"])
+    return [
+        {"group": group if group is not None else "Unknown", "total_cost": cost}
+        for group, cost in zip(groups, data["cost"])
+    ]
 
 
 def create_folder(folder: FolderCreate, db: Session):
@@ -71,19 +140,19 @@ def create_folder(folder: FolderCreate, db: Session):
     return db_folder
 
 
-def get_folders(db: Session):
-    return db.query(DashFolder).all()
+async def get_folders(db: AsyncSession, tenant_id=None, cursor=None, limit: int = DEFAULT_PAGE_SIZE):
+    return await list_page(db, DashFolder, tenant_id, cursor, limit)
 
 
-def get_folders_and_dashboards(db: Session):
+async def get_folders_and_dashboards(db: AsyncSession, tenant_id):
     folders = {str(f.id): {
         "id": str(f.id),
         "name": f.name,
         "type": "folder",
         "icon": "lucide:folder",
         "children": []
-    } for f in db.query(DashFolder).all()}
-    dashboards = db.query(Dashboard).all()
+    } for f in (await db.scalars(_list_query(DashFolder, tenant_id))).all()}
+    dashboards = (await db.scalars(_list_query(Dashboard, tenant_id))).all()
     result = []
     for d in dashboards:
         item = {
@@ -103,13 +172,109 @@ def get_folders_and_dashboards(db: Session):
 def create_saas_license(license: SaasLicenseCreate, db: Session):
     db_license = SaasLicense(**license.dict())
     db.add(db_license)
+    # The dashboard summary lists licenses, so retire its cached copy too.
+    db.query(Tenant).filter(Tenant.id == license.tenant_id).update(
+        {Tenant.data_generation: Tenant.data_generation + 1}
+    )
     db.commit()
     db.refresh(db_license)
     return db_license
 
 
-def get_saas_licenses(db: Session):
-    return db.query(SaasLicense).all()
+async def get_saas_licenses(db: AsyncSession, tenant_id=None, cursor=None, limit: int = DEFAULT_PAGE_SIZE):
+    return await list_page(db, SaasLicense, tenant_id, cursor, limit)
+
+
+def create_budget(budget: BudgetCreate, db: Session):
+    db_budget = Budget(**budget.dict(exclude={"items", "alerts"}))
+    db.add(db_budget)
+    db.flush()
+    db.add_all(BudgetItem(budget_id=db_budget.id, **item.dict()) for item in budget.items)
+    db.add_all(BudgetAlert(budget_id=db_budget.id, **alert.dict()) for alert in budget.alerts)
+    db.commit()
+    # Evaluated right away so the budget never reads as unspent until the next import.
+    evaluate_budgets(db, [budget.tenant_id])
+    db.refresh(db_budget)
+    return db_budget
+
+
+async def get_budgets(db: AsyncSession, tenant_id=None, cursor=None, limit: int = DEFAULT_PAGE_SIZE):
+    return await list_page(db, Budget, tenant_id, cursor, limit)
+
+
+async def get_budget_alert_events(db: AsyncSession, tenant_id, budget_id, limit: int = DEFAULT_PAGE_SIZE):
+    # Joined to the budget so another tenant's budget id reads as empty.
+    query = (
+        select(BudgetAlertEvent)
+        .join(Budget, Budget.id == BudgetAlertEvent.budget_id)
+        .where(Budget.tenant_id == tenant_id, BudgetAlertEvent.budget_id == budget_id)
+        .order_by(BudgetAlertEvent.fired_at.desc())
+        .limit(limit)
+    )
+    return (await db.scalars(query)).all()
+
+
+async def get_anomalies(db: AsyncSession, tenant_id, start_date=None, end_date=None,
+                        min_score: float = None, limit: int = DEFAULT_PAGE_SIZE):
+    query = (
+        select(CostAnomaly)
+        .where(CostAnomaly.tenant_id == tenant_id)
+        .order_by(CostAnomaly.cost_date.desc(), func.abs(CostAnomaly.z_score).desc())
+        .limit(limit)
+    )
+    if start_date:
+        query = query.where(CostAnomaly.cost_date >= start_date)
+    if end_date:
+        query = query.where(CostAnomaly.cost_date <= end_date)
+    if min_score:
+        query = query.where(func.abs(CostAnomaly.z_score) >= min_score)
+    return (await db.scalars(query)).all()
+
+
+async def get_savings_recommendations(db: AsyncSession, tenant_id, kind: str = None,
+                                      limit: int = DEFAULT_PAGE_SIZE):
+    query = (
+        select(SavingsRecommendation)
+        .where(SavingsRecommendation.tenant_id == tenant_id)
+        .order_by(SavingsRecommendation.estimated_monthly_savings.desc())
+        .limit(limit)
+    )
+    if kind:
+        query = query.where(SavingsRecommendation.kind == kind)
+    return (await db.scalars(query)).all()
+
+
+async def get_raw_usage(db: AsyncSession, tenant_id, start_date, end_date, service: str = None,
+                        limit: int = DEFAULT_PAGE_SIZE):
+    # The date range keeps the scan to the matching monthly partitions. Rows of
+    # an import still in progress (or one that failed) are left out.
+    query = (
+        select(CloudUsageRaw)
+        .outerjoin(Integration, Integration.id == CloudUsageRaw.integration_id)
+        .where(CloudUsageRaw.tenant_id == tenant_id)
+        .where(CloudUsageRaw.usage_date.between(start_date, end_date))
+        .where(or_(Integration.id.is_(None), CloudUsageRaw.load_generation <= Integration.load_generation))
+        .order_by(CloudUsageRaw.usage_date, CloudUsageRaw.id)
+        .limit(limit)
+    )
+    if service:
+        query = query.where(CloudUsageRaw.service == service)
+    rows = (await db.scalars(query)).all()
+
+    # Archived payloads are read back from Parquet off the event loop, each
+    # file and row group once.
+    pointers = {row.id: (row.raw_file, row.raw_row_group, row.raw_offset) for row in rows if row.raw_file}
+    archived = await asyncio.to_thread(read_rows, pointers.values()) if pointers else {}
+    return [
+        {
+            'id': row.id, 'integration_id': row.integration_id, 'provider': row.provider,
+            'usage_date': row.usage_date, 'service': row.service, 'resource_id': row.resource_id,
+            'usage_type': row.usage_type, 'usage_quantity': row.usage_quantity, 'usage_unit': row.usage_unit,
+            'cost': row.cost, 'currency': row.currency, 'tags': row.tags,
+            'raw_data': archived.get(pointers[row.id]) if row.id in pointers else row.raw_data,
+        }
+        for row in rows
+    ]
 
 
 def create_chart(chart: ChartCreate, db: Session):
@@ -120,25 +285,72 @@ def create_chart(chart: ChartCreate, db: Session):
     return db_chart
 
 
-def get_charts(db: Session):
-    return db.query(Chart).all()
+async def get_charts(db: AsyncSession, tenant_id=None, cursor=None, limit: int = DEFAULT_PAGE_SIZE):
+    return await list_page(db, Chart, tenant_id, cursor, limit)
 
 
-def get_dashboard_data(db: Session):
-    total_cost = db.query(func.coalesce(func.sum(FocusCost.cost), 0)).scalar() or 0
-    top_query = (
-        db.query(FocusCost.service, func.sum(FocusCost.cost).label("c"))
-        .group_by(FocusCost.service)
-        .order_by(func.sum(FocusCost.cost).desc())
+async def _dashboard_data(db: AsyncSession, tenant_id):
+    totals = select(func.coalesce(func.sum(CostDailyRollup.cost), 0)).where(CostDailyRollup.tenant_id == tenant_id)
+    top = (
+        select(CostDailyRollup.service, func.sum(CostDailyRollup.cost).label("c"))
+        .where(CostDailyRollup.tenant_id == tenant_id)
+        .group_by(CostDailyRollup.service)
+        .order_by(func.sum(CostDailyRollup.cost).desc())
         .limit(5)
-        .all()
     )
+    licenses = select(SaasLicense).where(SaasLicense.tenant_id == tenant_id)
+    savings = (
+        select(func.coalesce(func.sum(SavingsSummary.estimated_monthly_savings), 0))
+        .where(SavingsSummary.tenant_id == tenant_id)
+    )
+    total_cost = await db.scalar(totals) or 0
+    estimated_savings = await db.scalar(savings) or 0
+    top_query = (await db.execute(top)).all()
     top_services = [{"name": svc or "Unknown", "cost": float(cost)} for svc, cost in top_query]
-    licenses = db.query(SaasLicense).all()
+    licenses = (await db.scalars(licenses)).all()
     saas = [{"application": l.name, "users": l.users, "cost": float(l.cost or 0)} for l in licenses]
     return {
         "totalCost": float(total_cost),
-        "estimatedSavings": 0,
+        "estimatedSavings": float(estimated_savings),
         "topServices": top_services,
         "saasLicenses": saas
-    }
\ No newline at end of file
+    }
+
+
+async def get_dashboard_data(db: AsyncSession, tenant_id):
+    return await query_cache.aget_or_compute(
+        "dashboard", tenant_id, await data_generation(db, tenant_id), {}, lambda: _dashboard_data(db, tenant_id)
+    )
+
+
+async def get_dashboard_widgets_data(dashboard_id, tenant_id, db: AsyncSession, start_date=None, end_date=None):
+    # The resolved widget specs are part of the key, so editing the dashboard
+    # misses the cache even though the tenant's data generation is unchanged.
+    specs = await load_widget_specs(dashboard_id, tenant_id, db)
+    params = {"specs": specs, "start_date": start_date, "end_date": end_date}
+    return await query_cache.aget_or_compute(
+        "dashboard_widgets", tenant_id, await data_generation(db, tenant_id), params,
+        lambda: evaluate_widgets(specs, tenant_id, start_date, end_date)
+    )
+
+
+async def get_tag_keys(db: AsyncSession, tenant_id, prefix: str = None, limit: int = DEFAULT_PAGE_SIZE):
+    query = select(TagKey).where(TagKey.tenant_id == tenant_id).order_by(TagKey.tag_key).limit(limit)
+    if prefix:
+        query = query.where(TagKey.tag_key.startswith(prefix, autoescape=True))
+    return (await db.scalars(query)).all()
+
+
+async def get_tag_values(db: AsyncSession, tenant_id, tag_key: str, limit: int = DEFAULT_PAGE_SIZE):
+    query = (
+        select(CostTagRollup.tag_value, func.sum(CostTagRollup.cost).label("cost"))
+        .where(CostTagRollup.tenant_id == tenant_id, CostTagRollup.tag_key == tag_key)
+        .group_by(CostTagRollup.tag_value)
+        .order_by(func.sum(CostTagRollup.cost).desc())
+        .limit(limit)
+    )
+    return [{"value": value, "cost": float(cost or 0)} for value, cost in await db.execute(query)]
+
+
+async def get_cache_stats():
+    return await query_cache.stats()
@@ -0,0 +1,209 @@
+import asyncio
+import uuid
+from collections import defaultdict
+from datetime import date
+from fastapi import HTTPException
+from sqlalchemy import Date, String, cast, false, func, literal_column, or_, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import AsyncSessionLocal
+from app.models.models import Chart, CostDailyRollup, Dashboard, FocusCost
+from app.services.cost_query import DIMENSIONS, ROLLUP_DIMENSIONS
+
+# Widget field names (as used by the dashboard builder) -> FOCUS dimension
+FIELD_DIMENSIONS = {
+    "service_name": "service",
+    "usage_unit": "unit",
+    **{d: d for d in DIMENSIONS},
+}
+TIME_FIELDS = {"date": "day", "cost_date": "day", "day": "day", "week": "week", "month": "month"}
+MEASURES = {"cost"}
+
+# Rows kept per non-time widget, highest cost first
+WIDGET_ROW_LIMIT = 100
+
+
+def _is_date(value) -> bool:
+    try:
+        date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return False
+    return True
+
+
+def _filter_key(filters, unsupported):
+    key = []
+    for f in filters or []:
+        field, operator, value = f.get("field"), f.get("operator", "equals"), f.get("value")
+        if field in FIELD_DIMENSIONS and operator in ("equals", "not_equals", "contains", "starts_with", "ends_with"):
+            key.append((FIELD_DIMENSIONS[field], operator, str(value)))
+        elif field in TIME_FIELDS and operator in ("greater_than", "less_than") and _is_date(value):
+            key.append(("cost_date", operator, str(value)[:10]))
+        else:
+            unsupported.append(f"filter:{field}:{operator}")
+    return tuple(sorted(key))
+
+
+def widget_spec(index: int, widget: dict, dashboard_filters, chart_fields: dict) -> dict:
+    fields = widget.get("fields") or chart_fields.get(widget.get("chartId"), [])
+    dimensions, granularity, unsupported = [], None, []
+    for field in fields:
+        if field in MEASURES:
+            continue
+        if field in TIME_FIELDS:
+            granularity = granularity or TIME_FIELDS[field]
+        elif field in FIELD_DIMENSIONS:
+            if FIELD_DIMENSIONS[field] not in dimensions:
+                dimensions.append(FIELD_DIMENSIONS[field])
+        else:
+            unsupported.append(field)
+    filters = _filter_key(list(dashboard_filters or []) + list(widget.get("filters") or []), unsupported)
+    columns = ([f"period_{granularity}"] if granularity else []) + dimensions
+    rollup = set(dimensions) <= ROLLUP_DIMENSIONS and all(
+        d in ROLLUP_DIMENSIONS or d == "cost_date" for d, _, _ in filters
+    )
+    sort_by = widget.get("sortBy")
+    return {
+        "id": widget.get("id") or str(index),
+        "columns": columns,
+        "filters": filters,
+        "rollup": rollup,
+        "sort_by": FIELD_DIMENSIONS.get(sort_by, "cost") if sort_by else "cost",
+        "descending": widget.get("sortDirection", "desc") != "asc",
+        "unsupported": unsupported,
+    }
+
+
+def _conditions(source, tenant_id, filters, start_date, end_date):
+    conditions = [source.tenant_id == tenant_id]
+    if start_date:
+        conditions.append(source.cost_date >= start_date)
+    if end_date:
+        conditions.append(source.cost_date <= end_date)
+    for field, operator, value in filters:
+        if field == "cost_date":
+            column, value = source.cost_date, date.fromisoformat(value)
+        else:
+            column = cast(getattr(source, field), String)
+        if operator == "equals":
+            conditions.append(column == value)
+        elif operator == "not_equals":
+            conditions.append(column.is_distinct_from(value))
+        elif operator == "contains":
+            conditions.append(column.contains(value, autoescape=True))
+        elif operator == "starts_with":
+            conditions.append(column.startswith(value, autoescape=True))
+        elif operator == "ends_with":
+            conditions.append(column.endswith(value, autoescape=True))
+        elif operator == "greater_than":
+            conditions.append(column > value)
+        elif operator == "less_than":
+            conditions.append(column < value)
+    return conditions
+
+
+def compile_group(specs, tenant_id, start_date, end_date):
+    # Every widget sharing filters becomes one grouping set of a single scan;
+    # GROUPING() tells the sets apart in the result.
+    source = CostDailyRollup if specs[0]["rollup"] else FocusCost
+    names = list(dict.fromkeys(c for spec in specs for c in spec["columns"]))
+    expressions = {}
+    for name in names:
+        if name.startswith("period_"):
+            unit = literal_column(f"'{name[len('period_'):]}'")
+            expressions[name] = cast(func.date_trunc(unit, source.cost_date), Date)
+        else:
+            expressions[name] = cast(getattr(source, name), String)
+    sets = list(dict.fromkeys(tuple(spec["columns"]) for spec in specs))
+
+    cost = func.sum(source.cost)
+    if names:
+        gid = func.grouping(*expressions.values())
+        group_by = [func.grouping_sets(*(tuple_(*(expressions[n] for n in s)) for s in sets))]
+    else:
+        gid = literal_column("0")
+        group_by = []
+    inner = (
+        select(
+            *(expressions[n].label(n) for n in names),
+            cost.label("cost"),
+            gid.label("gid"),
+            func.row_number().over(partition_by=gid, order_by=cost.desc()).label("rn"),
+        )
+        .where(*_conditions(source, tenant_id, specs[0]["filters"], start_date, end_date))
+        .group_by(*group_by)
+        .subquery()
+    )
+    masks = {s: sum(1 << (len(names) - 1 - i) for i, n in enumerate(names) if n not in s) for s in sets}
+    series = [masks[s] for s in sets if any(c.startswith("period_") for c in s)]
+    keep_series = inner.c.gid.in_(series) if series else false()
+    statement = select(inner).where(or_(inner.c.rn <= WIDGET_ROW_LIMIT, keep_series))
+    return statement, names, masks
+
+
+async def _run_group(specs, tenant_id, start_date, end_date):
+    # Each group runs on its own connection so the groups can execute concurrently.
+    statement, names, masks = compile_group(specs, tenant_id, start_date, end_date)
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(statement)).all()
+    by_mask = defaultdict(list)
+    for row in rows:
+        by_mask[row.gid].append(row)
+
+    results = {}
+    for spec in specs:
+        selected = by_mask.get(masks[tuple(spec["columns"])], [])
+        time_series = bool(spec["columns"]) and spec["columns"][0].startswith("period_")
+        if time_series:
+            selected = sorted(selected, key=lambda r: getattr(r, spec["columns"][0]))
+        elif spec["sort_by"] in spec["columns"]:
+            selected = sorted(selected, key=lambda r: getattr(r, spec["sort_by"]) or "", reverse=spec["descending"])
+        else:
+            selected = sorted(selected, key=lambda r: r.cost or 0, reverse=spec["descending"])
+        columns = ["period" if c.startswith("period_") else c for c in spec["columns"]] + ["cost"]
+        data = {name: [] for name in columns}
+        for row in selected:
+            for name, source_name in zip(columns, spec["columns"] + ["cost"]):
+                value = getattr(row, source_name)
+                if name == "period":
+                    value = value.isoformat()
+                elif name == "cost":
+                    value = float(value or 0)
+                data[name].append(value)
+        results[spec["id"]] = {"columns": columns, "data": data, "unsupported": spec["unsupported"]}
+    return results
+
+
+async def load_widget_specs(dashboard_id, tenant_id, db: AsyncSession):
+    dashboard = await db.scalar(
+        select(Dashboard).where(Dashboard.id == dashboard_id, Dashboard.tenant_id == tenant_id)
+    )
+    if dashboard is None:
+        raise HTTPException(status_code=404, detail="Dashboard not found")
+    config = dashboard.config or {}
+    widgets = config.get("widgets") or []
+    chart_ids = []
+    for widget in widgets:
+        try:
+            chart_ids.append(uuid.UUID(str(widget.get("chartId"))))
+        except ValueError:
+            continue
+    chart_fields = {}
+    if chart_ids:
+        charts = await db.execute(
+            select(Chart.id, Chart.fields).where(Chart.tenant_id == tenant_id, Chart.id.in_(chart_ids))
+        )
+        chart_fields = {str(chart_id): fields for chart_id, fields in charts}
+    return [widget_spec(i, w, config.get("filters"), chart_fields) for i, w in enumerate(widgets)]
+
+
+async def evaluate_widgets(specs, tenant_id, start_date=None, end_date=None) -> dict:
+    groups = defaultdict(list)
+    for spec in specs:
+        groups[(spec["filters"], spec["rollup"])].append(spec)
+    results = await asyncio.gather(*(
+        _run_group(group, tenant_id, start_date, end_date) for group in groups.values()
+    ))
+    widgets = {}
+    for result in results:
+        widgets.update(result)
+    return {"widgets": widgets, "queries": len(groups)}
@@ -0,0 +1,143 @@
+import csv
+import io
+import json
+from functools import lru_cache
+from fastapi import HTTPException
+from sqlalchemy import select, tuple_
+from app.core.database import AsyncSessionLocal
+from app.models.models import FocusCost
+from app.schemas.schemas import CostFilterParams
+
+EXPORT_BATCH_SIZE = 50000
+
+EXPORT_COLUMNS = (
+    'id', 'cost_date', 'provider', 'account_id', 'service', 'resource_id', 'environment',
+    'product_family', 'usage_type', 'unit', 'quantity', 'cost', 'currency', 'tags'
+)
+
+PARQUET_TYPES = {'cost_date': 'date32', 'quantity': 'float64', 'cost': 'float64'}
+
+MEDIA_TYPES = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def export_query(filter: CostFilterParams, after_date=None, after_id=None):
+    # Ordered by (cost_date, id), which idx_focus_tenant_date serves directly. An
+    # interrupted export resumes from the last row it delivered via after_date/after_id.
+    query = (
+        select(*(getattr(FocusCost, c) for c in EXPORT_COLUMNS))
+        .where(FocusCost.tenant_id == filter.tenant_id)
+        .order_by(FocusCost.cost_date, FocusCost.id)
+    )
+    if filter.provider:
+        query = query.where(FocusCost.provider == filter.provider)
+    if filter.account_id:
+        query = query.where(FocusCost.account_id == filter.account_id)
+    if filter.start_date:
+        query = query.where(FocusCost.cost_date >= filter.start_date)
+    if filter.end_date:
+        query = query.where(FocusCost.cost_date <= filter.end_date)
+    if filter.tags:
+        query = query.where(FocusCost.tags.contains(filter.tags))
+    if (after_date is None) != (after_id is None):
+        raise HTTPException(status_code=400, detail="after_date and after_id must be given together")
+    if after_date is not None:
+        query = query.where(tuple_(FocusCost.cost_date, FocusCost.id) > tuple_(after_date, after_id))
+    return query.execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+
+async def _batches(query):
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query)
+        async for batch in result.partitions(EXPORT_BATCH_SIZE):
+            yield batch
+
+
+# Write-only file that hands over what the Parquet writer produced so far while
+# still reporting absolute offsets, which end up in the file footer.
+class _ChunkSink(io.RawIOBase):
+    def __init__(self):
+        self.position = 0
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _text(value):
+    if value is None:
+        return None
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return str(value)
+
+
+async def stream_csv(query):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(EXPORT_COLUMNS)
+    async for batch in _batches(query):
+        writer.writerows([_text(v) if isinstance(v, (dict, list)) else v for v in row] for row in batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+# pyarrow is imported by the first Parquet export rather than at worker start.
+@lru_cache(maxsize=None)
+def _parquet_schema():
+    import pyarrow as pa
+    return pa.schema([(c, getattr(pa, PARQUET_TYPES.get(c, 'string'))()) for c in EXPORT_COLUMNS])
+
+
+def _record_batch(batch):
+    import pyarrow as pa
+    # Transpose the fetched rows into columns once per batch, then let Arrow encode them.
+    schema = _parquet_schema()
+    columns = list(zip(*batch))
+    arrays = []
+    for field, values in zip(schema, columns):
+        if pa.types.is_string(field.type):
+            values = [_text(v) for v in values]
+        elif pa.types.is_floating(field.type):
+            values = [None if v is None else float(v) for v in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+async def stream_parquet(query):
+    # Each fetched batch becomes one row group; the bytes written so far are
+    # flushed to the client before the next batch is read.
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), _parquet_schema(), compression='zstd')
+    try:
+        async for batch in _batches(query):
+            writer.write_batch(_record_batch(batch))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def export_costs(filter: CostFilterParams, format: str, after_date=None, after_id=None):
+    query = export_query(filter, after_date, after_id)
+    return stream_parquet(query) if format == 'parquet' else stream_csv(query)
@@ -1,6 +1,7 @@
 CREATE TABLE tenants (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
     name TEXT NOT NULL,
+    data_generation BIGINT NOT NULL DEFAULT 0, -- bumped whenever the tenant's cost data changes
     created_at TIMESTAMP DEFAULT now()
 );
 
@@ -18,9 +19,17 @@ CREATE TABLE users (
 CREATE TABLE integrations (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
     tenant_id UUID REFERENCES tenants(id) ON DELETE CASCADE,
-    type TEXT NOT NULL, -- e.g. 'aws', 'gcp', 'azure'
+    provider TEXT NOT NULL, -- 'aws', 'gcp', 'azure'
+    type TEXT NOT NULL, -- e.g. 's3_cur', 'bq_export', 'cost_api'
     config JSONB NOT NULL,
-    connected_at TIMESTAMP DEFAULT now()
+    watermark JSONB NOT NULL DEFAULT '{}', -- last imported period / partition / ETag per integration
+    -- Imports commit cloud_usage_raw batch by batch, tagged with their load
+    -- generation; only rows up to load_generation (the last completed load) are
+    -- read. A started load that never completed leaves load_generation_started ahead.
+    load_generation INTEGER NOT NULL DEFAULT 0,
+    load_generation_started INTEGER NOT NULL DEFAULT 0,
+    connected_at TIMESTAMP DEFAULT now(),
+    last_imported_at TIMESTAMP
 );
 
 -- Cloud accounts per tenant (e.g. AWS account, GCP project)
@@ -47,10 +56,12 @@ CREATE TABLE cloud_resources (
     created_at TIMESTAMP DEFAULT now()
 );
 
--- Cloud usage (raw data from CUR/Billing Export)
+-- Cloud usage (raw data from CUR/Billing Export), partitioned by month of
+-- usage_date; monthly partitions are created ahead of time by the partition manager
 CREATE TABLE cloud_usage_raw (
-    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    id UUID NOT NULL DEFAULT gen_random_uuid(),
     tenant_id UUID REFERENCES tenants(id) ON DELETE CASCADE,
+    integration_id UUID REFERENCES integrations(id) ON DELETE CASCADE,
     provider TEXT NOT NULL,
     usage_date DATE NOT NULL,
     billing_period_start DATE,
@@ -59,6 +70,7 @@ CREATE TABLE cloud_usage_raw (
     service TEXT,
     resource_id TEXT,
     resource_type TEXT,
+    product_family TEXT,
     usage_type TEXT,
     operation TEXT,
     usage_quantity NUMERIC,
@@ -67,9 +79,21 @@ CREATE TABLE cloud_usage_raw (
     amortized_cost NUMERIC,
     currency TEXT DEFAULT 'USD',
     tags JSONB,
-    raw_data JSONB,
-    imported_at TIMESTAMP DEFAULT now()
-);
+    raw_data JSONB, -- only when RAW_ARCHIVE_URL is unset; see raw_file
+    -- Original provider row in the Parquet raw archive: file key, row group, offset in the group
+    raw_file TEXT,
+    raw_row_group INTEGER,
+    raw_offset INTEGER,
+    -- Import that loaded the row; see integrations.load_generation
+    load_generation INTEGER NOT NULL DEFAULT 0,
+    imported_at TIMESTAMP DEFAULT now(),
+    -- tenant_id is in the key so months can be hash sub-partitioned by tenant
+    -- (PARTITION_TENANT_BUCKETS); a partitioned table's key must hold every partition column
+    PRIMARY KEY (id, usage_date, tenant_id)
+) PARTITION BY RANGE (usage_date);
+
+-- Catches rows for months the partition manager has not created yet
+CREATE TABLE cloud_usage_raw_default PARTITION OF cloud_usage_raw DEFAULT;
 
 -- Cloud cost summaries
 CREATE TABLE cloud_costs (
@@ -95,10 +119,12 @@ CREATE TABLE cloud_metrics (
     measured_at TIMESTAMP DEFAULT now()
 );
 
--- FOCUS-normalized cost data (conforming to FinOps Foundation spec)
+-- FOCUS-normalized cost data (conforming to FinOps Foundation spec), partitioned
+-- by month of cost_date like cloud_usage_raw
 CREATE TABLE finops_focus_cost_data (
-    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    id UUID NOT NULL DEFAULT gen_random_uuid(),
     tenant_id UUID REFERENCES tenants(id) ON DELETE CASCADE,
+    integration_id UUID REFERENCES integrations(id) ON DELETE CASCADE,
     provider TEXT NOT NULL,
     account_id UUID REFERENCES cloud_accounts(id),
     cost_date DATE NOT NULL,
@@ -112,7 +138,79 @@ CREATE TABLE finops_focus_cost_data (
     cost NUMERIC,
     currency TEXT DEFAULT 'USD',
     tags JSONB,
-    generated_at TIMESTAMP DEFAULT now()
+    generated_at TIMESTAMP DEFAULT now(),
+    PRIMARY KEY (id, cost_date, tenant_id) -- tenant_id: see cloud_usage_raw
+) PARTITION BY RANGE (cost_date);
+
+CREATE TABLE finops_focus_cost_data_default PARTITION OF finops_focus_cost_data DEFAULT;
+
+-- Daily cost totals per tenant/provider/account/service, kept in step with
+-- finops_focus_cost_data by the normalizer; dashboards read from here
+CREATE TABLE cost_daily_rollup (
+    id BIGSERIAL PRIMARY KEY,
+    tenant_id UUID REFERENCES tenants(id) ON DELETE CASCADE,
+    provider TEXT NOT NULL,
+    account_id UUID REFERENCES cloud_accounts(id),
+    service TEXT,
+    cost_date DATE NOT NULL,
+    cost NUMERIC NOT NULL,
+    row_count BIGINT NOT NULL
+);
+
+-- Daily cost per tag key/value, exploded from finops_focus_cost_data.tags so
+-- grouping by a tag reads a narrow indexed table instead of parsing JSON
+CREATE TABLE cost_tag_rollup (
+    id BIGSERIAL PRIMARY KEY,
+    tenant_id UUID REFERENCES tenants(id) ON DELETE CASCADE,
+    tag_key TEXT NOT NULL,
+    tag_value TEXT NOT NULL,
+    provider TEXT NOT NULL,
+    account_id UUID REFERENCES cloud_accounts(id),
+    service TEXT,
+    cost_date DATE NOT NULL,
+    cost NUMERIC NOT NULL,
+    row_count BIGINT NOT NULL
+);
+
+-- Tag keys seen per tenant, for tag discovery
+CREATE TABLE tag_keys (
+    tenant_id UUID REFERENCES tenants(id) ON DELETE CASCADE,
+    tag_key TEXT NOT NULL,
+    value_count INTEGER NOT NULL,
+    first_seen DATE,
+    last_seen DATE,
+    PRIMARY KEY (tenant_id, tag_key)
+);
+
+-- Raw date ranges waiting to be (re)normalized into finops_focus_cost_data
+CREATE TABLE normalization_queue (
+    id BIGSERIAL PRIMARY KEY,
+    tenant_id UUID REFERENCES tenants(id) ON DELETE CASCADE,
+    integration_id UUID REFERENCES integrations(id) ON DELETE CASCADE,
+    start_date DATE NOT NULL,
+    end_date DATE NOT NULL, -- inclusive
+    queued_at TIMESTAMP DEFAULT now()
+);
+
+-- Durable import jobs, claimed by workers with FOR UPDATE SKIP LOCKED and held
+-- under a lease that running workers keep renewing
+CREATE TABLE import_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    tenant_id UUID REFERENCES tenants(id) ON DELETE CASCADE,
+    integration_id UUID REFERENCES integrations(id) ON DELETE CASCADE,
+    provider TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0, -- higher runs first
+    status TEXT NOT NULL DEFAULT 'queued', -- 'queued', 'running', 'succeeded', 'failed'
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    run_after TIMESTAMP NOT NULL DEFAULT now(), -- backoff: not claimable before this
+    leased_by TEXT,
+    lease_expires_at TIMESTAMP,
+    last_error TEXT,
+    stats JSONB,
+    created_at TIMESTAMP DEFAULT now(),
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
 );
 
 -- Carpetas de dashboards por tenant
@@ -138,12 +236,22 @@ CREATE TABLE dashboards (
 CREATE INDEX idx_dashboards_tenant ON dashboards(tenant_id);
 CREATE INDEX idx_dashboards_folder ON dashboards(folder_id);
 
--- Indexes for performance
-CREATE INDEX idx_usage_date ON cloud_usage_raw(usage_date);
+-- Indexes for performance (on partitioned tables they cascade to every partition)
+CREATE INDEX idx_usage_tenant_date ON cloud_usage_raw(tenant_id, usage_date);
+CREATE INDEX idx_usage_integration_date ON cloud_usage_raw(integration_id, usage_date);
+-- Finds the rows still pointing at a raw archive file before it is deleted
+CREATE INDEX idx_usage_raw_file ON cloud_usage_raw(raw_file) WHERE raw_file IS NOT NULL;
 CREATE INDEX idx_costs_date ON cloud_costs(usage_date);
-CREATE INDEX idx_accounts_tenant ON cloud_accounts(tenant_id);
+-- Imports create an account the first time they see it; see UsageRawWriter
+CREATE UNIQUE INDEX idx_accounts_identifier ON cloud_accounts(tenant_id, provider, account_identifier);
 CREATE INDEX idx_metrics_measured ON cloud_metrics(measured_at);
-CREATE INDEX idx_focus_date ON finops_focus_cost_data(cost_date);
+CREATE INDEX idx_metrics_tenant_measured ON cloud_metrics(tenant_id, measured_at);
+CREATE INDEX idx_focus_integration_date ON finops_focus_cost_data(integration_id, cost_date);
+CREATE INDEX idx_focus_tenant_date ON finops_focus_cost_data(tenant_id, cost_date, id);
+CREATE INDEX idx_rollup_tenant_date ON cost_daily_rollup(tenant_id, cost_date);
+CREATE INDEX idx_focus_tags ON finops_focus_cost_data USING GIN (tags jsonb_path_ops);
+CREATE INDEX idx_tag_rollup_key_date ON cost_tag_rollup(tenant_id, tag_key, cost_date);
+CREATE INDEX idx_tag_rollup_tenant_date ON cost_tag_rollup(tenant_id, cost_date);
 
 -- Kubernetes clusters
 CREATE TABLE kubernetes_clusters (
@@ -156,12 +264,17 @@ CREATE TABLE kubernetes_clusters (
 );
 
 -- Kubernetes usage metrics
+-- One row per workload (resource_name, in namespace) and day, plus one per node
+-- and day with resource_type = 'node', whose cpu_request/memory_request hold the
+-- node's allocatable CPU and memory, in the same units as the workload rows.
+-- Allocation charges the capacity no workload claimed as idle; without node rows
+-- a cluster-day has no idle.
 CREATE TABLE kubernetes_usage (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
     cluster_id UUID REFERENCES kubernetes_clusters(id) ON DELETE CASCADE,
     namespace TEXT,
     resource_name TEXT,
-    resource_type TEXT,
+    resource_type TEXT, -- 'node' for capacity rows; anything else is a workload
     usage_date DATE NOT NULL,
     cpu_request NUMERIC,
     cpu_usage NUMERIC,
@@ -172,6 +285,63 @@ CREATE TABLE kubernetes_usage (
     created_at TIMESTAMP DEFAULT now()
 );
 
+-- Cluster cost (from finops_focus_cost_data) distributed to namespaces and
+-- workloads by max(request, usage); rebuilt nightly by the allocation job
+CREATE TABLE kubernetes_cost_allocation (
+    id BIGSERIAL PRIMARY KEY,
+    tenant_id UUID REFERENCES tenants(id) ON DELETE CASCADE,
+    cluster_id UUID REFERENCES kubernetes_clusters(id) ON DELETE CASCADE,
+    provider TEXT NOT NULL,
+    cost_date DATE NOT NULL,
+    namespace TEXT NOT NULL, -- '__idle__' for unrequested capacity
+    workload TEXT,
+    cpu_cost NUMERIC NOT NULL,
+    memory_cost NUMERIC NOT NULL,
+    cost NUMERIC NOT NULL,
+    generated_at TIMESTAMP DEFAULT now()
+);
+
+-- Daily cost spikes/drops per (tenant, provider, account, service) series,
+-- written by the anomaly detector for the days each import touched
+CREATE TABLE cost_anomalies (
+    id BIGSERIAL PRIMARY KEY,
+    tenant_id UUID REFERENCES tenants(id) ON DELETE CASCADE,
+    provider TEXT NOT NULL,
+    account_id UUID REFERENCES cloud_accounts(id),
+    service TEXT,
+    cost_date DATE NOT NULL,
+    actual_cost NUMERIC NOT NULL,
+    expected_cost NUMERIC NOT NULL,
+    z_score NUMERIC NOT NULL,
+    detected_at TIMESTAMP DEFAULT now()
+);
+
+-- Rightsizing, idle-resource and Kubernetes request recommendations, rebuilt
+-- per tenant by the savings engine
+CREATE TABLE savings_recommendations (
+    id BIGSERIAL PRIMARY KEY,
+    tenant_id UUID REFERENCES tenants(id) ON DELETE CASCADE,
+    provider TEXT,
+    resource_id TEXT NOT NULL,
+    service TEXT,
+    kind TEXT NOT NULL, -- 'idle', 'rightsize', 'k8s_requests'
+    cpu_p95 NUMERIC,
+    memory_p95 NUMERIC,
+    samples BIGINT,
+    monthly_cost NUMERIC NOT NULL,
+    estimated_monthly_savings NUMERIC NOT NULL,
+    details JSONB,
+    generated_at TIMESTAMP DEFAULT now()
+);
+
+-- Per-tenant savings total the dashboard summary reads
+CREATE TABLE savings_summary (
+    tenant_id UUID PRIMARY KEY REFERENCES tenants(id) ON DELETE CASCADE,
+    estimated_monthly_savings NUMERIC NOT NULL,
+    recommendation_count BIGINT NOT NULL,
+    generated_at TIMESTAMP DEFAULT now()
+);
+
 -- Software products
 CREATE TABLE software_products (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
@@ -202,6 +372,9 @@ CREATE TABLE budgets (
     start_date DATE NOT NULL,
     end_date DATE NOT NULL,
     amount NUMERIC NOT NULL,
+    actual_spend NUMERIC,
+    forecast_spend NUMERIC,
+    evaluated_at TIMESTAMP,
     created_at TIMESTAMP DEFAULT now()
 );
 
@@ -221,14 +394,39 @@ CREATE TABLE budget_alerts (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
     budget_id UUID REFERENCES budgets(id) ON DELETE CASCADE,
     threshold_percent NUMERIC NOT NULL,
-    alert_type TEXT NOT NULL,
+    alert_type TEXT NOT NULL, -- 'actual' or 'forecast'
+    triggered_at TIMESTAMP, -- set while crossed; cleared when spend drops back below
     created_at TIMESTAMP DEFAULT now()
 );
 
+-- One row per threshold crossing, written by the budget engine
+CREATE TABLE budget_alert_events (
+    id BIGSERIAL PRIMARY KEY,
+    alert_id UUID REFERENCES budget_alerts(id) ON DELETE CASCADE,
+    budget_id UUID REFERENCES budgets(id) ON DELETE CASCADE,
+    alert_type TEXT NOT NULL,
+    threshold_percent NUMERIC NOT NULL,
+    spend_percent NUMERIC,
+    spend NUMERIC,
+    fired_at TIMESTAMP DEFAULT now()
+);
+
 -- Additional indexes
 CREATE INDEX idx_k8s_usage_date ON kubernetes_usage(usage_date);
+CREATE INDEX idx_k8s_usage_cluster_date ON kubernetes_usage(cluster_id, usage_date);
+CREATE INDEX idx_k8s_alloc_tenant_date ON kubernetes_cost_allocation(tenant_id, cost_date);
+CREATE INDEX idx_savings_tenant ON savings_recommendations(tenant_id, estimated_monthly_savings DESC);
+CREATE INDEX idx_anomalies_tenant_date ON cost_anomalies(tenant_id, cost_date);
 CREATE INDEX idx_license_dates ON software_licenses(start_date, end_date);
 CREATE INDEX idx_budget_dates ON budgets(start_date, end_date);
+CREATE INDEX idx_budget_tenant_dates ON budgets(tenant_id, start_date, end_date);
+CREATE INDEX idx_budget_items_budget ON budget_items(budget_id);
+CREATE INDEX idx_budget_alerts_budget ON budget_alerts(budget_id);
+CREATE INDEX idx_budget_alert_events_budget ON budget_alert_events(budget_id, fired_at);
+CREATE INDEX idx_import_jobs_claim ON import_jobs(priority DESC, run_after) WHERE status = 'queued';
+CREATE INDEX idx_import_jobs_lease ON import_jobs(lease_expires_at) WHERE status = 'running';
+-- At most one pending or running job per integration
+CREATE UNIQUE INDEX idx_import_jobs_active ON import_jobs(integration_id) WHERE status IN ('queued', 'running');
 
 -- SaaS licenses
 CREATE TABLE saas_licenses (
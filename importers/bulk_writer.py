@@ -0,0 +1,326 @@
+import csv
+import io
+import json
+import time
+from itertools import repeat
+from datetime import timedelta
+from sqlalchemy import text
+from app.core.database import check_deadline, limit_statement_timeout
+from app.core.raw_archive import RawArchiveBatch, delete_unreferenced, get_store, track_written
+
+DEFAULT_BATCH_SIZE = 50000
+
+USAGE_RAW_COLUMNS = (
+    'tenant_id', 'integration_id', 'provider', 'account_id', 'usage_date', 'service', 'resource_id',
+    'product_family', 'usage_type', 'usage_quantity', 'usage_unit', 'cost', 'currency',
+    'tags', 'raw_data', 'raw_file', 'raw_row_group', 'raw_offset', 'load_generation'
+)
+
+NULL = '\\N'
+
+
+def _csv_value(value):
+    if value is None:
+        return NULL
+    if isinstance(value, (dict, list, tuple)):
+        return json.dumps(value, default=str)
+    return value
+
+
+# Buffers rows and loads them with COPY ... FROM STDIN. With autocommit each
+# batch is its own transaction; otherwise everything commits once on exit.
+class CopyWriter:
+    def __init__(self, db_session, table: str, columns, batch_size: int = DEFAULT_BATCH_SIZE,
+                 autocommit: bool = True):
+        self.db_session = db_session
+        self.table = table
+        self.columns = tuple(columns)
+        self.batch_size = batch_size
+        self.autocommit = autocommit
+        self.rows = 0
+        self.batches = 0
+        self.bytes = 0
+        self.started = time.perf_counter()
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator='\n')
+        self._pending = 0
+        self._copy_sql = (
+            f"COPY {table} ({', '.join(self.columns)}) "
+            f"FROM STDIN WITH (FORMAT csv, NULL '{NULL}')"
+        )
+
+    def add(self, row: dict):
+        self._writer.writerow([_csv_value(row.get(c)) for c in self.columns])
+        self._pending += 1
+        if self._pending >= self.batch_size:
+            self.flush()
+
+    def add_columns(self, columns: dict, count: int = None):
+        # Column-oriented batch (name -> equal-length lists), e.g. decoded from
+        # an Arrow record batch; columns not given are written as NULL.
+        if count is None:
+            count = len(next(iter(columns.values())))
+        values = [map(_csv_value, columns[c]) if c in columns else repeat(NULL, count) for c in self.columns]
+        self._writer.writerows(zip(*values))
+        self._pending += count
+        if self._pending >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        # Stops a job that ran past its deadline, and caps this COPY at the time left.
+        limit_statement_timeout(self.db_session)
+        self.before_flush()
+        self.bytes += self._buffer.tell()
+        self._buffer.seek(0)
+        cursor = self.db_session.connection().connection.cursor()
+        try:
+            cursor.copy_expert(self._copy_sql, self._buffer)
+        finally:
+            cursor.close()
+        if self.autocommit:
+            self.db_session.commit()
+        self.rows += self._pending
+        self.batches += 1
+        self._pending = 0
+        self._buffer.seek(0)
+        self._buffer.truncate()
+
+    def stats(self) -> dict:
+        elapsed = time.perf_counter() - self.started
+        return {
+            'rows': self.rows,
+            'batches': self.batches,
+            'bytes': self.bytes,
+            'seconds': round(elapsed, 3),
+            'rows_per_sec': round(self.rows / elapsed, 1) if elapsed else 0.0
+        }
+
+    def before_flush(self):
+        pass
+
+    def before_commit(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+            # A job abandoned at its deadline must not commit what it loaded before
+            check_deadline(self.db_session)
+            self.before_commit()
+            self.db_session.commit()
+        else:
+            self.db_session.rollback()
+        return False
+
+
+class UsageRawWriter(CopyWriter):
+    def __init__(self, db_session, tenant_id: str, provider: str, batch_size: int = DEFAULT_BATCH_SIZE,
+                 integration_id=None):
+        # Every batch commits on its own, so an import never holds one long
+        # transaction. Imports tied to an integration stay atomic through their
+        # load generation: their rows are not read until the last commit, which
+        # also drops the replaced rows and saves the new watermark.
+        super().__init__(db_session, 'cloud_usage_raw', USAGE_RAW_COLUMNS, batch_size)
+        self.tenant_id = tenant_id
+        self.integration_id = integration_id
+        self.provider = provider
+        self.generation = 0
+        self.first_date = None
+        self.last_date = None
+        self._replace = []
+        self._accounts = {}
+        # With an archive configured, raw payloads go to Parquet files and the
+        # row keeps only a pointer; raw_data stays NULL.
+        store = get_store()
+        self.archive = RawArchiveBatch(store, tenant_id, provider) if store else None
+
+    def __enter__(self):
+        if self.integration_id is not None:
+            self._start_generation()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # The last batch commits together with the generation switch
+        if exc_type is None and self.integration_id is not None:
+            self.autocommit = False
+        return super().__exit__(exc_type, exc, tb)
+
+    def _start_generation(self):
+        loaded, started = self.db_session.execute(
+            text("""
+                SELECT load_generation, load_generation_started FROM integrations
+                WHERE id = :integration_id FOR UPDATE
+            """),
+            {'integration_id': self.integration_id}
+        ).one()
+        loaded = loaded or 0
+        if (started or 0) > loaded:
+            # An earlier load of this integration never completed; its rows were never read.
+            self._delete_rows("load_generation > :generation", {'generation': loaded})
+        self.generation = loaded + 1
+        self.db_session.execute(
+            text("UPDATE integrations SET load_generation_started = :generation WHERE id = :integration_id"),
+            {'generation': self.generation, 'integration_id': self.integration_id}
+        )
+        self.db_session.commit()
+
+    def _delete_rows(self, condition: str, params: dict):
+        sql = f"DELETE FROM cloud_usage_raw WHERE integration_id = :integration_id AND {condition}"
+        params = {**params, 'integration_id': self.integration_id}
+        files = self.db_session.execute(
+            text(sql.replace("DELETE FROM", "SELECT DISTINCT raw_file FROM") + " AND raw_file IS NOT NULL"), params
+        ).scalars().all()
+        self.db_session.execute(text(sql), params)
+        # The deleted rows' archive files go once the delete commits.
+        delete_unreferenced(self.db_session, files)
+
+    def replace_range(self, start=None, end=None):
+        # What this integration previously loaded for [start, end) is dropped when
+        # this load completes, so a restated period replaces the old rows instead
+        # of duplicating them. Without bounds, everything previously loaded goes.
+        if self.integration_id is None:
+            raise ValueError("replace_range requires an integration_id")
+        self._replace.append((start, end))
+
+    def _replace_old_rows(self):
+        for start, end in self._replace:
+            condition = "load_generation < :generation"
+            params = {'generation': self.generation}
+            if start is not None:
+                condition += " AND usage_date >= :start"
+                params['start'] = start
+            if end is not None:
+                condition += " AND usage_date < :end"
+                params['end'] = end
+            # Whatever is deleted must be re-normalized too, even if nothing replaces it.
+            if start is None or end is None:
+                bounds = self.db_session.execute(
+                    text(f"""
+                        SELECT min(usage_date), max(usage_date) FROM cloud_usage_raw
+                        WHERE integration_id = :integration_id AND {condition}
+                    """),
+                    {**params, 'integration_id': self.integration_id}
+                ).one()
+                for bound in bounds:
+                    if bound is not None:
+                        self._track(str(bound))
+            if start is not None:
+                self._track(str(start))
+            if end is not None:
+                self._track(str(end - timedelta(days=1)))
+            self._delete_rows(condition, params)
+
+    def _track(self, usage_date: str):
+        if self.first_date is None or usage_date < self.first_date:
+            self.first_date = usage_date
+        if self.last_date is None or usage_date > self.last_date:
+            self.last_date = usage_date
+
+    def _account_id(self, identifier):
+        # Rows name their account by its provider identifier (AWS account,
+        # GCP project, Azure subscription); cloud_accounts gets a row for each
+        # one the first time an import sees it.
+        if not identifier:
+            return None
+        account_id = self._accounts.get(identifier)
+        if account_id is None:
+            params = {'tenant_id': self.tenant_id, 'provider': self.provider, 'identifier': identifier}
+            account_id = self.db_session.execute(
+                text("""
+                    INSERT INTO cloud_accounts (tenant_id, provider, account_identifier)
+                    VALUES (:tenant_id, :provider, :identifier)
+                    ON CONFLICT (tenant_id, provider, account_identifier) DO NOTHING
+                    RETURNING id
+                """),
+                params
+            ).scalar() or self.db_session.execute(
+                text("""
+                    SELECT id FROM cloud_accounts
+                    WHERE tenant_id = :tenant_id AND provider = :provider AND account_identifier = :identifier
+                """),
+                params
+            ).scalar()
+            self._accounts[identifier] = account_id
+        return account_id
+
+    def add(self, row: dict):
+        row['tenant_id'] = self.tenant_id
+        row['account_id'] = self._account_id(row.pop('account_identifier', None))
+        row['integration_id'] = self.integration_id
+        row['provider'] = self.provider
+        row['load_generation'] = self.generation
+        self._track(str(row['usage_date'])[:10])
+        if self.archive:
+            row['raw_file'], row['raw_row_group'], row['raw_offset'] = self.archive.add(row.pop('raw_data', None))
+        super().add(row)
+
+    def add_columns(self, columns: dict):
+        count = len(columns['usage_date'])
+        if not count:
+            return
+        self._track(str(min(columns['usage_date'])))
+        self._track(str(max(columns['usage_date'])))
+        columns = dict(
+            columns,
+            tenant_id=repeat(self.tenant_id, count),
+            integration_id=repeat(self.integration_id, count),
+            provider=repeat(self.provider, count),
+            load_generation=repeat(self.generation, count)
+        )
+        if 'account_identifier' in columns:
+            columns['account_id'] = [self._account_id(a) for a in columns.pop('account_identifier')]
+        if self.archive:
+            raws = columns.pop('raw_data', None) or repeat(None, count)
+            pointers = [self.archive.add(raw) for raw in raws]
+            columns['raw_file'], columns['raw_row_group'], columns['raw_offset'] = zip(*pointers)
+        super().add_columns(columns, count)
+
+    def before_flush(self):
+        if self.archive:
+            track_written(self.db_session, self.archive.write())
+        # Rows without an integration are read as soon as their batch commits, so
+        # each batch's range is queued with it. An integration's load is queued
+        # once, when it completes.
+        if self.integration_id is None:
+            self._queue_normalization()
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        if self.archive:
+            stats['archived_bytes'] = self.archive.bytes
+            stats['archive_files'] = self.archive.files
+        return stats
+
+    def before_commit(self):
+        if self.integration_id is not None:
+            self._replace_old_rows()
+            # From this commit on, the new rows are read and the replaced ones are gone.
+            self.db_session.execute(
+                text("UPDATE integrations SET load_generation = :generation WHERE id = :integration_id"),
+                {'generation': self.generation, 'integration_id': self.integration_id}
+            )
+        self._queue_normalization()
+
+    def _queue_normalization(self):
+        # Queue the touched date range for FOCUS normalization in the same
+        # transaction as the rows themselves.
+        if self.first_date is None:
+            return
+        self.db_session.execute(
+            text("""
+                INSERT INTO normalization_queue (tenant_id, integration_id, start_date, end_date)
+                VALUES (:tenant_id, :integration_id, :start_date, :end_date)
+            """),
+            {
+                'tenant_id': self.tenant_id,
+                'integration_id': self.integration_id,
+                'start_date': self.first_date,
+                'end_date': self.last_date
+            }
+        )
+        self.first_date = self.last_date = None
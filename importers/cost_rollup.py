@@ -0,0 +1,76 @@
+from sqlalchemy import text
+
+ROLLUP_DIMENSIONS = ('provider', 'account_id', 'service', 'cost_date')
+
+RANGE = "tenant_id = :tenant_id AND cost_date BETWEEN :start AND :end"
+
+
+def refresh_rollup(db_session, tenant_id, start, end) -> int:
+    # Rebuild the tenant's daily totals for [start, end] from the fact table. The
+    # advisory lock serializes refreshes per tenant: two overlapping rebuilds in
+    # parallel transactions would otherwise both insert the same days.
+    db_session.execute(text("SELECT pg_advisory_xact_lock(hashtext(:tenant_id))"), {'tenant_id': str(tenant_id)})
+    params = {'tenant_id': tenant_id, 'start': start, 'end': end}
+    db_session.execute(
+        text("""
+            DELETE FROM cost_daily_rollup
+            WHERE tenant_id = :tenant_id AND cost_date BETWEEN :start AND :end
+        """),
+        params
+    )
+    result = db_session.execute(
+        text(f"""
+            INSERT INTO cost_daily_rollup (tenant_id, {', '.join(ROLLUP_DIMENSIONS)}, cost, row_count)
+            SELECT tenant_id, {', '.join(ROLLUP_DIMENSIONS)}, COALESCE(SUM(cost), 0), COUNT(*)
+            FROM finops_focus_cost_data
+            WHERE tenant_id = :tenant_id AND cost_date BETWEEN :start AND :end
+            GROUP BY tenant_id, {', '.join(ROLLUP_DIMENSIONS)}
+        """),
+        params
+    )
+    refresh_tag_rollup(db_session, params)
+    return result.rowcount
+
+
+def _tag_keys_in_range(db_session, params) -> set:
+    return set(db_session.execute(
+        text(f"SELECT DISTINCT tag_key FROM cost_tag_rollup WHERE {RANGE}"), params
+    ).scalars())
+
+
+def refresh_tag_rollup(db_session, params):
+    # Same range rebuild as the daily rollup, one row per tag key/value. Runs
+    # under the caller's tenant lock.
+    touched = _tag_keys_in_range(db_session, params)
+    db_session.execute(text(f"DELETE FROM cost_tag_rollup WHERE {RANGE}"), params)
+    db_session.execute(
+        text(f"""
+            INSERT INTO cost_tag_rollup (tenant_id, tag_key, tag_value, {', '.join(ROLLUP_DIMENSIONS)}, cost, row_count)
+            SELECT f.tenant_id, t.key, t.value, {', '.join('f.' + d for d in ROLLUP_DIMENSIONS)},
+                   COALESCE(SUM(f.cost), 0), COUNT(*)
+            FROM finops_focus_cost_data f
+            CROSS JOIN LATERAL jsonb_each_text(
+                CASE WHEN jsonb_typeof(f.tags) = 'object' THEN f.tags END
+            ) AS t(key, value)
+            WHERE f.tenant_id = :tenant_id AND f.cost_date BETWEEN :start AND :end
+            GROUP BY f.tenant_id, t.key, t.value, {', '.join('f.' + d for d in ROLLUP_DIMENSIONS)}
+        """),
+        params
+    )
+    touched |= _tag_keys_in_range(db_session, params)
+    if not touched:
+        return
+
+    # Key statistics are recomputed only for keys this range gained or lost.
+    keys = {**params, 'keys': sorted(touched)}
+    db_session.execute(text("DELETE FROM tag_keys WHERE tenant_id = :tenant_id AND tag_key = ANY(:keys)"), keys)
+    db_session.execute(
+        text("""
+            INSERT INTO tag_keys (tenant_id, tag_key, value_count, first_seen, last_seen)
+            SELECT tenant_id, tag_key, COUNT(DISTINCT tag_value), MIN(cost_date), MAX(cost_date)
+            FROM cost_tag_rollup
+            WHERE tenant_id = :tenant_id AND tag_key = ANY(:keys)
+            GROUP BY tenant_id, tag_key
+        """),
+        keys
+    )
@@ -0,0 +1,154 @@
+import time
+from collections import defaultdict
+from sqlalchemy import text
+from app.importers.cost_rollup import refresh_rollup
+
+# Provider unit spellings -> (FOCUS unit, factor applied to the quantity)
+UNIT_ALIASES = {
+    'hrs': ('Hours', 1),
+    'hour': ('Hours', 1),
+    'hours': ('Hours', 1),
+    'h': ('Hours', 1),
+    'seconds': ('Hours', 1 / 3600),
+    's': ('Hours', 1 / 3600),
+    'gb-mo': ('GB-Months', 1),
+    'gibibyte month': ('GB-Months', 1),
+    'gibibyte-month': ('GB-Months', 1),
+    'gb': ('GB', 1),
+    'gibibyte': ('GB', 1),
+    'requests': ('Requests', 1),
+    'request': ('Requests', 1),
+    'count': ('Requests', 1),
+}
+
+ENVIRONMENT_TAGS = ('environment', 'env', 'Environment', 'Env')
+
+FOCUS_COLUMNS = (
+    'tenant_id', 'integration_id', 'provider', 'account_id', 'cost_date', 'service', 'resource_id',
+    'environment', 'product_family', 'usage_type', 'unit', 'quantity', 'cost', 'currency', 'tags'
+)
+
+
+def _units_sql():
+    values = ', '.join(f"(:alias{i}, :unit{i}, :factor{i})" for i in range(len(UNIT_ALIASES)))
+    params = {}
+    for i, (alias, (unit, factor)) in enumerate(UNIT_ALIASES.items()):
+        params[f'alias{i}'] = alias
+        params[f'unit{i}'] = unit
+        params[f'factor{i}'] = factor
+    return f"(VALUES {values}) AS u(alias, unit, factor)", params
+
+
+def _scope(integration_id, date_column: str, alias: str = '') -> str:
+    # Ad-hoc imports (no integration) are scoped by tenant only, never touching
+    # rows that belong to a configured integration.
+    if integration_id is None:
+        return (f"{alias}tenant_id = :tenant_id AND {alias}integration_id IS NULL "
+                f"AND {alias}{date_column} BETWEEN :start AND :end")
+    return f"{alias}integration_id = :integration_id AND {alias}{date_column} BETWEEN :start AND :end"
+
+
+def _loaded(integration_id) -> str:
+    # An integration's rows are read only once the load that wrote them completed.
+    if integration_id is None:
+        return ""
+    return ("AND r.load_generation <= "
+            "(SELECT load_generation FROM integrations WHERE id = :integration_id)")
+
+
+def normalize_range(db_session, tenant_id, integration_id, start, end) -> int:
+    # The whole mapping is one set-based INSERT ... SELECT: Postgres processes the
+    # raw columns in bulk, so no row ever round-trips through Python.
+    params = {'tenant_id': tenant_id, 'integration_id': integration_id, 'start': start, 'end': end}
+    db_session.execute(
+        text(f"DELETE FROM finops_focus_cost_data WHERE {_scope(integration_id, 'cost_date')}"),
+        params
+    )
+    units, unit_params = _units_sql()
+    environment = ', '.join(f"r.tags ->> '{tag}'" for tag in ENVIRONMENT_TAGS)
+    result = db_session.execute(
+        text(f"""
+            INSERT INTO finops_focus_cost_data ({', '.join(FOCUS_COLUMNS)})
+            SELECT
+                r.tenant_id, r.integration_id, r.provider, r.account_id, r.usage_date,
+                COALESCE(NULLIF(r.service, ''), 'Unknown'),
+                NULLIF(r.resource_id, ''),
+                COALESCE({environment}),
+                NULLIF(r.product_family, ''),
+                NULLIF(r.usage_type, ''),
+                COALESCE(u.unit, NULLIF(r.usage_unit, '')),
+                r.usage_quantity * COALESCE(u.factor, 1),
+                COALESCE(r.cost, 0),
+                COALESCE(NULLIF(r.currency, ''), 'USD'),
+                r.tags
+            FROM cloud_usage_raw r
+            LEFT JOIN {units} ON u.alias = lower(r.usage_unit)
+            WHERE {_scope(integration_id, 'usage_date', 'r.')} {_loaded(integration_id)}
+        """),
+        {**params, **unit_params}
+    )
+    return result.rowcount
+
+
+def _claim(db_session, integration_id=None):
+    # SKIP LOCKED lets several normalizers drain the queue side by side; the
+    # claimed entries come back if the transaction rolls back.
+    where = "WHERE integration_id = :integration_id" if integration_id else ""
+    rows = db_session.execute(
+        text(f"""
+            DELETE FROM normalization_queue
+            WHERE id IN (
+                SELECT id FROM normalization_queue {where}
+                ORDER BY id
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING tenant_id, integration_id, start_date, end_date
+        """),
+        {'integration_id': integration_id}
+    ).fetchall()
+
+    # Several imports of the same integration collapse into one covering range.
+    ranges = defaultdict(lambda: [None, None])
+    for tenant_id, queued_integration, start, end in rows:
+        span = ranges[(str(tenant_id), str(queued_integration) if queued_integration else None)]
+        span[0] = start if span[0] is None or start < span[0] else span[0]
+        span[1] = end if span[1] is None or end > span[1] else span[1]
+    return ranges
+
+
+def _touched(ranges) -> dict:
+    # Date span rewritten per tenant, across all of its integrations
+    touched = {}
+    for (tenant_id, _), (start, end) in ranges.items():
+        span = touched.setdefault(tenant_id, [start, end])
+        span[0], span[1] = min(span[0], start), max(span[1], end)
+    return touched
+
+
+def normalize_pending(db_session, integration_id=None) -> dict:
+    started = time.perf_counter()
+    rows = 0
+    ranges = _claim(db_session, integration_id)
+    try:
+        # A stable order keeps concurrent normalizers from taking tenant locks in opposite orders.
+        for (tenant_id, queued_integration), (start, end) in sorted(ranges.items(), key=lambda r: (r[0][0], r[0][1] or '')):
+            rows += normalize_range(db_session, tenant_id, queued_integration, start, end)
+            refresh_rollup(db_session, tenant_id, start, end)
+        # Cached dashboard results are keyed by generation, so this retires them.
+        for tenant_id in sorted({tenant_id for tenant_id, _ in ranges}):
+            db_session.execute(
+                text("UPDATE tenants SET data_generation = data_generation + 1 WHERE id = :id"),
+                {'id': tenant_id}
+            )
+        db_session.commit()
+    except Exception:
+        db_session.rollback()
+        raise
+    elapsed = time.perf_counter() - started
+    return {
+        'ranges': len(ranges),
+        'touched': _touched(ranges),
+        'rows': rows,
+        'seconds': round(elapsed, 3),
+        'rows_per_sec': round(rows / elapsed, 1) if elapsed else 0.0
+    }
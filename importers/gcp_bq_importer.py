@@ -1,5 +1,29 @@
 from azure.identity import ClientSecretCredential
-from azure.mgmt.costmanagement import CostManagementClient
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+import queue
+import threading
+import time
+import httpx
+from app.core.database import check_deadline
+from app.importers.bulk_writer import UsageRawWriter, DEFAULT_BATCH_SIZE
+from app.importers.watermarks import load_watermark, save_watermark
+
+RESTATEMENT_DAYS = 3
+DEFAULT_ENDPOINT = 'https://management.azure.com'
+API_VERSION = '2023-03-01'
+# Each (scope, window) is one paginated query; windows run in parallel
+WINDOW_DAYS = 7
+CONCURRENCY = 4
+MAX_RETRIES = 6
+# Cost Management reports throttling per QPU, entity and tenant; any of these
+# (or the standard header) says how long to back off.
+RETRY_AFTER_HEADERS = (
+    'x-ms-ratelimit-microsoft.costmanagement-qpu-retry-after',
+    'x-ms-ratelimit-microsoft.costmanagement-entity-retry-after',
+    'x-ms-ratelimit-microsoft.costmanagement-tenant-retry-after',
+    'retry-after',
+)
 
 def get_azure_credentials(config):
     credential = ClientSecretCredential(
@@ -9,29 +33,203 @@ def get_azure_credentials(config):
     )
     return credential
 
-def azure_cost_import(tenant_id: str, config: dict, db_session):
-    credential = get_azure_credentials(config)
-    client = CostManagementClient(credential)
+def _column_index(columns, *names):
+    lookup = {c['name'].lower(): i for i, c in enumerate(columns)}
+    for name in names:
+        if name.lower() in lookup:
+            return lookup[name.lower()]
+    return None
+
+
+# Shared by all workers of one import: a throttled response pauses every
+# request, since the limits are per tenant/entity rather than per connection.
+class _Throttle:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._resume_at = 0.0
+        self.waited = 0.0
+
+    def wait(self, stop: threading.Event):
+        # Cut short once the import stops
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            stop.wait(delay)
+            with self._lock:
+                self.waited += delay
+
+    def back_off(self, seconds: float):
+        with self._lock:
+            self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+
 
-    scope = config['scope']  # e.g. "/subscriptions/<sub_id>"
-    query = client.query.usage(scope, parameters={
+def _retry_after(response, attempt: int) -> float:
+    values = [response.headers.get(h) for h in RETRY_AFTER_HEADERS]
+    seconds = [float(v) for v in values if v and v.replace('.', '', 1).isdigit()]
+    return max(seconds) if seconds else min(60.0, 2.0 ** attempt)
+
+
+def _query_body(start: date, end: date) -> dict:
+    return {
         'type': 'Usage',
-        'timeframe': 'MonthToDate',
-    })
-
-    for row in query.rows:
-        service = row[2] if len(row) > 2 else 'unknown'
-        cost = float(row[4]) if len(row) > 4 else 0.0
-
-        db_session.execute("""
-            INSERT INTO cloud_usage_raw (
-                tenant_id, provider, usage_date, service, cost, raw_data
-            ) VALUES (
-                :tenant_id, 'azure', CURRENT_DATE, :service, :cost, :raw_data
-            )
-        """, {
-            'tenant_id': tenant_id,
-            'service': service,
-            'cost': cost,
-            'raw_data': row
-        })
\ No newline at end of file
+        'timeframe': 'Custom',
+        'timePeriod': {'from': f"{start}T00:00:00Z", 'to': f"{end}T23:59:59Z"},
+        'dataset': {
+            'granularity': 'Daily',
+            'aggregation': {'totalCost': {'name': 'Cost', 'function': 'Sum'}},
+            'grouping': [
+                {'type': 'Dimension', 'name': 'ServiceName'},
+                {'type': 'Dimension', 'name': 'MeterCategory'},
+                {'type': 'Dimension', 'name': 'SubscriptionId'}
+            ]
+        }
+    }
+
+
+def _windows(start: date, end: date, days: int):
+    while start <= end:
+        window_end = min(end, start + timedelta(days=days - 1))
+        yield start, window_end
+        start = window_end + timedelta(days=1)
+
+
+def _fetch_window(http, headers, throttle, url, body, emit, stop):
+    # Follows nextLink until the window is exhausted, handing each page to
+    # emit(columns, rows) as it arrives; returns the number of requests made.
+    # Gives up early once stop is set.
+    attempt = requests = 0
+    while url and not stop.is_set():
+        throttle.wait(stop)
+        if stop.is_set():
+            break
+        response = http.post(url, json=body, headers=headers())
+        requests += 1
+        if response.status_code in (429, 503) and attempt < MAX_RETRIES:
+            attempt += 1
+            throttle.back_off(_retry_after(response, attempt))
+            continue
+        response.raise_for_status()
+        attempt = 0
+        properties = response.json()['properties']
+        emit(properties['columns'], properties['rows'])
+        url = properties.get('nextLink')
+    return requests
+
+
+def _subscription(scope: str):
+    # "/subscriptions/<id>[/resourceGroups/...]" -> <id>; None for billing scopes
+    parts = scope.strip('/').split('/')
+    if len(parts) >= 2 and parts[0].lower() == 'subscriptions':
+        return parts[1]
+    return None
+
+
+def _page_rows(columns, rows, subscription=None):
+    # Rows carry their subscription when the query groups by it; otherwise they
+    # belong to the subscription the query was scoped to, if any.
+    date_col = _column_index(columns, 'UsageDate')
+    service_col = _column_index(columns, 'ServiceName')
+    cost_col = _column_index(columns, 'Cost', 'PreTaxCost', 'CostUSD', 'totalCost')
+    category_col = _column_index(columns, 'MeterCategory')
+    currency_col = _column_index(columns, 'Currency')
+    subscription_col = _column_index(columns, 'SubscriptionId')
+    names = [c['name'] for c in columns]
+    if date_col is None:
+        raise ValueError(f"Cost Management response has no UsageDate column (got {', '.join(names)})")
+    for row in rows:
+        yield {
+            # UsageDate comes back as a number, e.g. 20240131
+            'usage_date': datetime.strptime(str(int(row[date_col])), '%Y%m%d').date(),
+            'service': row[service_col] if service_col is not None else 'unknown',
+            'account_identifier': row[subscription_col] if subscription_col is not None else subscription,
+            'product_family': row[category_col] if category_col is not None else None,
+            'cost': float(row[cost_col]) if cost_col is not None else 0.0,
+            'currency': row[currency_col] if currency_col is not None else 'USD',
+            'raw_data': dict(zip(names, row))
+        }
+
+
+def azure_cost_import(tenant_id: str, config: dict, db_session, integration_id=None):
+    # A local stand-in (config['endpoint_url']) is queried directly, without Azure AD.
+    endpoint = config.get('endpoint_url', DEFAULT_ENDPOINT).rstrip('/')
+    if config.get('endpoint_url'):
+        headers = lambda: {}
+    else:
+        credential = get_azure_credentials(config)
+        # get_token caches, and refreshes the token if a long import outlives it
+        headers = lambda: {'Authorization': f"Bearer {credential.get_token(f'{DEFAULT_ENDPOINT}/.default').token}"}
+    watermark = load_watermark(db_session, integration_id)
+
+    # Azure keeps revising the most recent days, so re-read a short window before
+    # the watermark and replace it; older days are never fetched again.
+    today = date.today()
+    if watermark.get('last_date'):
+        restatement = int(config.get('restatement_days', RESTATEMENT_DAYS))
+        start = date.fromisoformat(watermark['last_date']) - timedelta(days=restatement)
+    else:
+        start = today.replace(day=1)
+
+    scopes = config.get('scopes') or [config['scope']]  # e.g. "/subscriptions/<sub_id>"
+    jobs = [
+        (f"{endpoint}{scope}/providers/Microsoft.CostManagement/query?api-version={API_VERSION}",
+         _query_body(window_start, window_end), _subscription(scope))
+        for scope in scopes
+        for window_start, window_end in _windows(start, today, int(config.get('window_days', WINDOW_DAYS)))
+    ]
+    throttle = _Throttle()
+    stats = {'requests': 0, 'pages': 0}
+    concurrency = int(config.get('concurrency', CONCURRENCY))
+    # Pages are written as they arrive. The queue holds at most two per fetching
+    # thread, so a slow writer holds the fetchers back instead of pages piling up.
+    pages = queue.Queue(maxsize=2 * concurrency)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def fetch(url, body, subscription):
+        emit = lambda columns, rows: put(('page', (columns, rows, subscription)))
+        try:
+            put(('done', _fetch_window(http, headers, throttle, url, body, emit, stop)))
+        except BaseException as e:
+            put(('error', e))
+
+    # Pages are fetched concurrently, but only this thread touches the session.
+    batch_size = int(config.get('batch_size', DEFAULT_BATCH_SIZE))
+    with UsageRawWriter(db_session, tenant_id, 'azure', batch_size, integration_id) as writer, \
+            httpx.Client(timeout=float(config.get('timeout', 120))) as http, \
+            ThreadPoolExecutor(max_workers=concurrency) as pool:
+        if integration_id:
+            writer.replace_range(start, today + timedelta(days=1))
+        for job in jobs:
+            pool.submit(fetch, *job)
+        try:
+            remaining = len(jobs)
+            while remaining:
+                # Woken every second so a job past its deadline stops even while
+                # every window is stalled or throttled
+                check_deadline(db_session)
+                try:
+                    kind, value = pages.get(timeout=1)
+                except queue.Empty:
+                    continue
+                if kind == 'error':
+                    raise value
+                if kind == 'done':
+                    stats['requests'] += value
+                    remaining -= 1
+                    continue
+                stats['pages'] += 1
+                for row in _page_rows(*value):
+                    writer.add(row)
+        finally:
+            # Nothing is committed on failure, so the other windows stop fetching.
+            stop.set()
+        watermark['last_date'] = today.isoformat()
+        save_watermark(db_session, integration_id, watermark)
+    # throttled_seconds adds up the pauses of every fetching thread
+    return {**writer.stats(), **stats, 'throttled_seconds': round(throttle.waited, 1)}
@@ -0,0 +1,60 @@
+import importlib
+from importlib.metadata import entry_points
+
+# (provider, integration type) -> "module:function". Modules are imported on
+# first use, so a run that only has AWS integrations never loads the Google or
+# Azure SDKs. The GCP and Azure importers live in each other's file names.
+IMPORTERS = {
+    ('aws', 's3_cur'): 'app.importers.aws_cur_importer:aws_cur_import',
+    ('gcp', 'bq_export'): 'app.importers.azure_cost_importer:gcp_bq_import',
+    ('azure', 'cost_api'): 'app.importers.gcp_bq_importer:azure_cost_import',
+}
+
+# Installed packages can add importers under this entry point group, named
+# "<provider>.<type>"; they are only looked up when a key is not built in.
+ENTRY_POINT_GROUP = 'nukae.importers'
+
+_loaded = {}
+_plugins = None
+
+
+def register_importer(provider: str, integration_type: str, target):
+    # target is an import function or a "module:function" path.
+    IMPORTERS[(provider, integration_type)] = target
+    _loaded.pop((provider, integration_type), None)
+
+
+def _plugin_targets() -> dict:
+    global _plugins
+    if _plugins is None:
+        # Built aside and published whole: worker threads may look plugins up at once.
+        plugins = {}
+        for ep in entry_points(group=ENTRY_POINT_GROUP):
+            provider, _, integration_type = ep.name.partition('.')
+            plugins[(provider, integration_type)] = ep
+        _plugins = plugins
+    return _plugins
+
+
+def _resolve(target):
+    if callable(target):
+        return target
+    if hasattr(target, 'load'):
+        return target.load()
+    module, _, attr = target.partition(':')
+    return getattr(importlib.import_module(module), attr)
+
+
+def get_importer(provider: str, integration_type: str):
+    # Returns the import function for the integration, or None if nothing handles it.
+    key = (provider, integration_type)
+    if key not in _loaded:
+        target = IMPORTERS.get(key) or _plugin_targets().get(key)
+        if target is None:
+            return None
+        _loaded[key] = _resolve(target)
+    return _loaded[key]
+
+
+def supported_integrations():
+    return sorted(set(IMPORTERS) | set(_plugin_targets()))
@@ -0,0 +1,27 @@
+import json
+from sqlalchemy import text
+
+
+def load_watermark(db_session, integration_id) -> dict:
+    if not integration_id:
+        return {}
+    result = db_session.execute(
+        text("SELECT watermark FROM integrations WHERE id = :id"),
+        {'id': integration_id}
+    ).scalar()
+    return result or {}
+
+
+def save_watermark(db_session, integration_id, watermark: dict):
+    # Written in the same transaction as the rows it describes, so a failed
+    # import never advances the watermark past data that was not committed.
+    if not integration_id:
+        return
+    db_session.execute(
+        text("""
+            UPDATE integrations
+            SET watermark = CAST(:watermark AS JSONB), last_imported_at = now()
+            WHERE id = :id
+        """),
+        {'id': integration_id, 'watermark': json.dumps(watermark, default=str)}
+    )
@@ -0,0 +1,123 @@
+"""Local stand-in for the Azure Cost Management query API.
+
+Answers POST <scope>/providers/Microsoft.CostManagement/query with canned,
+deterministic daily rows for the requested timePeriod, split into pages linked
+by nextLink. Every --throttle-every-th request is refused with 429 and the
+Cost Management retry-after headers, to exercise the importer's back-off.
+
+Point an Azure integration at it with config {"endpoint_url": "http://localhost:8099", ...}.
+
+Usage: python scripts/azure_cost_standin.py --port 8099 --page-size 1000 --rows-per-day 500
+"""
+import argparse
+import hashlib
+import json
+import threading
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+SERVICES = ('Virtual Machines', 'Storage', 'Azure SQL Database', 'Azure Functions', 'Bandwidth', 'Azure Monitor')
+CATEGORIES = ('Compute', 'Storage', 'Networking', 'Databases')
+COLUMNS = [
+    {'name': 'Cost', 'type': 'Number'},
+    {'name': 'UsageDate', 'type': 'Number'},
+    {'name': 'ServiceName', 'type': 'String'},
+    {'name': 'MeterCategory', 'type': 'String'},
+    {'name': 'Currency', 'type': 'String'},
+    {'name': 'SubscriptionId', 'type': 'String'},
+]
+
+
+def _rows(scope: str, start: date, end: date, rows_per_day: int):
+    # Same scope and day -> same rows, so repeated imports are comparable.
+    # A subscription scope reports its own id; a billing scope spreads its
+    # rows over three subscriptions.
+    parts = scope.strip('/').split('/')
+    subscription = parts[1] if parts[0].lower() == 'subscriptions' and len(parts) > 1 else None
+    day = start
+    while day <= end:
+        for i in range(rows_per_day):
+            digest = hashlib.md5(f"{scope}|{day}|{i}".encode()).digest()
+            yield [
+                round(int.from_bytes(digest[:4], 'big') / 2 ** 32 * 50, 6),
+                int(day.strftime('%Y%m%d')),
+                f"{SERVICES[digest[4] % len(SERVICES)]} {i}",
+                CATEGORIES[digest[5] % len(CATEGORIES)],
+                'USD',
+                subscription or f"sub-{digest[6] % 3}",
+            ]
+        day += timedelta(days=1)
+
+
+def make_handler(page_size: int, rows_per_day: int, throttle_every: int, retry_after: int):
+    counter = {'requests': 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, body: dict, headers=()):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            with lock:
+                counter['requests'] += 1
+                throttled = throttle_every and counter['requests'] % throttle_every == 0
+            if throttled:
+                return self._send(429, {'error': {'code': '429', 'message': 'Too many requests'}}, [
+                    ('x-ms-ratelimit-microsoft.costmanagement-qpu-retry-after', str(retry_after)),
+                ])
+            url = urlparse(self.path)
+            scope = url.path.split('/providers/')[0]
+            period = body['timePeriod']
+            rows = list(_rows(scope, date.fromisoformat(period['from'][:10]),
+                              date.fromisoformat(period['to'][:10]), rows_per_day))
+            skip = int(parse_qs(url.query).get('$skiptoken', ['0'])[0])
+            page = rows[skip:skip + page_size]
+            next_link = None
+            if skip + page_size < len(rows):
+                host = self.headers.get('Host')
+                next_link = f"http://{host}{url.path}?api-version=2023-03-01&$skiptoken={skip + page_size}"
+            self._send(200, {'properties': {'columns': COLUMNS, 'rows': page, 'nextLink': next_link}})
+
+    return Handler
+
+
+def serve(port: int = 0, page_size: int = 1000, rows_per_day: int = 500, throttle_every: int = 0,
+          retry_after: int = 1) -> ThreadingHTTPServer:
+    # Starts the stand-in on a background thread; port 0 picks a free port.
+    server = ThreadingHTTPServer(
+        ('127.0.0.1', port), make_handler(page_size, rows_per_day, throttle_every, retry_after)
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--rows-per-day', type=int, default=500)
+    parser.add_argument('--throttle-every', type=int, default=0, help="answer every Nth request with 429")
+    parser.add_argument('--retry-after', type=int, default=1)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer(
+        ('127.0.0.1', args.port),
+        make_handler(args.page_size, args.rows_per_day, args.throttle_every, args.retry_after)
+    )
+    print(f"Azure Cost Management stand-in on http://127.0.0.1:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Load-tests the read endpoints and reports p50/p99 latency.
+
+Usage: python scripts/benchmark_api.py --url http://localhost:8000 --clients 200 --requests 50
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import httpx
+
+PATHS = ("/api/dashboard", "/api/dashboards", "/api/folders-and-dashboards", "/api/charts", "/api/saas-licenses")
+
+
+def percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def client_loop(client: httpx.AsyncClient, requests: int, latencies: list, errors: list):
+    for i in range(requests):
+        path = PATHS[i % len(PATHS)]
+        started = time.perf_counter()
+        try:
+            response = await client.get(path)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            errors.append(str(e))
+            continue
+        latencies.append((time.perf_counter() - started) * 1000)
+
+
+async def run(url: str, clients: int, requests: int):
+    latencies, errors = [], []
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(client, requests, latencies, errors) for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+
+    print(f"{len(latencies)} ok / {len(errors)} failed in {elapsed:.1f}s "
+          f"({len(latencies) / elapsed:.0f} req/s, {clients} clients)")
+    if latencies:
+        print(f"p50 {statistics.median(latencies):.1f} ms  "
+              f"p99 {percentile(latencies, 99):.1f} ms  max {max(latencies):.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.clients, args.requests))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Drains a queue of fake import jobs with 1..N worker processes.
+
+Jobs are queued for throwaway integrations whose "import" sleeps for --job-ms
+and records that it ran. For each worker count the script reports jobs/sec and
+the speedup over one worker, and checks every job ran exactly once.
+
+Usage: python scripts/benchmark_import_queue.py --jobs 2000 --workers 1,2,4,8 --slots 4 --job-ms 50
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+
+# Caps are lifted so only the worker count limits throughput; set before the
+# dispatcher module reads them.
+os.environ.setdefault("IMPORT_TENANT_CONCURRENCY", str(2 ** 31 - 1))
+os.environ.setdefault("IMPORT_POLL_SECONDS", "0.2")
+
+from sqlalchemy import text  # noqa: E402
+from app.core.database import SessionLocal  # noqa: E402
+from app.services.import_queue import enqueue_integrations  # noqa: E402
+
+PROVIDER = 'benchmark'
+
+
+def fake_import(integration_id, tenant_id, provider, integration_type, config):
+    time.sleep(config['sleep_ms'] / 1000)
+    db = SessionLocal()
+    try:
+        db.execute(text("INSERT INTO benchmark_import_runs (integration_id) VALUES (:id)"), {'id': integration_id})
+        db.commit()
+    finally:
+        db.close()
+    return {'rows': 0, 'bytes': 0}
+
+
+def worker_process(slots: int):
+    os.environ["IMPORT_MAX_WORKERS"] = str(slots)
+    from app.services.import_dispatcher import run_worker
+    asyncio.run(run_worker(drain=True, runner=fake_import))
+
+
+def seed(db, jobs: int, job_ms: int):
+    tenant_id = db.execute(
+        text("INSERT INTO tenants (name) VALUES ('benchmark-import-queue') RETURNING id")
+    ).scalar()
+    db.execute(
+        text("""
+            INSERT INTO integrations (tenant_id, provider, type, config)
+            SELECT :tenant_id, :provider, 'sleep', jsonb_build_object('sleep_ms', :job_ms)
+            FROM generate_series(1, :jobs)
+        """),
+        {'tenant_id': tenant_id, 'provider': PROVIDER, 'job_ms': job_ms, 'jobs': jobs}
+    )
+    db.execute(text("CREATE UNLOGGED TABLE IF NOT EXISTS benchmark_import_runs (integration_id UUID)"))
+    db.commit()
+    return tenant_id
+
+
+def run(db, tenant_id, workers: int, slots: int) -> dict:
+    db.execute(text("DELETE FROM import_jobs WHERE tenant_id = :t"), {'t': tenant_id})
+    db.execute(text("TRUNCATE benchmark_import_runs"))
+    db.commit()
+    ids = db.execute(text("SELECT id FROM integrations WHERE tenant_id = :t"), {'t': tenant_id}).scalars().all()
+    enqueue_integrations(db, ids)
+
+    ctx = multiprocessing.get_context('spawn')
+    processes = [ctx.Process(target=worker_process, args=(slots,)) for _ in range(workers)]
+    started = time.perf_counter()
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+    elapsed = time.perf_counter() - started
+
+    runs, distinct = db.execute(
+        text("SELECT COUNT(*), COUNT(DISTINCT integration_id) FROM benchmark_import_runs")
+    ).one()
+    succeeded = db.execute(
+        text("SELECT COUNT(*) FROM import_jobs WHERE tenant_id = :t AND status = 'succeeded'"), {'t': tenant_id}
+    ).scalar()
+    return {
+        'seconds': round(elapsed, 2),
+        'jobs_per_sec': round(succeeded / elapsed, 1),
+        'succeeded': succeeded,
+        'duplicate_runs': runs - distinct,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=2000)
+    parser.add_argument('--workers', default='1,2,4,8')
+    parser.add_argument('--slots', type=int, default=4, help="concurrent jobs per worker")
+    parser.add_argument('--job-ms', type=int, default=50)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    tenant_id = seed(db, args.jobs, args.job_ms)
+    results = {}
+    try:
+        for workers in (int(w) for w in args.workers.split(',')):
+            results[workers] = run(db, tenant_id, workers, args.slots)
+            base = results[min(results)]['jobs_per_sec']
+            results[workers]['speedup'] = round(results[workers]['jobs_per_sec'] / base, 2) if base else None
+            print(f"{workers:>3} workers: {results[workers]}")
+    finally:
+        db.rollback()
+        db.execute(text("DELETE FROM tenants WHERE id = :t"), {'t': tenant_id})
+        db.execute(text("DROP TABLE IF EXISTS benchmark_import_runs"))
+        db.commit()
+        db.close()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Times raw -> FOCUS normalization on synthetic cloud_usage_raw rows.
+
+Run from the backend container: python scripts/benchmark_normalizer.py --rows 10000000
+The rows are loaded under a throwaway tenant that is deleted afterwards.
+"""
+import argparse
+import time
+from sqlalchemy import text
+from app.core.database import SessionLocal
+from app.importers.focus_normalizer import normalize_pending
+
+
+def seed(db, rows: int, days: int):
+    tenant_id = db.execute(
+        text("INSERT INTO tenants (name) VALUES ('benchmark-normalizer') RETURNING id")
+    ).scalar()
+    db.execute(
+        text("""
+            INSERT INTO cloud_usage_raw
+                (tenant_id, provider, usage_date, service, resource_id, product_family,
+                 usage_type, usage_quantity, usage_unit, cost, currency, tags)
+            SELECT
+                :tenant_id,
+                (ARRAY['aws', 'gcp', 'azure'])[1 + g % 3],
+                DATE '2024-01-01' + (g % :days),
+                (ARRAY['Amazon EC2', 'Amazon S3', 'Compute Engine', 'Virtual Machines'])[1 + g % 4],
+                'res-' || (g % 50000),
+                (ARRAY['Compute Instance', 'Storage', NULL])[1 + g % 3],
+                'usage-' || (g % 200),
+                (g % 1000) / 10.0,
+                (ARRAY['Hrs', 'seconds', 'GB-Mo', 'Requests'])[1 + g % 4],
+                (g % 10000) / 1000.0,
+                'USD',
+                jsonb_build_object('env', (ARRAY['prod', 'dev', 'staging'])[1 + g % 3])
+            FROM generate_series(1, :rows) AS g
+        """),
+        {'tenant_id': tenant_id, 'rows': rows, 'days': days}
+    )
+    db.execute(
+        text("""
+            INSERT INTO normalization_queue (tenant_id, start_date, end_date)
+            VALUES (:tenant_id, DATE '2024-01-01', DATE '2024-01-01' + :days - 1)
+        """),
+        {'tenant_id': tenant_id, 'days': days}
+    )
+    db.commit()
+    return tenant_id
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--days', type=int, default=90)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    tenant_id = None
+    try:
+        started = time.perf_counter()
+        tenant_id = seed(db, args.rows, args.days)
+        print(f"seeded {args.rows} raw rows in {time.perf_counter() - started:.1f}s")
+
+        stats = normalize_pending(db)
+        print(f"normalized {stats['rows']} rows in {stats['seconds']}s ({stats['rows_per_sec']} rows/s)")
+    finally:
+        if tenant_id is not None:
+            db.execute(text("DELETE FROM tenants WHERE id = :id"), {'id': tenant_id})
+            db.commit()
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Measures cold start of the API worker and the import dispatcher.
+
+Each sample is a fresh interpreter that imports the entry module, so nothing is
+shared between runs. Reports the median and max import time, the total process
+time, and which heavy SDKs the import pulled in (they should all load lazily).
+--importtime also prints the slowest modules from python -X importtime.
+
+Usage: python scripts/benchmark_startup.py --runs 10 --importtime 15
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+TARGETS = {
+    'api': 'app.main',
+    'dispatcher': 'app.services.import_dispatcher',
+}
+
+HEAVY_MODULES = ('boto3', 'botocore', 'google.cloud.bigquery', 'google_auth_oauthlib', 'azure.identity',
+                 'azure.mgmt.costmanagement', 'pyarrow', 'numpy')
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{'seconds': elapsed, 'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def sample(module: str) -> dict:
+    started = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY_MODULES)],
+        capture_output=True, text=True, check=True
+    ).stdout
+    result = json.loads(out.strip().splitlines()[-1])
+    result['process_seconds'] = time.perf_counter() - started
+    return result
+
+
+def slowest_imports(module: str, top: int):
+    # -X importtime writes "import time: self [us] | cumulative | package" lines to stderr
+    err = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                         capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in err.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]), parts[2].rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def bench(module: str, runs: int) -> dict:
+    samples = [sample(module) for _ in range(runs)]
+    imports = [s['seconds'] * 1000 for s in samples]
+    processes = [s['process_seconds'] * 1000 for s in samples]
+    return {
+        'import_p50_ms': round(statistics.median(imports), 1),
+        'import_max_ms': round(max(imports), 1),
+        'process_p50_ms': round(statistics.median(processes), 1),
+        'heavy_modules_loaded': samples[-1]['loaded'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--target', choices=sorted(TARGETS), action='append')
+    parser.add_argument('--importtime', type=int, default=0, help="show the N slowest imports per target")
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.target or sorted(TARGETS):
+        results[name] = bench(TARGETS[name], args.runs)
+        if args.importtime:
+            print(f"slowest imports for {TARGETS[name]} (cumulative us):")
+            for micros, package in slowest_imports(TARGETS[name], args.importtime):
+                print(f"  {micros:>10}  {package}")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,268 @@
+"""Ingestion and query benchmarks against a local Postgres, with JSON results.
+
+Seeds synthetic data (scripts/synthetic_data.py), then measures:
+  - generator throughput per table
+  - AWS CUR importer rows/sec from a local gzipped fixture, and normalization rows/sec
+  - GCP BigQuery importer rows/sec and bytes scanned from a local Parquet export
+  - Azure Cost Management importer rows/sec, pages and throttling against a local stand-in
+  - /api/costs and /api/dashboard latency (needs the API running at --url)
+  - peak resident memory of this process
+
+Results go to --output as JSON keyed by the current git commit; pass --compare
+with an earlier results file to print the change per metric.
+
+Usage: python scripts/benchmark_suite.py --scale 1m --tenants 20 --url http://localhost:8000
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import httpx
+from sqlalchemy import text
+from app.core.database import SessionLocal, engine
+from app.importers.aws_cur_importer import aws_cur_import
+from app.importers.focus_normalizer import normalize_pending
+from app.importers.registry import get_importer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import azure_cost_standin  # noqa: E402
+import synthetic_data  # noqa: E402
+
+# The BigQuery fake is shared with the importer tests
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests'))
+from conftest import LocalBigQuery  # noqa: E402
+
+
+# Serves fixture files from a directory through the two S3 calls the CUR importer makes.
+class LocalS3:
+    def __init__(self, root: str):
+        self.root = root
+
+    def head_object(self, Bucket, Key):
+        stat = os.stat(os.path.join(self.root, Key))
+        return {'ETag': f'"{stat.st_mtime_ns}-{stat.st_size}"'}
+
+    def get_object(self, Bucket, Key):
+        return {'Body': open(os.path.join(self.root, Key), 'rb')}
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def bench_importer(db, tenant_id, rows: int, seed: int) -> dict:
+    with tempfile.TemporaryDirectory() as root:
+        path = synthetic_data.write_cur_fixture(os.path.join(root, 'cur.csv.gz'), rows, seed)
+        fixture_bytes = os.path.getsize(path)
+        stats = aws_cur_import(str(tenant_id), {'bucket': 'local', 'key': 'cur.csv.gz'}, db,
+                               s3_client=LocalS3(root))
+    normalized = normalize_pending(db)
+    return {
+        'import_rows': stats['rows'],
+        'import_rows_per_sec': stats['rows_per_sec'],
+        'fixture_bytes': fixture_bytes,
+        'archived_bytes': stats.get('archived_bytes', 0),
+        'raw_table_bytes': raw_table_bytes(db),
+        'normalize_rows': normalized['rows'],
+        'normalize_rows_per_sec': normalized['rows_per_sec'],
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def bench_gcp_importer(db, tenant_id, rows: int, seed: int) -> dict:
+    import pyarrow.parquet as pq
+    with tempfile.TemporaryDirectory() as root:
+        path = synthetic_data.write_bq_fixture(os.path.join(root, 'billing.parquet'), rows, seed)
+        # Uncompressed size of every column: what SELECT * would have scanned
+        meta = pq.ParquetFile(path).metadata
+        fixture_bytes = sum(meta.row_group(g).total_byte_size for g in range(meta.num_row_groups))
+        gcp_bq_import = get_importer('gcp', 'bq_export')
+        stats = gcp_bq_import(str(tenant_id), {'project_id': 'local', 'dataset': 'billing', 'table': 'export'},
+                              db, bq_client=LocalBigQuery(path))
+    normalized = normalize_pending(db)
+    return {
+        'import_rows': stats['rows'],
+        'import_rows_per_sec': stats['rows_per_sec'],
+        'bytes_scanned': stats['bytes_scanned'],
+        'fixture_bytes_uncompressed': fixture_bytes,
+        'normalize_rows': normalized['rows'],
+        'normalize_rows_per_sec': normalized['rows_per_sec'],
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def bench_azure_importer(db, tenant_id, rows_per_day: int, scopes: int) -> dict:
+    # Month to date for each scope, with one request in 20 throttled.
+    server = azure_cost_standin.serve(rows_per_day=rows_per_day, throttle_every=20)
+    try:
+        azure_cost_import = get_importer('azure', 'cost_api')
+        stats = azure_cost_import(str(tenant_id), {
+            'endpoint_url': f"http://127.0.0.1:{server.server_address[1]}",
+            'scopes': [f"/subscriptions/benchmark-{i}" for i in range(scopes)],
+        }, db)
+    finally:
+        server.shutdown()
+    normalized = normalize_pending(db)
+    return {
+        'import_rows': stats['rows'],
+        'import_rows_per_sec': stats['rows_per_sec'],
+        'requests': stats['requests'],
+        'pages': stats['pages'],
+        'throttled_seconds': stats['throttled_seconds'],
+        'normalize_rows': normalized['rows'],
+        'normalize_rows_per_sec': normalized['rows_per_sec'],
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def raw_table_bytes(db) -> int:
+    # cloud_usage_raw is partitioned; its size is the sum of its partitions (with TOAST and indexes).
+    return db.execute(text(
+        "SELECT COALESCE(SUM(pg_total_relation_size(inhrelid)), 0) FROM pg_inherits "
+        "WHERE inhparent = 'cloud_usage_raw'::regclass"
+    )).scalar()
+
+
+async def _latency(client: httpx.AsyncClient, method: str, path: str, requests: int, concurrency: int, **kwargs):
+    latencies, errors = [], 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+                response.raise_for_status()
+            except httpx.HTTPError:
+                errors += 1
+                return
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(one() for _ in range(requests)))
+    if not latencies:
+        return {'errors': errors}
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(statistics.median(latencies), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+    }
+
+
+async def bench_api(url: str, tenant_id, requests: int, concurrency: int) -> dict:
+    tenant_id = str(tenant_id)
+    async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+        return {
+            'costs_by_service': await _latency(
+                client, 'POST', '/api/costs', requests, concurrency,
+                json={'tenant_id': tenant_id, 'group_by': 'service'}
+            ),
+            'costs_by_day': await _latency(
+                client, 'POST', '/api/costs', requests, concurrency,
+                json={'tenant_id': tenant_id, 'group_by': 'cost_date'}
+            ),
+            'dashboard': await _latency(
+                client, 'GET', '/api/dashboard', requests, concurrency, params={'tenant_id': tenant_id}
+            ),
+        }
+
+
+def _flatten(results: dict, prefix: str = '') -> dict:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(current: dict, baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    before, after = _flatten(baseline['results']), _flatten(current['results'])
+    print(f"\n{baseline['commit']} -> {current['commit']}")
+    for key in sorted(before.keys() & after.keys()):
+        if before[key]:
+            print(f"  {key:55} {before[key]:>14} -> {after[key]:>14}  ({(after[key] / before[key] - 1) * 100:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', default='1m', help=f"row count or one of {', '.join(synthetic_data.SCALES)}")
+    parser.add_argument('--tenants', type=int, default=20)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--import-rows', type=int, default=200000)
+    parser.add_argument('--gcp-import-rows', type=int, default=200000, help="0 skips the BigQuery importer")
+    parser.add_argument('--azure-rows-per-day', type=int, default=2000, help="0 skips the Azure importer")
+    parser.add_argument('--azure-scopes', type=int, default=4)
+    parser.add_argument('--url', default=None, help="API base URL; API latency is skipped without it")
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--compare', default=None, help="earlier results file to diff against")
+    parser.add_argument('--keep', action='store_true', help="leave the synthetic data in place")
+    args = parser.parse_args()
+
+    rows = synthetic_data.SCALES.get(args.scale) or int(args.scale)
+    db = SessionLocal()
+    results = {}
+    try:
+        results['generate'] = synthetic_data.generate(db, rows, args.tenants, args.seed, args.days)
+        # The first synthetic tenant is the largest one (tenant draws are skewed towards it).
+        tenant_id = synthetic_data.tenant_ids(db, args.seed, args.tenants)[0]
+        results['ingest'] = bench_importer(db, tenant_id, args.import_rows, args.seed)
+        if args.gcp_import_rows:
+            results['ingest_gcp'] = bench_gcp_importer(db, tenant_id, args.gcp_import_rows, args.seed)
+        if args.azure_rows_per_day:
+            results['ingest_azure'] = bench_azure_importer(db, tenant_id, args.azure_rows_per_day, args.azure_scopes)
+        if args.url:
+            results['api'] = asyncio.run(bench_api(args.url, tenant_id, args.requests, args.concurrency))
+        results['peak_rss_mb'] = peak_rss_mb()
+    finally:
+        if not args.keep:
+            synthetic_data.drop(db, args.seed, args.tenants)
+        db.close()
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'database': engine.url.render_as_string(hide_password=True),
+        'params': {k: v for k, v in vars(args).items() if k not in ('output', 'compare', 'keep')},
+        'results': results,
+    }
+    output = args.output or os.path.join('benchmark-results', f"{report['commit']}-{args.scale}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    print(json.dumps(results, indent=2, default=str))
+    print(f"results written to {output}")
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == '__main__':
+    main()
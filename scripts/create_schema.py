@@ -0,0 +1,15 @@
+"""Creates any missing tables from the SQLAlchemy models.
+
+db/init.sql builds the schema when the Postgres container is first created;
+this is for databases set up some other way. It used to run on every API
+worker start.
+
+Usage: python scripts/create_schema.py
+"""
+from app.core.database import Base, engine
+import app.models.models  # noqa: F401  (registers the tables on Base.metadata)
+
+
+if __name__ == '__main__':
+    Base.metadata.create_all(bind=engine)
+    print(f"[✅] {len(Base.metadata.tables)} tables checked")
@@ -0,0 +1,343 @@
+"""Deterministic synthetic data for benchmarks.
+
+Fills finops_focus_cost_data, cloud_usage_raw, kubernetes_usage and cloud_metrics
+at a chosen scale. Every value (ids included) is derived from the row number and
+--seed, so two runs with the same arguments produce identical tables.
+
+Usage: python scripts/synthetic_data.py --scale 10m --tenants 50 --seed 1
+       python scripts/synthetic_data.py --seed 1 --tenants 50 --drop
+"""
+import argparse
+import csv
+import gzip
+import random
+import time
+from datetime import date, datetime, timedelta, timezone
+from sqlalchemy import text
+from app.core.database import SessionLocal
+from app.importers.cost_rollup import refresh_rollup
+from app.services.partition_manager import create_partition, month_start
+
+SCALES = {'1m': 1_000_000, '10m': 10_000_000, '100m': 100_000_000}
+
+# Rows per INSERT ... SELECT; each chunk commits on its own
+CHUNK_ROWS = 1_000_000
+
+PROVIDERS = ('aws', 'gcp', 'azure')
+# Same count per provider so a service index can be offset by provider
+SERVICES = (
+    'Amazon EC2', 'Amazon S3', 'Amazon RDS', 'AWS Lambda', 'Amazon CloudFront', 'Amazon DynamoDB',
+    'Amazon EKS', 'Amazon CloudWatch', 'Amazon ElastiCache', 'AWS Data Transfer', 'Amazon SQS', 'Amazon Redshift',
+    'Compute Engine', 'Cloud Storage', 'BigQuery', 'Cloud SQL', 'Cloud Run', 'Kubernetes Engine',
+    'Cloud Logging', 'Cloud Pub/Sub', 'Networking', 'Cloud Functions', 'Memorystore', 'Cloud Spanner',
+    'Virtual Machines', 'Storage', 'Azure SQL Database', 'Azure Functions', 'Azure Kubernetes Service',
+    'Bandwidth', 'Azure Monitor', 'Azure Cosmos DB', 'Azure Cache for Redis', 'Service Bus',
+    'Azure App Service', 'Azure Synapse Analytics',
+)
+SERVICES_PER_PROVIDER = len(SERVICES) // len(PROVIDERS)
+UNITS = ('Hrs', 'GB-Mo', 'Requests', 'seconds')
+ACCOUNTS_PER_TENANT = 6
+CLUSTERS_PER_TENANT = 2
+
+
+# Uniform value in [0, 1) from the row number; salt picks an independent stream
+def _u(salt: int) -> str:
+    return f"(abs(hashtextextended(g::text, {salt} + :seed)) % 1000000) / 1000000.0"
+
+
+TENANT_ID = "md5(:seed || '-t-' || ti)::uuid"
+ACCOUNT_ID = "md5(:seed || '-a-' || ti || '-' || ai)::uuid"
+CLUSTER_ID = "md5(:seed || '-c-' || ti || '-' || ci)::uuid"
+
+# Shared per-row draws. Tenants are skewed (a few large, many small), as in production.
+ROWS = f"""
+    SELECT g,
+           floor(:tenants * power({_u(1)}, 2))::int AS ti,
+           floor({_u(2)} * {ACCOUNTS_PER_TENANT})::int AS ai,
+           floor({_u(3)} * {SERVICES_PER_PROVIDER})::int AS si,
+           {_u(4)} AS u4, {_u(5)} AS u5, {_u(6)} AS u6
+    FROM generate_series(CAST(:first AS bigint), CAST(:last AS bigint)) AS g
+"""
+
+COST_COLUMNS = f"""
+    {TENANT_ID} AS tenant_id,
+    (ARRAY{list(PROVIDERS)})[1 + ai % 3] AS provider,
+    {ACCOUNT_ID} AS account_id,
+    CAST(:start AS date) + (g % :days)::int AS day,
+    (CAST(:services AS text[]))[1 + (ai % 3) * {SERVICES_PER_PROVIDER} + si] AS service,
+    'r-' || ti || '-' || floor(u5 * :resources)::int AS resource_id,
+    (ARRAY['prod', 'staging', 'dev'])[1 + floor(u6 * 3)::int] AS environment,
+    'usage-' || si || '-' || floor(u4 * 20)::int AS usage_type,
+    (ARRAY{list(UNITS)})[1 + floor(u6 * {len(UNITS)})::int] AS unit,
+    round((u5 * 100)::numeric, 4) AS quantity,
+    round((exp(u4 * 8) / 100)::numeric, 6) AS cost,
+    CASE WHEN u6 < 0.2 THEN '{{}}'::jsonb ELSE jsonb_build_object(
+        'env', (ARRAY['prod', 'staging', 'dev'])[1 + floor(u6 * 3)::int],
+        'team', 'team-' || floor(u4 * 30)::int,
+        'app', 'app-' || floor(u5 * 300)::int
+    ) END AS tags
+"""
+
+TABLES = {
+    'finops_focus_cost_data': f"""
+        INSERT INTO finops_focus_cost_data
+            (id, tenant_id, provider, account_id, cost_date, service, resource_id, environment,
+             product_family, usage_type, unit, quantity, cost, currency, tags)
+        SELECT md5(:seed || '-f-' || g)::uuid, tenant_id, provider, account_id, day, service, resource_id,
+               environment, NULL, usage_type, unit, quantity, cost, 'USD', tags
+        FROM (SELECT g, {COST_COLUMNS} FROM ({ROWS}) r) c
+    """,
+    'cloud_usage_raw': f"""
+        INSERT INTO cloud_usage_raw
+            (id, tenant_id, provider, usage_date, account_id, service, resource_id, usage_type,
+             usage_quantity, usage_unit, cost, currency, tags)
+        SELECT md5(:seed || '-u-' || g)::uuid, tenant_id, provider, day, account_id, service, resource_id,
+               usage_type, quantity, unit, cost, 'USD', tags
+        FROM (SELECT g, {COST_COLUMNS} FROM ({ROWS}) r) c
+    """,
+    'kubernetes_usage': f"""
+        INSERT INTO kubernetes_usage
+            (id, cluster_id, namespace, resource_name, resource_type, usage_date,
+             cpu_request, cpu_usage, memory_request, memory_usage)
+        SELECT md5(:seed || '-k-' || g)::uuid,
+               md5(:seed || '-c-' || ti || '-' || (ai % {CLUSTERS_PER_TENANT}))::uuid,
+               'ns-' || floor(u4 * 20)::int,
+               CASE WHEN u6 < 0.05 THEN 'node-' || floor(u5 * 50)::int ELSE 'deploy-' || floor(u5 * 500)::int END,
+               CASE WHEN u6 < 0.05 THEN 'node' ELSE 'pod' END,
+               CAST(:start AS date) + (g % :days)::int,
+               round((CASE WHEN u6 < 0.05 THEN 16 ELSE u4 * 2 END)::numeric, 3),
+               round((u4 * 2 * u5)::numeric, 3),
+               round((CASE WHEN u6 < 0.05 THEN 64 ELSE u5 * 4 END)::numeric, 3),
+               round((u5 * 4 * u6)::numeric, 3)
+        FROM ({ROWS}) r
+    """,
+    'cloud_metrics': f"""
+        INSERT INTO cloud_metrics (id, tenant_id, provider, resource_id, metric_name, metric_value, measured_at)
+        SELECT md5(:seed || '-m-' || g)::uuid, {TENANT_ID}, (ARRAY{list(PROVIDERS)})[1 + ai % 3],
+               'r-' || ti || '-' || floor(u5 * :resources)::int,
+               CASE WHEN g % 2 = 0 THEN 'CPUUtilization' ELSE 'mem_used_percent' END,
+               round((100 * power(u4, 3))::numeric, 2),
+               CAST(:start AS timestamp) + make_interval(hours => (g % (:days * 24))::int)
+        FROM ({ROWS}) r
+    """,
+}
+
+# Rows per table relative to the scale
+TABLE_SHARE = {
+    'finops_focus_cost_data': 1.0,
+    'cloud_usage_raw': 1.0,
+    'kubernetes_usage': 0.1,
+    'cloud_metrics': 0.1,
+}
+
+
+def _params(seed: int, tenants: int, rows: int, start: date, days: int) -> dict:
+    return {
+        'seed': seed, 'tenants': tenants, 'start': start, 'days': days, 'services': list(SERVICES),
+        # About a hundred cost lines per resource over the period
+        'resources': max(100, rows // tenants // 100),
+    }
+
+
+def tenant_ids(db, seed: int, tenants: int):
+    return db.execute(
+        text(f"SELECT {TENANT_ID} FROM generate_series(0, :tenants - 1) AS ti"),
+        {'seed': seed, 'tenants': tenants}
+    ).scalars().all()
+
+
+def create_tenants(db, seed: int, tenants: int):
+    params = {'seed': seed, 'tenants': tenants, 'accounts': ACCOUNTS_PER_TENANT, 'clusters': CLUSTERS_PER_TENANT}
+    db.execute(
+        text(f"""
+            INSERT INTO tenants (id, name)
+            SELECT {TENANT_ID}, 'synthetic-' || :seed || '-' || ti FROM generate_series(0, :tenants - 1) AS ti
+            ON CONFLICT (id) DO NOTHING
+        """),
+        params
+    )
+    db.execute(
+        text(f"""
+            INSERT INTO cloud_accounts (id, tenant_id, provider, account_identifier, name)
+            SELECT {ACCOUNT_ID}, {TENANT_ID}, (ARRAY{list(PROVIDERS)})[1 + ai % 3],
+                   'acct-' || ti || '-' || ai, 'Account ' || ai
+            FROM generate_series(0, :tenants - 1) AS ti, generate_series(0, :accounts - 1) AS ai
+            ON CONFLICT (id) DO NOTHING
+        """),
+        params
+    )
+    db.execute(
+        text(f"""
+            INSERT INTO kubernetes_clusters (id, tenant_id, name, provider)
+            SELECT {CLUSTER_ID}, {TENANT_ID}, 'cluster-' || ti || '-' || ci, (ARRAY{list(PROVIDERS)})[1 + ci % 3]
+            FROM generate_series(0, :tenants - 1) AS ti, generate_series(0, :clusters - 1) AS ci
+            ON CONFLICT (id) DO NOTHING
+        """),
+        params
+    )
+    db.commit()
+
+
+def generate(db, rows: int, tenants: int, seed: int = 1, days: int = 90, end: date = None, tables=None) -> dict:
+    end = end or date.today() - timedelta(days=1)
+    start = end - timedelta(days=days - 1)
+    create_tenants(db, seed, tenants)
+    for table in ('finops_focus_cost_data', 'cloud_usage_raw'):
+        month = month_start(start)
+        while month <= end:
+            create_partition(db, table, month)
+            month = month_start(month, 1)
+    db.commit()
+
+    results = {}
+    for table in tables or TABLES:
+        count = int(rows * TABLE_SHARE[table])
+        started = time.perf_counter()
+        for first in range(1, count + 1, CHUNK_ROWS):
+            params = {**_params(seed, tenants, rows, start, days),
+                      'first': first, 'last': min(first + CHUNK_ROWS - 1, count)}
+            db.execute(text(TABLES[table]), params)
+            db.commit()
+        elapsed = time.perf_counter() - started
+        results[table] = {'rows': count, 'seconds': round(elapsed, 3),
+                          'rows_per_sec': round(count / elapsed, 1) if elapsed else 0.0}
+
+    if tables is None or 'finops_focus_cost_data' in tables:
+        # Dashboards read the rollups, so bring them in line with the generated facts.
+        for tenant_id in tenant_ids(db, seed, tenants):
+            refresh_rollup(db, tenant_id, start, end)
+            db.commit()
+    return results
+
+
+def drop(db, seed: int, tenants: int):
+    # Everything generated hangs off the synthetic tenants (ON DELETE CASCADE).
+    db.execute(text("DELETE FROM tenants WHERE id = ANY(CAST(:ids AS uuid[]))"),
+               {'ids': [str(t) for t in tenant_ids(db, seed, tenants)]})
+    db.commit()
+
+
+CUR_COLUMNS = (
+    'lineItem/UsageStartDate', 'product/ProductName', 'lineItem/ResourceId', 'product/productFamily',
+    'lineItem/UsageType', 'lineItem/UsageAmount', 'pricing/unit', 'lineItem/UnblendedCost',
+    'lineItem/CurrencyCode', 'resourceTags/user:env', 'resourceTags/user:team',
+)
+
+
+def write_cur_fixture(path: str, rows: int, seed: int = 1, days: int = 30, end: date = None):
+    # A gzipped AWS CUR file for importer benchmarks, same seed -> same bytes.
+    rng = random.Random(seed)
+    end = end or date.today() - timedelta(days=1)
+    aws_services = SERVICES[:SERVICES_PER_PROVIDER]
+    with gzip.open(path, 'wt', newline='', compresslevel=6) as f:
+        writer = csv.writer(f)
+        writer.writerow(CUR_COLUMNS)
+        for i in range(rows):
+            day = end - timedelta(days=i % days)
+            writer.writerow((
+                f"{day.isoformat()}T00:00:00Z",
+                aws_services[rng.randrange(len(aws_services))],
+                f"i-{rng.randrange(rows // 100 + 1):08x}",
+                rng.choice(('Compute Instance', 'Storage', 'Data Transfer')),
+                f"usage-{rng.randrange(200)}",
+                f"{rng.random() * 100:.4f}",
+                rng.choice(UNITS),
+                f"{rng.expovariate(1.0):.6f}",
+                'USD',
+                rng.choice(('prod', 'staging', 'dev', '')),
+                f"team-{rng.randrange(30)}",
+            ))
+    return path
+
+
+
+def write_bq_fixture(path: str, rows: int, seed: int = 1, days: int = 28, end: date = None,
+                     row_group_rows: int = 100_000):
+    # A Parquet GCP billing export for importer benchmarks, flattened to the
+    # importer's column aliases. It also carries columns the importer does not
+    # select (credits, invoice, location...) so column pruning shows in the
+    # bytes scanned.
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    rng = random.Random(seed)
+    end = end or date.today() - timedelta(days=1)
+    gcp_services = SERVICES[SERVICES_PER_PROVIDER:2 * SERVICES_PER_PROVIDER]
+    labels_type = pa.list_(pa.struct([('key', pa.string()), ('value', pa.string())]))
+    credits_type = pa.list_(pa.struct([('name', pa.string()), ('amount', pa.float64()), ('type', pa.string())]))
+    schema = pa.schema([
+        ('usage_start_time', pa.timestamp('us', tz='UTC')),
+        ('export_time', pa.timestamp('us', tz='UTC')),
+        ('service_description', pa.string()),
+        ('sku_description', pa.string()),
+        ('resource_name', pa.string()),
+        ('project_id', pa.string()),
+        ('usage_amount', pa.float64()),
+        ('usage_unit', pa.string()),
+        ('cost', pa.float64()),
+        ('currency', pa.string()),
+        ('labels', labels_type),
+        ('credits', credits_type),
+        ('invoice_month', pa.string()),
+        ('location_region', pa.string()),
+        ('cost_type', pa.string()),
+        ('system_labels', labels_type),
+    ])
+    with pq.ParquetWriter(path, schema, compression='zstd') as writer:
+        for first in range(0, rows, row_group_rows):
+            columns = {name: [] for name in schema.names}
+            for i in range(first, min(rows, first + row_group_rows)):
+                day = end - timedelta(days=i % days)
+                started = datetime.combine(day, datetime.min.time(), tzinfo=timezone.utc) \
+                    + timedelta(hours=rng.randrange(24))
+                cost = rng.expovariate(1.0)
+                columns['usage_start_time'].append(started)
+                columns['export_time'].append(started + timedelta(hours=rng.randrange(4, 30)))
+                columns['service_description'].append(gcp_services[rng.randrange(len(gcp_services))])
+                columns['sku_description'].append(f"sku-{rng.randrange(500)}")
+                columns['resource_name'].append(f"projects/p-{rng.randrange(40)}/instances/vm-{rng.randrange(rows // 100 + 1)}")
+                columns['project_id'].append(f"p-{rng.randrange(40)}")
+                columns['usage_amount'].append(rng.random() * 100)
+                columns['usage_unit'].append(rng.choice(UNITS))
+                columns['cost'].append(cost)
+                columns['currency'].append('USD')
+                columns['labels'].append([
+                    {'key': 'env', 'value': rng.choice(('prod', 'staging', 'dev'))},
+                    {'key': 'team', 'value': f"team-{rng.randrange(30)}"},
+                ])
+                columns['credits'].append(
+                    [{'name': 'Sustained use discount', 'amount': -cost * 0.2, 'type': 'SUSTAINED_USAGE_DISCOUNT'}]
+                    if rng.random() < 0.3 else []
+                )
+                columns['invoice_month'].append(f"{day:%Y%m}")
+                columns['location_region'].append(rng.choice(('us-central1', 'europe-west1', 'asia-east1')))
+                columns['cost_type'].append('regular')
+                columns['system_labels'].append([{'key': 'compute.googleapis.com/machine_spec', 'value': 'e2-standard-4'}])
+            writer.write_table(pa.table(columns, schema=schema))
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', default='1m', help=f"row count or one of {', '.join(SCALES)}")
+    parser.add_argument('--tenants', type=int, default=20)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--tables', nargs='*', choices=list(TABLES))
+    parser.add_argument('--drop', action='store_true', help="remove the data generated with this seed")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.drop:
+            drop(db, args.seed, args.tenants)
+            return
+        rows = SCALES.get(args.scale) or int(args.scale)
+        for table, stats in generate(db, rows, args.tenants, args.seed, args.days, tables=args.tables).items():
+            print(f"{table}: {stats['rows']} rows in {stats['seconds']}s ({stats['rows_per_sec']} rows/s)")
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+from app.core.database import SessionLocal
+from app.importers.bulk_writer import CopyWriter
+from datetime import date, timedelta
+from sqlalchemy import text
+import io
+import numpy as np
+import os
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import time
+
+SEASON_DAYS = 7
+# Weeks of same-weekday history behind the expected value, and again behind the
+# spread of past residuals the score is measured against
+BASELINE_WEEKS = int(os.getenv("ANOMALY_BASELINE_WEEKS", "4"))
+Z_THRESHOLD = float(os.getenv("ANOMALY_Z_THRESHOLD", "3.0"))
+# Smallest absolute deviation (in billing currency) worth reporting
+MIN_DEVIATION = float(os.getenv("ANOMALY_MIN_DEVIATION", "10"))
+# Days with cost a series needs in its history before it is scored
+MIN_HISTORY_DAYS = int(os.getenv("ANOMALY_MIN_HISTORY_DAYS", "14"))
+# Days re-scored by a full run
+LOOKBACK_DAYS = int(os.getenv("ANOMALY_LOOKBACK_DAYS", "3"))
+# Series scored per array pass; the cost matrix is only built one chunk at a time, which
+# bounds memory at roughly CHUNK_SERIES x history x 8 bytes per array
+CHUNK_SERIES = int(os.getenv("ANOMALY_CHUNK_SERIES", "200000"))
+
+WINDOW = SEASON_DAYS * BASELINE_WEEKS
+HISTORY_DAYS = 2 * WINDOW
+
+SERIES_COLUMNS = ('tenant_id', 'provider', 'account_id', 'service')
+ANOMALY_COLUMNS = SERIES_COLUMNS + ('cost_date', 'actual_cost', 'expected_cost', 'z_score')
+
+READ_OPTIONS = pa_csv.ConvertOptions(
+    column_types={**{c: pa.string() for c in SERIES_COLUMNS}, 'cost_date': pa.date32(), 'cost': pa.float64()},
+    strings_can_be_null=True
+)
+
+
+def _fetch_series(db_session, ranges) -> pa.Table:
+    # COPY straight into Arrow: one CSV parse for the whole pull instead of a
+    # Python row object per series-day.
+    tenants = list(ranges)
+    params = {
+        'tenants': tenants,
+        'starts': [ranges[t][0] - timedelta(days=HISTORY_DAYS) for t in tenants],
+        'ends': [ranges[t][1] for t in tenants],
+    }
+    cursor = db_session.connection().connection.cursor()
+    try:
+        query = cursor.mogrify(
+            """
+            SELECT r.tenant_id, r.provider, r.account_id, r.service, r.cost_date, SUM(r.cost) AS cost
+            FROM cost_daily_rollup r
+            JOIN unnest(%(tenants)s::uuid[], %(starts)s::date[], %(ends)s::date[]) AS t(tenant_id, start_date, end_date)
+              ON r.tenant_id = t.tenant_id AND r.cost_date BETWEEN t.start_date AND t.end_date
+            GROUP BY r.tenant_id, r.provider, r.account_id, r.service, r.cost_date
+            """,
+            params
+        ).decode()
+        buffer = io.BytesIO()
+        cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", buffer)
+    finally:
+        cursor.close()
+    buffer.seek(0)
+    return pa_csv.read_csv(buffer, convert_options=READ_OPTIONS)
+
+
+def _series_index(table: pa.Table):
+    # Dictionary-encode the series key so every row knows its series number.
+    key = pc.binary_join_element_wise(
+        *(table[c] for c in SERIES_COLUMNS), '|', null_handling='replace', null_replacement=''
+    )
+    encoded = pc.dictionary_encode(key).combine_chunks()
+    series = encoded.indices.to_numpy()
+    _, first_rows = np.unique(series, return_index=True)
+    return series, first_rows
+
+
+def score_matrix(costs: np.ndarray):
+    # costs is series x days; the first HISTORY_DAYS columns are history only.
+    # Expected cost is the mean of the same weekday over the previous weeks; the
+    # score is the residual in units of the previous WINDOW days' residual spread.
+    days = costs.shape[1]
+    expected = sum(
+        costs[:, WINDOW - SEASON_DAYS * k:days - SEASON_DAYS * k] for k in range(1, BASELINE_WEEKS + 1)
+    ) / BASELINE_WEEKS
+    residual = costs[:, WINDOW:] - expected
+
+    zeros = np.zeros((costs.shape[0], 1))
+    sums = np.concatenate([zeros, np.cumsum(residual, axis=1)], axis=1)
+    squares = np.concatenate([zeros, np.cumsum(residual * residual, axis=1)], axis=1)
+    span = residual.shape[1]
+    mean = (sums[:, WINDOW:span] - sums[:, :span - WINDOW]) / WINDOW
+    variance = (squares[:, WINDOW:span] - squares[:, :span - WINDOW]) / WINDOW - mean * mean
+    # The floor keeps perfectly flat series from turning any change into an
+    # infinite score; below MIN_DEVIATION nothing is reported anyway.
+    spread = np.maximum(np.sqrt(np.maximum(variance, 0)), MIN_DEVIATION / Z_THRESHOLD)
+    z = (residual[:, WINDOW:] - mean) / spread
+
+    active = np.concatenate([zeros, np.cumsum(costs != 0, axis=1)], axis=1)
+    history = active[:, HISTORY_DAYS:days] - active[:, :days - HISTORY_DAYS]
+    return expected[:, WINDOW:], z, history
+
+
+def detect_anomalies(db_session, ranges: dict) -> dict:
+    # ranges maps tenant id -> (start, end) of the days to re-score; only those
+    # days' anomalies are replaced.
+    started = time.perf_counter()
+    ranges = {str(t): (start, end) for t, (start, end) in ranges.items()}
+    if not ranges:
+        return {'series': 0, 'anomalies': 0, 'seconds': 0.0}
+    table = _fetch_series(db_session, ranges)
+
+    # The scored days' old anomalies go even when there is nothing left to score.
+    db_session.execute(
+        text("""
+            DELETE FROM cost_anomalies a
+            USING unnest(CAST(:tenants AS uuid[]), CAST(:starts AS date[]), CAST(:ends AS date[]))
+                AS t(tenant_id, start_date, end_date)
+            WHERE a.tenant_id = t.tenant_id AND a.cost_date BETWEEN t.start_date AND t.end_date
+        """),
+        {'tenants': list(ranges), 'starts': [s for s, _ in ranges.values()], 'ends': [e for _, e in ranges.values()]}
+    )
+    if table.num_rows == 0:
+        db_session.commit()
+        return {'series': 0, 'anomalies': 0, 'seconds': round(time.perf_counter() - started, 3)}
+
+    origin = min(start for start, _ in ranges.values()) - timedelta(days=HISTORY_DAYS)
+    days = (max(end for _, end in ranges.values()) - origin).days + 1
+    series, first_rows = _series_index(table)
+    day = pc.cast(table['cost_date'], pa.int32()).to_numpy() - (origin - date(1970, 1, 1)).days
+    cost = table['cost'].to_numpy(zero_copy_only=False)
+
+    # Scored window per series, from its tenant's range
+    keys = {c: table[c].take(pa.array(first_rows)).to_pylist() for c in SERIES_COLUMNS}
+    spans = np.array([
+        [(ranges[t][0] - origin).days, (ranges[t][1] - origin).days] for t in dict.fromkeys(keys['tenant_id'])
+    ]).reshape(-1, 2)
+    tenant_codes = pc.dictionary_encode(pa.array(keys['tenant_id'])).indices.to_numpy()
+    first_day, last_day = spans[tenant_codes, 0], spans[tenant_codes, 1]
+
+    scored_days = np.arange(HISTORY_DAYS, days)
+    with CopyWriter(db_session, 'cost_anomalies', ANOMALY_COLUMNS, autocommit=False) as writer:
+        for chunk in range(0, len(first_rows), CHUNK_SERIES):
+            rows = slice(chunk, chunk + CHUNK_SERIES)
+            # Only this chunk's series are laid out as a series x day matrix.
+            in_chunk = (series >= chunk) & (series < chunk + CHUNK_SERIES)
+            actual = np.zeros((min(CHUNK_SERIES, len(first_rows) - chunk), days))
+            actual[series[in_chunk] - chunk, day[in_chunk]] = cost[in_chunk]
+            expected, z, history = score_matrix(actual)
+            actual = actual[:, HISTORY_DAYS:]
+            flagged = (
+                (np.abs(z) >= Z_THRESHOLD)
+                & (np.abs(actual - expected) >= MIN_DEVIATION)
+                & (history >= MIN_HISTORY_DAYS)
+                & (scored_days >= first_day[rows, None])
+                & (scored_days <= last_day[rows, None])
+            )
+            for i, j in zip(*np.nonzero(flagged)):
+                s = chunk + i
+                writer.add({
+                    **{c: keys[c][s] for c in SERIES_COLUMNS},
+                    'cost_date': origin + timedelta(days=int(scored_days[j])),
+                    'actual_cost': round(float(actual[i, j]), 6),
+                    'expected_cost': round(float(expected[i, j]), 6),
+                    'z_score': round(float(z[i, j]), 3),
+                })
+    return {
+        'series': len(first_rows),
+        'anomalies': writer.rows,
+        'seconds': round(time.perf_counter() - started, 3)
+    }
+
+
+def run_detection(end=None, lookback_days=LOOKBACK_DAYS):
+    end = end or date.today() - timedelta(days=1)
+    start = end - timedelta(days=lookback_days - 1)
+    db = SessionLocal()
+    try:
+        tenants = db.execute(text("SELECT id FROM tenants")).scalars().all()
+        stats = detect_anomalies(db, {t: (start, end) for t in tenants})
+        print(f"[✅] Scored {stats['series']} series in {stats['seconds']}s, {stats['anomalies']} anomalies")
+        return stats
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    run_detection()
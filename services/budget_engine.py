@@ -0,0 +1,126 @@
+from app.core.database import SessionLocal
+from datetime import date
+from sqlalchemy import text
+import time
+
+# Active budgets in scope: running today, optionally limited to some tenants
+ACTIVE = "b.start_date <= :today AND b.end_date >= :today {tenant_filter}"
+
+# Actual and forecast spend for every active budget in one statement. Spend is
+# summed once per distinct (tenant, window, provider, service) from the daily
+# rollup, so budgets sharing a period (the common case) share that work; each
+# budget then adds up the rows any of its items match. A budget without items
+# covers all of its tenant's spend. Forecast extends the run rate to the end date.
+EVALUATE = f"""
+    WITH active AS (
+        SELECT b.id, b.tenant_id, b.start_date, b.end_date, LEAST(b.end_date, :today) AS through,
+               EXISTS (SELECT 1 FROM budget_items i WHERE i.budget_id = b.id) AS scoped
+        FROM budgets b
+        WHERE {ACTIVE}
+    ),
+    windows AS (
+        SELECT DISTINCT tenant_id, start_date, through FROM active
+    ),
+    window_spend AS (
+        SELECT w.tenant_id, w.start_date, w.through, r.provider, r.service, SUM(r.cost) AS cost
+        FROM windows w
+        JOIN cost_daily_rollup r
+          ON r.tenant_id = w.tenant_id AND r.cost_date BETWEEN w.start_date AND w.through
+        GROUP BY w.tenant_id, w.start_date, w.through, r.provider, r.service
+    ),
+    items AS (
+        -- Product items match cost lines billed under the product's name
+        SELECT i.budget_id, i.provider, COALESCE(i.service, p.name) AS service
+        FROM budget_items i
+        LEFT JOIN software_products p ON p.id = i.product_id
+    ),
+    spend AS (
+        SELECT a.id, a.start_date, a.end_date, a.through, COALESCE(SUM(s.cost), 0) AS actual
+        FROM active a
+        LEFT JOIN window_spend s
+          ON s.tenant_id = a.tenant_id AND s.start_date = a.start_date AND s.through = a.through
+         AND (NOT a.scoped OR EXISTS (
+                SELECT 1 FROM items i
+                WHERE i.budget_id = a.id
+                  AND (i.provider IS NULL OR i.provider = s.provider)
+                  AND (i.service IS NULL OR i.service = s.service)
+             ))
+        GROUP BY a.id, a.start_date, a.end_date, a.through
+    )
+    UPDATE budgets b
+    SET actual_spend = s.actual,
+        forecast_spend = s.actual * (s.end_date - s.start_date + 1) / (s.through - s.start_date + 1),
+        evaluated_at = now()
+    FROM spend s
+    WHERE b.id = s.id
+"""
+
+# Spend as a percentage of the budget, by alert type
+PERCENT = """
+    CASE a.alert_type WHEN 'forecast' THEN b.forecast_spend ELSE b.actual_spend END
+    * 100 / NULLIF(b.amount, 0)
+"""
+
+# An alert fires when it is crossed while armed and re-arms once spend falls back
+# below it (e.g. after a restatement). Both only look at budgets this run
+# evaluated: evaluated_at = now() holds for exactly the rows updated in this
+# transaction. The triggered_at IS NULL check is re-read under the row lock, so
+# two concurrent evaluations cannot both fire the same crossing.
+FIRE = f"""
+    WITH fired AS (
+        UPDATE budget_alerts a
+        SET triggered_at = now()
+        FROM budgets b
+        WHERE a.budget_id = b.id AND b.evaluated_at = now()
+          AND a.triggered_at IS NULL AND {PERCENT} >= a.threshold_percent
+        RETURNING a.id, a.budget_id, a.alert_type, a.threshold_percent,
+                  {PERCENT} AS spend_percent,
+                  CASE a.alert_type WHEN 'forecast' THEN b.forecast_spend ELSE b.actual_spend END AS spend
+    )
+    INSERT INTO budget_alert_events (alert_id, budget_id, alert_type, threshold_percent, spend_percent, spend)
+    SELECT id, budget_id, alert_type, threshold_percent, spend_percent, spend FROM fired
+"""
+
+REARM = f"""
+    UPDATE budget_alerts a
+    SET triggered_at = NULL
+    FROM budgets b
+    WHERE a.budget_id = b.id AND b.evaluated_at = now()
+      AND a.triggered_at IS NOT NULL AND COALESCE({PERCENT}, 0) < a.threshold_percent
+"""
+
+
+def evaluate_budgets(db_session, tenant_ids=None, today=None) -> dict:
+    # tenant_ids limits the run to tenants whose costs just changed; None evaluates all.
+    if tenant_ids is not None and not tenant_ids:
+        return {'budgets': 0, 'fired': 0, 'rearmed': 0, 'seconds': 0.0}
+    started = time.perf_counter()
+    tenant_filter = "AND b.tenant_id = ANY(CAST(:tenant_ids AS uuid[]))" if tenant_ids is not None else ""
+    params = {'today': today or date.today(), 'tenant_ids': [str(t) for t in tenant_ids or []]}
+    budgets = db_session.execute(text(EVALUATE.format(tenant_filter=tenant_filter)), params).rowcount
+    fired = db_session.execute(text(FIRE)).rowcount
+    rearmed = db_session.execute(text(REARM)).rowcount
+    db_session.commit()
+    return {
+        'budgets': budgets,
+        'fired': fired,
+        'rearmed': rearmed,
+        'seconds': round(time.perf_counter() - started, 3)
+    }
+
+
+def run_evaluation():
+    db = SessionLocal()
+    try:
+        stats = evaluate_budgets(db)
+        print(f"[✅] Evaluated {stats['budgets']} budgets in {stats['seconds']}s, {stats['fired']} alerts fired")
+        return stats
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    run_evaluation()
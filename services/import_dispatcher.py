@@ -1,32 +1,242 @@
-from app.importers.aws_cur_importer import aws_cur_import
-from app.importers.gcp_bq_importer import gcp_bq_import
-from app.importers.azure_cost_importer import azure_cost_import
-from app.core.db import AsyncSessionLocal
-from sqlalchemy import text
+from app.importers.registry import get_importer
+from app.importers.focus_normalizer import normalize_pending
+from app.services.budget_engine import evaluate_budgets
+from app.services.k8s_allocation import allocate_range, run_allocation
+from app.services.savings_engine import refresh_savings, run_savings
+from app.services.import_queue import (
+    HEARTBEAT_SECONDS, claim_jobs, complete_job, enqueue_integrations, fail_job, heartbeat
+)
+from app.services.partition_manager import run_maintenance
+from app.core.database import DeadlineExceeded, SYNC_POOL_OPTIONS, SessionLocal, engine, set_deadline
+from app.core.metrics import instrument_engine, record_import
+from prometheus_client import REGISTRY, push_to_gateway
+from concurrent.futures import ThreadPoolExecutor
+import argparse
 import asyncio
+import os
+import socket
+import time
 
-async def run_import_jobs():
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(text("SELECT id, type, provider, config FROM integrations"))
-        integrations = result.fetchall()
-
-        for row in integrations:
-            tenant_id = str(row[0])
-            integration_type = row[1]
-            provider = row[2]
-            config = row[3]
-
-            try:
-                if provider == 'aws' and integration_type == 's3_cur':
-                    aws_cur_import(tenant_id, config, session.sync_session)
-                elif provider == 'gcp' and integration_type == 'bq_export':
-                    gcp_bq_import(tenant_id, config, session.sync_session)
-                elif provider == 'azure' and integration_type == 'cost_api':
-                    azure_cost_import(tenant_id, config, session.sync_session)
+# Jobs run at once by one worker process
+MAX_WORKERS = int(os.getenv("IMPORT_MAX_WORKERS", "16"))
+# Enforced inside the job, on its session: see set_deadline
+JOB_TIMEOUT = float(os.getenv("IMPORT_JOB_TIMEOUT", "3600"))
+# How long past JOB_TIMEOUT a job gets to notice its deadline before it is failed
+JOB_GRACE_SECONDS = float(os.getenv("IMPORT_JOB_GRACE_SECONDS", "300"))
+# Running jobs per tenant and per provider, counted across all workers
+TENANT_CONCURRENCY = int(os.getenv("IMPORT_TENANT_CONCURRENCY", "2"))
+# e.g. "aws=8,gcp=8,azure=4"; providers not listed are only bounded per worker by MAX_WORKERS
+PROVIDER_CONCURRENCY = {
+    k.strip(): int(v)
+    for k, v in (p.split("=") for p in os.getenv("IMPORT_PROVIDER_CONCURRENCY", "aws=8,gcp=8,azure=4").split(",") if p)
+}
+UNLIMITED = 2 ** 31 - 1
+# How often an idle worker looks for due jobs
+POLL_SECONDS = float(os.getenv("IMPORT_POLL_SECONDS", "5"))
+# One-shot runs exit when done, so their metrics are pushed rather than scraped
+PUSHGATEWAY_URL = os.getenv("PROMETHEUS_PUSHGATEWAY_URL")
+
+
+class UnsupportedIntegration(LookupError):
+    pass
+
+
+class JobAbandoned(TimeoutError):
+    pass
+
+
+def run_integration(integration_id: str, tenant_id: str, provider: str, integration_type: str, config: dict):
+    # The provider SDK is imported here, by the first job that needs it.
+    importer = get_importer(provider, integration_type)
+    if importer is None:
+        raise UnsupportedIntegration(f"Unsupported integration: {provider} / {integration_type}")
+    # Each job owns its session so a slow or failing import never shares a transaction.
+    db = SessionLocal()
+    set_deadline(db, JOB_TIMEOUT)
+    try:
+        stats = importer(tenant_id, config, db, integration_id)
+        # Only the date ranges this import queued are rewritten in the FOCUS table.
+        normalized = normalize_pending(db, integration_id)
+        print(f"[✅] Normalized {normalized['rows']} FOCUS rows for integration {integration_id} "
+              f"({normalized['rows_per_sec']} rows/s)")
+        # Kubernetes cluster costs are split over workloads again for the days rewritten.
+        for touched_tenant, (start, end) in normalized['touched'].items():
+            allocated = allocate_range(db, start, end, touched_tenant)
+            db.commit()
+            if allocated:
+                print(f"[✅] Allocated Kubernetes costs {start}..{end}: {allocated} rows")
+        # Only budgets of tenants whose costs just changed are re-evaluated.
+        budgets = evaluate_budgets(db, list(normalized['touched']))
+        if budgets['fired']:
+            print(f"[🔔] {budgets['fired']} budget alerts fired for integration {integration_id}")
+        # Only the days this import rewrote are re-scored. Imported here, since it
+        # pulls in numpy and pyarrow.
+        from app.services.anomaly_detection import detect_anomalies
+        anomalies = detect_anomalies(db, normalized['touched'])
+        print(f"[✅] Scored {anomalies['series']} cost series, {anomalies['anomalies']} anomalies")
+        # Recommendations are priced from the costs and allocations just rewritten.
+        for touched_tenant in normalized['touched']:
+            savings = refresh_savings(db, touched_tenant)
+            print(f"[✅] {savings['recommendations']} savings recommendations for tenant {touched_tenant}")
+        return stats
+    finally:
+        db.close()
+
+
+def _timed_out(e: Exception) -> bool:
+    # The job's own deadline, or a statement cancelled by its statement_timeout
+    return isinstance(e, (DeadlineExceeded, JobAbandoned)) or getattr(getattr(e, 'orig', None), 'pgcode', None) == '57014'
+
+
+def _queue_call(fn, *args, **kwargs):
+    db = SessionLocal()
+    try:
+        return fn(db, *args, **kwargs)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def _run_job(loop, pool, control, worker_id, job, runner, stuck):
+    job_id, integration_id, tenant_id, provider, integration_type, config, attempt = job
+    tenant_id = str(tenant_id)
+    started = time.perf_counter()
+    stats, status, error, retry = None, "ok", None, True
+    future = loop.run_in_executor(pool, runner, str(integration_id), tenant_id, provider, integration_type, config)
+    try:
+        # run_integration stops itself at JOB_TIMEOUT: its session refuses to
+        # commit, COPY or run statements past the deadline, and the importers
+        # check it between network reads. A job still running after the grace
+        # period is stuck somewhere none of that reaches. It is failed, so it
+        # can retry and stops holding the caps. Its thread is left to finish
+        # on its own and can no longer write anything.
+        done, _ = await asyncio.wait({future}, timeout=JOB_TIMEOUT)
+        if not done:
+            print(f"[⚠️] Job {job_id} ran past {JOB_TIMEOUT:.0f}s; waiting up to {JOB_GRACE_SECONDS:.0f}s for it to stop")
+            done, _ = await asyncio.wait({future}, timeout=JOB_GRACE_SECONDS)
+        if not done:
+            # Its thread keeps a pool slot until it returns
+            stuck.add(future)
+            future.add_done_callback(stuck.discard)
+            raise JobAbandoned(f"still running {JOB_GRACE_SECONDS:.0f}s after its {JOB_TIMEOUT:.0f}s timeout")
+        stats = await future
+    except Exception as e:
+        status = "timeout" if _timed_out(e) else "error"
+        error = f"{type(e).__name__}: {e}"
+        # Retrying cannot help an integration no importer handles.
+        retry = not isinstance(e, UnsupportedIntegration)
+    elapsed = time.perf_counter() - started
+    record_import(provider, stats, elapsed, status, job={
+        'job_id': job_id, 'integration_id': integration_id, 'tenant_id': tenant_id, 'attempt': attempt,
+    })
+
+    if error is None:
+        if await loop.run_in_executor(control, _queue_call, complete_job, job_id, worker_id, stats):
+            print(f"[✅] Integration {integration_id} ({provider}) for tenant {tenant_id} "
+                  f"finished in {elapsed:.1f}s")
+        else:
+            print(f"[⚠️] Job {job_id} finished after its lease was lost; result not recorded")
+        return
+    outcome = await loop.run_in_executor(
+        control, _queue_call, fail_job, job_id, worker_id, error, retry
+    )
+    if outcome is None:
+        print(f"[⚠️] Job {job_id} failed after its lease was lost: {error}")
+    elif outcome[0] == 'queued':
+        print(f"[🔁] Import for tenant {tenant_id} ({provider}) failed (attempt {attempt}), "
+              f"retrying after {outcome[1]:%H:%M:%S}: {error}")
+    else:
+        print(f"[❌] Import for tenant {tenant_id} ({provider}) failed for good after {attempt} attempts: {error}")
+
+
+async def _heartbeat(loop, control, worker_id, running):
+    while True:
+        await asyncio.sleep(HEARTBEAT_SECONDS)
+        job_ids = list(running)
+        try:
+            renewed = await loop.run_in_executor(control, _queue_call, heartbeat, worker_id, job_ids)
+        except Exception as e:
+            print(f"[⚠️] Lease heartbeat failed: {e}")
+            continue
+        if renewed < len(job_ids):
+            print(f"[⚠️] {len(job_ids) - renewed} of {len(job_ids)} job leases were lost")
+
+
+async def run_worker(worker_id: str = None, drain: bool = False, runner=run_integration):
+    # Claims due jobs whenever it has free slots. Any number of these can run,
+    # on any number of nodes; with drain=True it returns once nothing is due.
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    # Every running job holds a connection, and queue bookkeeping needs one more
+    connections = SYNC_POOL_OPTIONS["pool_size"] + SYNC_POOL_OPTIONS["max_overflow"]
+    if connections < MAX_WORKERS + 1:
+        print(f"[⚠️] DB_POOL_SIZE + DB_MAX_OVERFLOW ({connections}) is below IMPORT_MAX_WORKERS + 1 "
+              f"({MAX_WORKERS + 1}); jobs will wait on the connection pool")
+    loop = asyncio.get_running_loop()
+    running = {}
+    # Threads of jobs failed after the grace period that have not returned yet
+    stuck = set()
+    # Queue bookkeeping gets its own thread so heartbeats never wait behind imports.
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="import") as pool, \
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="import-queue") as control:
+        beat = asyncio.create_task(_heartbeat(loop, control, worker_id, running))
+        try:
+            while True:
+                jobs = await loop.run_in_executor(
+                    control, _queue_call, claim_jobs, worker_id, MAX_WORKERS - len(running) - len(stuck),
+                    TENANT_CONCURRENCY, PROVIDER_CONCURRENCY, UNLIMITED
+                )
+                for job in jobs:
+                    task = asyncio.create_task(_run_job(loop, pool, control, worker_id, job, runner, stuck))
+                    running[job.id] = task
+                    task.add_done_callback(lambda _, job_id=job.id: running.pop(job_id, None))
+                if drain and not jobs and not running:
+                    return
+                if running:
+                    await asyncio.wait(list(running.values()), timeout=POLL_SECONDS,
+                                       return_when=asyncio.FIRST_COMPLETED)
                 else:
-                    print(f"[⚠️] Unsupported integration: {provider} / {integration_type}")
-            except Exception as e:
-                print(f"[❌] Failed to import for tenant {tenant_id}: {e}")
+                    await asyncio.sleep(POLL_SECONDS)
+        finally:
+            beat.cancel()
+
+
+def enqueue_all(priority: int = 0) -> int:
+    # Make sure this month's (and the next ones') partitions exist before loading.
+    run_maintenance()
+    queued = _queue_call(enqueue_integrations, priority=priority)
+    print(f"[✅] Queued {queued} import jobs")
+    return queued
+
+
+async def run_import_jobs():
+    # One-shot run: queue every integration, then work the queue until it is empty.
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, enqueue_all)
+    await run_worker(drain=True)
+    # Imports allocate the days they rewrote; this catches Kubernetes usage that
+    # arrived for recent days without new cost lines.
+    await loop.run_in_executor(None, run_allocation)
+    # Utilization metrics change without any import, so every tenant is refreshed.
+    await loop.run_in_executor(None, run_savings)
+
 
 if __name__ == '__main__':
-    asyncio.run(run_import_jobs())
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--worker', action='store_true', help="run a long-lived worker; nothing is queued")
+    parser.add_argument('--enqueue', action='store_true', help="only queue jobs for all integrations")
+    parser.add_argument('--priority', type=int, default=0)
+    args = parser.parse_args()
+
+    instrument_engine(engine)
+    if args.worker:
+        asyncio.run(run_worker())
+    elif args.enqueue:
+        enqueue_all(args.priority)
+    else:
+        try:
+            asyncio.run(run_import_jobs())
+        finally:
+            if PUSHGATEWAY_URL:
+                push_to_gateway(PUSHGATEWAY_URL, job="import_dispatcher", registry=REGISTRY)
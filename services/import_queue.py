@@ -0,0 +1,172 @@
+from sqlalchemy import text
+import json
+import os
+
+# A claimed job is held for LEASE_SECONDS; the worker running it renews the
+# lease every HEARTBEAT_SECONDS, so a job only expires if its worker died.
+LEASE_SECONDS = int(os.getenv("IMPORT_LEASE_SECONDS", "120"))
+HEARTBEAT_SECONDS = int(os.getenv("IMPORT_HEARTBEAT_SECONDS", "30"))
+MAX_ATTEMPTS = int(os.getenv("IMPORT_MAX_ATTEMPTS", "5"))
+# Retry n waits BACKOFF_BASE * 2^(n-1) seconds (capped, with jitter)
+BACKOFF_BASE_SECONDS = float(os.getenv("IMPORT_BACKOFF_BASE_SECONDS", "60"))
+BACKOFF_MAX_SECONDS = float(os.getenv("IMPORT_BACKOFF_MAX_SECONDS", "3600"))
+# Queued jobs locked per claim before the tenant/provider caps are applied
+CLAIM_SCAN_FACTOR = 4
+
+ENQUEUE = """
+    INSERT INTO import_jobs (tenant_id, integration_id, provider, priority, max_attempts)
+    SELECT tenant_id, id, provider, :priority, :max_attempts
+    FROM integrations
+    WHERE TRUE {scope}
+    ON CONFLICT (integration_id) WHERE status IN ('queued', 'running') DO NOTHING
+"""
+
+# Jobs whose worker stopped heartbeating go back to the queue (or fail, once
+# out of attempts) before anything is claimed.
+EXPIRE = """
+    UPDATE import_jobs
+    SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+        finished_at = CASE WHEN attempts >= max_attempts THEN now() END,
+        last_error = 'lease held by ' || leased_by || ' expired',
+        run_after = now(), leased_by = NULL, lease_expires_at = NULL
+    WHERE status = 'running' AND lease_expires_at < now()
+"""
+
+# SKIP LOCKED keeps a claim from double-claiming rows another transaction has
+# locked. The tenant and provider caps count jobs running anywhere, so claims
+# take CLAIM_LOCK first: two claims racing would otherwise both read the same
+# running counts and together overshoot the caps.
+CLAIM_LOCK = "SELECT pg_advisory_xact_lock(hashtext('import_jobs_claim'))"
+
+CLAIM = """
+    WITH tenant_running AS (
+        SELECT tenant_id, COUNT(*) AS n FROM import_jobs WHERE status = 'running' GROUP BY tenant_id
+    ),
+    provider_running AS (
+        SELECT provider, COUNT(*) AS n FROM import_jobs WHERE status = 'running' GROUP BY provider
+    ),
+    candidates AS (
+        SELECT id, tenant_id, provider, priority, run_after
+        FROM import_jobs
+        WHERE status = 'queued' AND run_after <= now()
+        ORDER BY priority DESC, run_after, id
+        LIMIT :scan
+        FOR UPDATE SKIP LOCKED
+    ),
+    tenant_ranked AS (
+        SELECT c.*, COALESCE(t.n, 0) + ROW_NUMBER() OVER (
+                   PARTITION BY c.tenant_id ORDER BY c.priority DESC, c.run_after, c.id) AS tenant_slot
+        FROM candidates c
+        LEFT JOIN tenant_running t ON t.tenant_id = c.tenant_id
+    ),
+    -- Provider slots are handed out only among jobs within their tenant's cap,
+    -- so a job the tenant cap drops does not use up its provider's room
+    ranked AS (
+        SELECT c.id, c.priority, c.run_after,
+               COALESCE(p.n, 0) + ROW_NUMBER() OVER (
+                   PARTITION BY c.provider ORDER BY c.priority DESC, c.run_after, c.id) AS provider_slot,
+               COALESCE((CAST(:provider_limits AS JSONB) ->> c.provider)::int, :default_provider_limit)
+                   AS provider_limit
+        FROM tenant_ranked c
+        LEFT JOIN provider_running p ON p.provider = c.provider
+        WHERE c.tenant_slot <= :tenant_limit
+    ),
+    picked AS (
+        SELECT id FROM ranked
+        WHERE provider_slot <= provider_limit
+        ORDER BY priority DESC, run_after, id
+        LIMIT :limit
+    )
+    UPDATE import_jobs j
+    SET status = 'running', attempts = j.attempts + 1, leased_by = :worker_id,
+        lease_expires_at = now() + make_interval(secs => :lease), started_at = now(), finished_at = NULL
+    FROM picked, integrations i
+    WHERE j.id = picked.id AND i.id = j.integration_id
+    RETURNING j.id, i.id AS integration_id, i.tenant_id, i.provider, i.type, i.config, j.attempts
+"""
+
+HEARTBEAT = """
+    UPDATE import_jobs
+    SET lease_expires_at = now() + make_interval(secs => :lease)
+    WHERE id = ANY(:job_ids) AND leased_by = :worker_id AND status = 'running'
+"""
+
+# Every transition out of 'running' checks the lease is still ours, so a worker
+# that lost its job (lease expired, someone else claimed it) cannot overwrite
+# the new owner's state.
+COMPLETE = """
+    UPDATE import_jobs
+    SET status = 'succeeded', stats = CAST(:stats AS JSONB), last_error = NULL,
+        finished_at = now(), leased_by = NULL, lease_expires_at = NULL
+    WHERE id = :job_id AND leased_by = :worker_id AND status = 'running'
+"""
+
+FAIL = """
+    UPDATE import_jobs
+    SET status = CASE WHEN NOT :retry OR attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+        finished_at = CASE WHEN NOT :retry OR attempts >= max_attempts THEN now() END,
+        run_after = now() + make_interval(secs => LEAST(:backoff_max, :backoff_base * power(2, attempts - 1))
+                                                  * (0.5 + random() / 2)),
+        last_error = :error, leased_by = NULL, lease_expires_at = NULL
+    WHERE id = :job_id AND leased_by = :worker_id AND status = 'running'
+    RETURNING status, run_after
+"""
+
+
+def enqueue_integrations(db_session, integration_ids=None, priority: int = 0) -> int:
+    # Integrations that already have a queued or running job are skipped.
+    params = {'priority': priority, 'max_attempts': MAX_ATTEMPTS, 'ids': [str(i) for i in integration_ids or []]}
+    scope = "AND id = ANY(CAST(:ids AS UUID[]))" if integration_ids is not None else ""
+    queued = db_session.execute(text(ENQUEUE.format(scope=scope)), params).rowcount
+    db_session.commit()
+    return queued
+
+
+def claim_jobs(db_session, worker_id: str, limit: int, tenant_limit: int, provider_limits: dict,
+               default_provider_limit: int):
+    if limit <= 0:
+        return []
+    # Held until the commit below, i.e. until the claimed jobs show as running
+    db_session.execute(text(CLAIM_LOCK))
+    db_session.execute(text(EXPIRE))
+    jobs = db_session.execute(text(CLAIM), {
+        'worker_id': worker_id,
+        'limit': limit,
+        'scan': limit * CLAIM_SCAN_FACTOR,
+        'lease': LEASE_SECONDS,
+        'tenant_limit': tenant_limit,
+        'provider_limits': json.dumps(provider_limits),
+        'default_provider_limit': default_provider_limit,
+    }).fetchall()
+    db_session.commit()
+    return jobs
+
+
+def heartbeat(db_session, worker_id: str, job_ids) -> int:
+    # Returns how many leases were renewed; fewer than asked means jobs were lost.
+    if not job_ids:
+        return 0
+    renewed = db_session.execute(
+        text(HEARTBEAT), {'job_ids': list(job_ids), 'worker_id': worker_id, 'lease': LEASE_SECONDS}
+    ).rowcount
+    db_session.commit()
+    return renewed
+
+
+def complete_job(db_session, job_id, worker_id: str, stats) -> bool:
+    done = db_session.execute(text(COMPLETE), {
+        'job_id': job_id, 'worker_id': worker_id, 'stats': json.dumps(stats, default=str)
+    }).rowcount
+    db_session.commit()
+    return bool(done)
+
+
+def fail_job(db_session, job_id, worker_id: str, error: str, retry: bool = True):
+    # Returns (status, run_after) - 'queued' with the retry time, or 'failed' -
+    # or None if the lease had already been lost.
+    row = db_session.execute(text(FAIL), {
+        'job_id': job_id, 'worker_id': worker_id, 'error': error[:4000], 'retry': retry,
+        'backoff_base': BACKOFF_BASE_SECONDS, 'backoff_max': BACKOFF_MAX_SECONDS,
+    }).first()
+    db_session.commit()
+    return tuple(row) if row else None
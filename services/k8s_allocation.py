@@ -0,0 +1,187 @@
+from app.core.database import SessionLocal
+from datetime import date, timedelta
+from sqlalchemy import text
+import os
+import time
+
+# Tags that carry the cluster name on node/cluster cost lines (EKS, GKE, AKS, and
+# a generic key for anything labelled by hand). Matched against kubernetes_clusters.name.
+CLUSTER_TAG_KEYS = tuple(
+    k.strip() for k in os.getenv(
+        "K8S_CLUSTER_TAG_KEYS",
+        "kubernetes_cluster,eks:cluster-name,aws:eks:cluster-name,goog-k8s-cluster-name,aks-managed-cluster-name"
+    ).split(",") if k.strip()
+)
+# Share of a cluster's cost priced as CPU; the rest is memory
+CPU_COST_WEIGHT = float(os.getenv("K8S_CPU_COST_WEIGHT", "0.5"))
+# How capacity nobody requested or used is charged:
+#   separate   - kept as an IDLE_NAMESPACE row per cluster-day
+#   distribute - spread over workloads in proportion to their allocation
+#   ignore     - dropped, so allocations sum to less than the cluster cost
+IDLE_MODE = os.getenv("K8S_IDLE_MODE", "separate")
+IDLE_NAMESPACE = "__idle__"
+# Days re-allocated by the nightly run; late cost lines restate recent days
+LOOKBACK_DAYS = int(os.getenv("K8S_ALLOCATION_LOOKBACK_DAYS", "3"))
+
+IDLE_MODES = ("separate", "distribute", "ignore")
+
+# A line names its cluster by the first of CLUSTER_TAG_KEYS it carries, so lines
+# tagged with several (EKS sets both eks: and aws:eks:) are counted once.
+CLUSTER_NAME = "COALESCE(" + ", ".join(f"f.tags->>:tag_key_{i}" for i in range(len(CLUSTER_TAG_KEYS))) + ")"
+
+# One statement per range: every cluster-day's cost, its workloads' max(request,
+# usage) and the node capacity are joined and divided in a single set-based pass.
+# kubernetes_usage holds two kinds of rows per cluster-day (see db/init.sql):
+# workload rows, and node rows (resource_type = 'node') that report each node's
+# allocatable CPU/memory in the request columns. Without node rows capacity is
+# what the workloads claimed, i.e. no idle; allocate_range warns about those days.
+# A cluster-day with cost but no workloads is all idle.
+ALLOCATE = """
+    WITH cluster_cost AS (
+        SELECT c.id AS cluster_id, c.tenant_id, c.provider, f.cost_date, SUM(f.cost) AS cost
+        FROM finops_focus_cost_data f
+        JOIN kubernetes_clusters c ON c.tenant_id = f.tenant_id AND c.name = {cluster_name}
+        WHERE f.tags ?| CAST(:tag_keys AS text[]) AND f.cost_date BETWEEN :start AND :end
+          {tenant_filter}
+        GROUP BY c.id, c.tenant_id, c.provider, f.cost_date
+    ),
+    usage AS (
+        SELECT u.cluster_id, u.usage_date AS cost_date,
+               COALESCE(u.namespace, 'default') AS namespace, u.resource_name AS workload,
+               SUM(GREATEST(COALESCE(u.cpu_request, 0), COALESCE(u.cpu_usage, 0))) AS cpu,
+               SUM(GREATEST(COALESCE(u.memory_request, 0), COALESCE(u.memory_usage, 0))) AS memory
+        FROM kubernetes_usage u
+        JOIN cluster_cost cc ON cc.cluster_id = u.cluster_id AND cc.cost_date = u.usage_date
+        WHERE u.resource_type IS DISTINCT FROM 'node'
+        GROUP BY u.cluster_id, u.usage_date, COALESCE(u.namespace, 'default'), u.resource_name
+    ),
+    capacity AS (
+        SELECT u.cluster_id, u.usage_date AS cost_date,
+               SUM(COALESCE(u.cpu_request, 0)) AS cpu, SUM(COALESCE(u.memory_request, 0)) AS memory
+        FROM kubernetes_usage u
+        JOIN cluster_cost cc ON cc.cluster_id = u.cluster_id AND cc.cost_date = u.usage_date
+        WHERE u.resource_type = 'node'
+        GROUP BY u.cluster_id, u.usage_date
+    ),
+    shares AS (
+        SELECT cc.cluster_id, cc.tenant_id, cc.provider, cc.cost_date,
+               cc.cost * :cpu_weight AS cpu_pool, cc.cost * (1 - :cpu_weight) AS memory_pool,
+               COALESCE(t.cpu, 0) AS cpu_claimed, COALESCE(t.memory, 0) AS memory_claimed,
+               CASE WHEN :idle_mode = 'distribute' THEN COALESCE(t.cpu, 0)
+                    ELSE GREATEST(COALESCE(cap.cpu, 0), COALESCE(t.cpu, 0)) END AS cpu_total,
+               CASE WHEN :idle_mode = 'distribute' THEN COALESCE(t.memory, 0)
+                    ELSE GREATEST(COALESCE(cap.memory, 0), COALESCE(t.memory, 0)) END AS memory_total
+        FROM cluster_cost cc
+        LEFT JOIN (
+            SELECT cluster_id, cost_date, SUM(cpu) AS cpu, SUM(memory) AS memory
+            FROM usage GROUP BY cluster_id, cost_date
+        ) t ON t.cluster_id = cc.cluster_id AND t.cost_date = cc.cost_date
+        LEFT JOIN capacity cap ON cap.cluster_id = cc.cluster_id AND cap.cost_date = cc.cost_date
+    ),
+    allocated AS (
+        SELECT s.tenant_id, s.cluster_id, s.provider, s.cost_date, u.namespace, u.workload,
+               COALESCE(s.cpu_pool * u.cpu / NULLIF(s.cpu_total, 0), 0) AS cpu_cost,
+               COALESCE(s.memory_pool * u.memory / NULLIF(s.memory_total, 0), 0) AS memory_cost
+        FROM shares s
+        JOIN usage u ON u.cluster_id = s.cluster_id AND u.cost_date = s.cost_date
+        UNION ALL
+        SELECT s.tenant_id, s.cluster_id, s.provider, s.cost_date, :idle_namespace, NULL,
+               s.cpu_pool * COALESCE(1 - s.cpu_claimed / NULLIF(s.cpu_total, 0), 1),
+               s.memory_pool * COALESCE(1 - s.memory_claimed / NULLIF(s.memory_total, 0), 1)
+        FROM shares s
+        -- distribute has no workload to spread an empty cluster-day over
+        WHERE :idle_mode = 'separate'
+           OR (:idle_mode = 'distribute' AND s.cpu_claimed = 0 AND s.memory_claimed = 0)
+    )
+    INSERT INTO kubernetes_cost_allocation
+        (tenant_id, cluster_id, provider, cost_date, namespace, workload, cpu_cost, memory_cost, cost)
+    SELECT tenant_id, cluster_id, provider, cost_date, namespace, workload,
+           cpu_cost, memory_cost, cpu_cost + memory_cost
+    FROM allocated
+    WHERE cpu_cost + memory_cost <> 0
+"""
+
+# Cluster-days with workload rows but no node capacity to measure idle against
+MISSING_CAPACITY = """
+    SELECT c.name, MIN(u.usage_date), MAX(u.usage_date), COUNT(DISTINCT u.usage_date)
+    FROM kubernetes_usage u
+    JOIN kubernetes_clusters c ON c.id = u.cluster_id
+    WHERE u.usage_date BETWEEN :start AND :end {tenant_filter}
+      AND NOT EXISTS (
+          SELECT 1 FROM kubernetes_usage n
+          WHERE n.cluster_id = u.cluster_id AND n.usage_date = u.usage_date AND n.resource_type = 'node'
+            AND (n.cpu_request > 0 OR n.memory_request > 0)
+      )
+    GROUP BY c.name
+    ORDER BY c.name
+"""
+
+
+def missing_capacity(db_session, start, end, tenant_id=None) -> list:
+    return db_session.execute(
+        text(MISSING_CAPACITY.format(tenant_filter="AND c.tenant_id = :tenant_id" if tenant_id else "")),
+        {'start': start, 'end': end, 'tenant_id': tenant_id}
+    ).all()
+
+
+def allocate_range(db_session, start, end, tenant_id=None) -> int:
+    if IDLE_MODE not in IDLE_MODES:
+        raise ValueError(f"K8S_IDLE_MODE must be one of {', '.join(IDLE_MODES)}")
+    params = {
+        'start': start, 'end': end, 'tenant_id': tenant_id, 'tag_keys': list(CLUSTER_TAG_KEYS),
+        'cpu_weight': CPU_COST_WEIGHT, 'idle_mode': IDLE_MODE, 'idle_namespace': IDLE_NAMESPACE,
+        **{f'tag_key_{i}': key for i, key in enumerate(CLUSTER_TAG_KEYS)},
+    }
+    # Imports allocate their own tenant while the nightly run may cover all of
+    # them; overlapping runs would each delete, then both insert.
+    if tenant_id:
+        db_session.execute(text("SELECT pg_advisory_xact_lock_shared(hashtext('k8s_allocation'))"))
+        db_session.execute(
+            text("SELECT pg_advisory_xact_lock(hashtext('k8s_allocation:' || :tenant_id))"),
+            {'tenant_id': str(tenant_id)}
+        )
+    else:
+        db_session.execute(text("SELECT pg_advisory_xact_lock(hashtext('k8s_allocation'))"))
+    scope = "cost_date BETWEEN :start AND :end" + (" AND tenant_id = :tenant_id" if tenant_id else "")
+    db_session.execute(text(f"DELETE FROM kubernetes_cost_allocation WHERE {scope}"), params)
+    result = db_session.execute(
+        text(ALLOCATE.format(
+            cluster_name=CLUSTER_NAME, tenant_filter="AND f.tenant_id = :tenant_id" if tenant_id else ""
+        )),
+        params
+    )
+    if IDLE_MODE != 'distribute':
+        for cluster, first, last, days in missing_capacity(db_session, start, end, tenant_id):
+            print(f"[⚠️] Kubernetes cluster {cluster}: {days} day(s) in {first}..{last} have no node rows "
+                  f"with allocatable CPU/memory, so no idle capacity is charged for them")
+    # Allocations are read through the cost query engine, whose cache keys on the generation.
+    db_session.execute(
+        text(f"""
+            UPDATE tenants SET data_generation = data_generation + 1
+            WHERE id IN (SELECT tenant_id FROM kubernetes_clusters)
+            {"AND id = :tenant_id" if tenant_id else ""}
+        """),
+        params
+    )
+    return result.rowcount
+
+
+def run_allocation(end=None, lookback_days=LOOKBACK_DAYS, tenant_id=None):
+    end = end or date.today() - timedelta(days=1)
+    start = end - timedelta(days=lookback_days - 1)
+    db = SessionLocal()
+    started = time.perf_counter()
+    try:
+        rows = allocate_range(db, start, end, tenant_id)
+        db.commit()
+        print(f"[✅] Kubernetes allocation {start}..{end}: {rows} rows in {time.perf_counter() - started:.1f}s")
+        return rows
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    run_allocation()
@@ -0,0 +1,225 @@
+from app.core.database import SessionLocal
+from app.core.raw_archive import COMPRESSION, delete_unreferenced, get_store
+from datetime import date
+from sqlalchemy import text
+import io
+import os
+import re
+
+# Monthly range-partitioned fact tables and their partition key
+PARTITIONED_TABLES = {
+    'cloud_usage_raw': 'usage_date',
+    'finops_focus_cost_data': 'cost_date',
+}
+
+# Composite index each partition is built with before it is attached; must match
+# the parent's index in db/init.sql so ATTACH adopts it instead of building another
+PARTITION_INDEXES = {
+    'cloud_usage_raw': 'tenant_id, usage_date',
+    'finops_focus_cost_data': 'tenant_id, cost_date, id',
+}
+
+MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+MONTHS_BACK = int(os.getenv("PARTITION_MONTHS_BACK", "13"))
+# 0 keeps every month attached. Older months are detached, then written to the
+# archive store (RAW_ARCHIVE_URL) and dropped; with no store they stay detached.
+RETENTION_MONTHS = int(os.getenv("PARTITION_RETENTION_MONTHS", "0"))
+# Rows per archived Parquet file, so a month is never held in memory whole
+ARCHIVE_FILE_ROWS = int(os.getenv("PARTITION_ARCHIVE_FILE_ROWS", "500000"))
+# Hash sub-partitions on tenant_id inside each month (the primary keys include
+# tenant_id for this); 0 disables sub-partitioning
+TENANT_BUCKETS = int(os.getenv("PARTITION_TENANT_BUCKETS", "0"))
+
+
+def month_start(d: date, offset: int = 0) -> date:
+    index = d.year * 12 + d.month - 1 + offset
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_{month:%Y%m}"
+
+
+def _exists(db, name: str) -> bool:
+    return db.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {'name': name}).scalar()
+
+
+def _prepare(db, table: str, name: str, month: date):
+    # The CHECK constraint matches the partition bounds, so ATTACH can skip its
+    # validation scan; the composite index is reused by the parent's index on attach.
+    column = PARTITIONED_TABLES[table]
+    start, end = month_start(month), month_start(month, 1)
+    db.execute(text(f"""
+        ALTER TABLE {name} ADD CONSTRAINT {name}_bounds
+        CHECK ({column} IS NOT NULL AND {column} >= DATE '{start}' AND {column} < DATE '{end}')
+    """))
+    db.execute(text(f"CREATE INDEX IF NOT EXISTS {name}_tenant_date ON {name} ({PARTITION_INDEXES[table]})"))
+
+
+def _attach(db, table: str, name: str, month: date):
+    start, end = month_start(month), month_start(month, 1)
+    db.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')"))
+    db.execute(text(f"ALTER TABLE {name} DROP CONSTRAINT IF EXISTS {name}_bounds"))
+
+
+def create_partition(db, table: str, month: date, tenant_buckets: int = TENANT_BUCKETS) -> bool:
+    name = partition_name(table, month)
+    if _exists(db, name):
+        return False
+    column = PARTITIONED_TABLES[table]
+    start, end = month_start(month), month_start(month, 1)
+    subpartition = " PARTITION BY HASH (tenant_id)" if tenant_buckets else ""
+    db.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS){subpartition}"))
+    for remainder in range(tenant_buckets):
+        db.execute(text(f"""
+            CREATE TABLE {name}_t{remainder} PARTITION OF {name}
+            FOR VALUES WITH (MODULUS {tenant_buckets}, REMAINDER {remainder})
+        """))
+    _prepare(db, table, name, month)
+    # Rows that landed in the default partition before this month existed move
+    # over, otherwise the attach would conflict with them.
+    db.execute(text(f"""
+        WITH moved AS (
+            DELETE FROM {table}_default
+            WHERE {column} >= DATE '{start}' AND {column} < DATE '{end}'
+            RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    """))
+    _attach(db, table, name, month)
+    return True
+
+
+def _by_month(table: str, relnames) -> dict:
+    pattern = re.compile(rf"^{table}_(\d{{4}})(\d{{2}})$")
+    partitions = {}
+    for relname in relnames:
+        match = pattern.match(relname)
+        if match:
+            partitions[date(int(match.group(1)), int(match.group(2)), 1)] = relname
+    return partitions
+
+
+def list_partitions(db, table: str):
+    rows = db.execute(
+        text("""
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            WHERE p.relname = :table
+            ORDER BY c.relname
+        """),
+        {'table': table}
+    ).scalars()
+    return _by_month(table, rows)
+
+
+def list_detached(db, table: str):
+    # Month tables retention detached but has not dropped yet
+    rows = db.execute(
+        text("""
+            SELECT relname FROM pg_class
+            WHERE relname LIKE :prefix AND relkind IN ('r', 'p') AND NOT relispartition
+            ORDER BY relname
+        """),
+        {'prefix': f"{table}\\_%"}
+    ).scalars()
+    return _by_month(table, rows)
+
+
+def _archived_files(db, table: str, name: str):
+    # Raw archive files the partition's rows point at
+    if table != 'cloud_usage_raw':
+        return []
+    return db.execute(text(f"SELECT DISTINCT raw_file FROM {name} WHERE raw_file IS NOT NULL")).scalars().all()
+
+
+def detach_partition(db, table: str, month: date, drop: bool = False) -> str:
+    name = partition_name(table, month)
+    files = _archived_files(db, table, name) if drop else []
+    db.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+    if drop:
+        db.execute(text(f"DROP TABLE {name}"))
+        delete_unreferenced(db, files)
+    return name
+
+
+def archive_key(table: str, month: date, part: int) -> str:
+    return f"retention/{table}/{month:%Y%m}/part-{part:05d}.parquet"
+
+
+def archive_partition(db, table: str, month: date, store) -> int:
+    # Writes a detached month to the store as Parquet, ARCHIVE_FILE_ROWS rows per
+    # file. Like the raw archive, every column is kept as text. Re-running
+    # overwrites the same keys, so a month interrupted halfway is simply redone.
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    name = partition_name(table, month)
+    columns = db.execute(
+        text("""
+            SELECT attname FROM pg_attribute
+            WHERE attrelid = CAST(:name AS regclass) AND attnum > 0 AND NOT attisdropped
+            ORDER BY attnum
+        """),
+        {'name': name}
+    ).scalars().all()
+    result = db.execute(
+        text(f"SELECT {', '.join(f'{c}::text' for c in columns)} FROM {name}"),
+        execution_options={'stream_results': True}
+    )
+    rows = parts = 0
+    for chunk in result.partitions(ARCHIVE_FILE_ROWS):
+        values = list(zip(*chunk))
+        table_data = pa.table({c: pa.array(values[i], type=pa.string()) for i, c in enumerate(columns)})
+        sink = io.BytesIO()
+        pq.write_table(table_data, sink, compression=COMPRESSION)
+        store.put(archive_key(table, month, parts), sink.getvalue())
+        rows += len(chunk)
+        parts += 1
+    return rows
+
+
+def maintain_partitions(db, today: date = None, store=None) -> dict:
+    today = today or date.today()
+    store = store or get_store()
+    created, detached, archived = [], [], []
+    # Never recreate months that retention is about to detach again.
+    months_back = min(MONTHS_BACK, RETENTION_MONTHS) if RETENTION_MONTHS else MONTHS_BACK
+    for table in PARTITIONED_TABLES:
+        for offset in range(-months_back, MONTHS_AHEAD + 1):
+            month = month_start(today, offset)
+            if create_partition(db, table, month):
+                created.append(partition_name(table, month))
+        if RETENTION_MONTHS:
+            cutoff = month_start(today, -RETENTION_MONTHS)
+            for month in list_partitions(db, table):
+                if month < cutoff:
+                    detached.append(detach_partition(db, table, month))
+        db.commit()
+        if RETENTION_MONTHS and store:
+            # Detached months, including any an earlier run left behind, are
+            # dropped once their rows are in the store. The raw archive files
+            # their rows point at are kept with them.
+            for month, name in list_detached(db, table).items():
+                if month < cutoff:
+                    rows = archive_partition(db, table, month, store)
+                    db.execute(text(f"DROP TABLE {name}"))
+                    db.commit()
+                    archived.append((name, rows))
+    return {'created': created, 'detached': detached, 'archived': archived}
+
+
+def run_maintenance():
+    db = SessionLocal()
+    try:
+        result = maintain_partitions(db)
+        print(f"[✅] Partitions created: {len(result['created'])}, detached: {len(result['detached'])}, "
+              f"archived and dropped: {len(result['archived'])}")
+        return result
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    run_maintenance()
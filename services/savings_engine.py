@@ -0,0 +1,215 @@
+from app.core.database import SessionLocal
+from sqlalchemy import text
+import os
+import time
+
+# Utilization metrics per provider naming, with the factor that brings each to percent
+CPU_METRICS = {
+    'CPUUtilization': 1,
+    'Percentage CPU': 1,
+    'cpu_utilization': 1,
+    'compute.googleapis.com/instance/cpu/utilization': 100,
+}
+MEMORY_METRICS = {
+    'mem_used_percent': 1,
+    'MemoryUtilization': 1,
+    'memory_utilization': 1,
+    'agent.googleapis.com/memory/percent_used': 1,
+}
+
+# Days of metric samples and of cost (scaled to a 30-day month) behind a recommendation
+METRIC_DAYS = int(os.getenv("SAVINGS_METRIC_DAYS", "14"))
+COST_DAYS = int(os.getenv("SAVINGS_COST_DAYS", "30"))
+# p95 utilization (percent) at or below which a resource counts as idle
+IDLE_PERCENT = float(os.getenv("SAVINGS_IDLE_PERCENT", "5"))
+# p95 utilization a rightsized resource should run at; each halving of size
+# that still stays under it saves half of what is left
+TARGET_PERCENT = float(os.getenv("SAVINGS_TARGET_PERCENT", "70"))
+MAX_DOWNSIZE_STEPS = int(os.getenv("SAVINGS_MAX_DOWNSIZE_STEPS", "3"))
+# Headroom kept above a workload's p95 usage when suggesting Kubernetes requests
+K8S_HEADROOM = float(os.getenv("SAVINGS_K8S_HEADROOM", "1.2"))
+MIN_MONTHLY_SAVINGS = float(os.getenv("SAVINGS_MIN_MONTHLY", "1"))
+
+
+def _metric_values(metrics: dict, prefix: str):
+    values = ', '.join(f"(:{prefix}_name{i}, :{prefix}_factor{i})" for i in range(len(metrics)))
+    params = {}
+    for i, (name, factor) in enumerate(metrics.items()):
+        params[f'{prefix}_name{i}'] = name
+        params[f'{prefix}_factor{i}'] = factor
+    return f"(VALUES {values}) AS {prefix}(name, factor)", params
+
+
+# Percentiles are computed in Postgres over the raw samples, one grouped pass
+# per run; only the per-resource results come back as rows.
+RESOURCES = """
+    WITH utilization AS (
+        SELECT m.tenant_id, m.provider, m.resource_id,
+               percentile_cont(0.95) WITHIN GROUP (ORDER BY m.metric_value * cpu.factor)
+                   FILTER (WHERE cpu.name IS NOT NULL) AS cpu_p95,
+               percentile_cont(0.95) WITHIN GROUP (ORDER BY m.metric_value * mem.factor)
+                   FILTER (WHERE mem.name IS NOT NULL) AS memory_p95,
+               COUNT(*) AS samples
+        FROM cloud_metrics m
+        LEFT JOIN {cpu_values} ON cpu.name = m.metric_name
+        LEFT JOIN {memory_values} ON mem.name = m.metric_name
+        WHERE m.measured_at >= now() - make_interval(days => :metric_days)
+          AND (cpu.name IS NOT NULL OR mem.name IS NOT NULL)
+          {metric_scope}
+        GROUP BY m.tenant_id, m.provider, m.resource_id
+    ),
+    resource_cost AS (
+        SELECT f.tenant_id, f.resource_id, MAX(f.service) AS service,
+               SUM(f.cost) * 30.0 / :cost_days AS monthly_cost
+        FROM finops_focus_cost_data f
+        JOIN (SELECT DISTINCT tenant_id, resource_id FROM utilization) u
+          ON u.tenant_id = f.tenant_id AND u.resource_id = f.resource_id
+        WHERE f.cost_date > CURRENT_DATE - :cost_days
+        GROUP BY f.tenant_id, f.resource_id
+    ),
+    scored AS (
+        SELECT u.*, c.service, c.monthly_cost,
+               GREATEST(COALESCE(u.cpu_p95, 0), COALESCE(u.memory_p95, 0)) AS peak
+        FROM utilization u
+        JOIN resource_cost c ON c.tenant_id = u.tenant_id AND c.resource_id = u.resource_id
+        WHERE c.monthly_cost > 0 AND u.cpu_p95 IS NOT NULL
+    ),
+    recommended AS (
+        SELECT *,
+               CASE WHEN peak <= :idle_percent THEN 'idle' ELSE 'rightsize' END AS kind,
+               LEAST(FLOOR(LN(:target_percent / GREATEST(peak, 0.01)) / LN(2)), :max_steps) AS steps
+        FROM scored
+    )
+    INSERT INTO savings_recommendations
+        (tenant_id, provider, resource_id, service, kind, cpu_p95, memory_p95, samples,
+         monthly_cost, estimated_monthly_savings, details)
+    SELECT tenant_id, provider, resource_id, service, kind, cpu_p95, memory_p95, samples, monthly_cost,
+           CASE WHEN kind = 'idle' THEN monthly_cost ELSE monthly_cost * (1 - power(0.5, steps)) END,
+           jsonb_build_object('downsize_steps', CASE WHEN kind = 'idle' THEN NULL ELSE steps END)
+    FROM recommended
+    WHERE (kind = 'idle' OR steps >= 1)
+      AND CASE WHEN kind = 'idle' THEN monthly_cost ELSE monthly_cost * (1 - power(0.5, steps)) END
+          >= :min_savings
+"""
+
+# Workloads whose requests sit well above what they use: the allocated cost
+# shrinks with the request, down to p95 usage plus headroom.
+WORKLOADS = """
+    WITH usage AS (
+        SELECT c.tenant_id, c.provider, u.cluster_id, COALESCE(u.namespace, 'default') AS namespace,
+               u.resource_name AS workload,
+               AVG(u.cpu_request) AS cpu_request, AVG(u.memory_request) AS memory_request,
+               percentile_cont(0.95) WITHIN GROUP (ORDER BY u.cpu_usage) AS cpu_p95,
+               percentile_cont(0.95) WITHIN GROUP (ORDER BY u.memory_usage) AS memory_p95,
+               COUNT(*) AS samples
+        FROM kubernetes_usage u
+        JOIN kubernetes_clusters c ON c.id = u.cluster_id
+        WHERE u.usage_date > CURRENT_DATE - :metric_days
+          AND u.resource_type IS DISTINCT FROM 'node'
+          {cluster_scope}
+        GROUP BY c.tenant_id, c.provider, u.cluster_id, COALESCE(u.namespace, 'default'), u.resource_name
+    ),
+    allocated AS (
+        SELECT a.cluster_id, a.namespace, a.workload, SUM(a.cost) * 30.0 / :cost_days AS monthly_cost
+        FROM kubernetes_cost_allocation a
+        WHERE a.cost_date > CURRENT_DATE - :cost_days
+          {allocation_scope}
+        GROUP BY a.cluster_id, a.namespace, a.workload
+    ),
+    needed AS (
+        SELECT u.*, a.monthly_cost,
+               LEAST(1, :headroom * GREATEST(
+                   COALESCE(u.cpu_p95 / NULLIF(u.cpu_request, 0), 0),
+                   COALESCE(u.memory_p95 / NULLIF(u.memory_request, 0), 0)
+               )) AS fraction
+        FROM usage u
+        JOIN allocated a
+          ON a.cluster_id = u.cluster_id AND a.namespace = u.namespace
+         AND a.workload IS NOT DISTINCT FROM u.workload
+        WHERE a.monthly_cost > 0
+    )
+    INSERT INTO savings_recommendations
+        (tenant_id, provider, resource_id, service, kind, cpu_p95, memory_p95, samples,
+         monthly_cost, estimated_monthly_savings, details)
+    SELECT tenant_id, provider, namespace || '/' || COALESCE(workload, ''), 'Kubernetes', 'k8s_requests',
+           cpu_p95, memory_p95, samples, monthly_cost, monthly_cost * (1 - fraction),
+           jsonb_build_object(
+               'cluster_id', cluster_id,
+               'cpu_request', cpu_request, 'suggested_cpu_request', cpu_p95 * :headroom,
+               'memory_request', memory_request, 'suggested_memory_request', memory_p95 * :headroom
+           )
+    FROM needed
+    WHERE monthly_cost * (1 - fraction) >= :min_savings
+"""
+
+SUMMARY = """
+    INSERT INTO savings_summary (tenant_id, estimated_monthly_savings, recommendation_count, generated_at)
+    SELECT t.id, COALESCE(SUM(r.estimated_monthly_savings), 0), COUNT(r.id), now()
+    FROM tenants t
+    LEFT JOIN savings_recommendations r ON r.tenant_id = t.id
+    WHERE TRUE {tenant_scope}
+    GROUP BY t.id
+    ON CONFLICT (tenant_id) DO UPDATE
+    SET estimated_monthly_savings = EXCLUDED.estimated_monthly_savings,
+        recommendation_count = EXCLUDED.recommendation_count,
+        generated_at = EXCLUDED.generated_at
+"""
+
+
+def refresh_savings(db_session, tenant_id=None) -> dict:
+    started = time.perf_counter()
+    cpu_values, cpu_params = _metric_values(CPU_METRICS, 'cpu')
+    memory_values, memory_params = _metric_values(MEMORY_METRICS, 'mem')
+    params = {
+        **cpu_params, **memory_params,
+        'tenant_id': tenant_id, 'metric_days': METRIC_DAYS, 'cost_days': COST_DAYS,
+        'idle_percent': IDLE_PERCENT, 'target_percent': TARGET_PERCENT, 'max_steps': MAX_DOWNSIZE_STEPS,
+        'headroom': K8S_HEADROOM, 'min_savings': MIN_MONTHLY_SAVINGS,
+    }
+    scoped = (lambda column: f"AND {column} = :tenant_id") if tenant_id else (lambda column: "")
+
+    # Imports refresh the tenants they touched while a full run may be refreshing
+    # all of them; overlapping refreshes would each delete, then both insert.
+    if tenant_id:
+        db_session.execute(text("SELECT pg_advisory_xact_lock_shared(hashtext('savings'))"))
+        db_session.execute(
+            text("SELECT pg_advisory_xact_lock(hashtext('savings:' || :tenant_id))"), {'tenant_id': str(tenant_id)}
+        )
+    else:
+        db_session.execute(text("SELECT pg_advisory_xact_lock(hashtext('savings'))"))
+    db_session.execute(text(f"DELETE FROM savings_recommendations WHERE TRUE {scoped('tenant_id')}"), params)
+    resources = db_session.execute(
+        text(RESOURCES.format(cpu_values=cpu_values, memory_values=memory_values, metric_scope=scoped('m.tenant_id'))),
+        params
+    ).rowcount
+    workloads = db_session.execute(
+        text(WORKLOADS.format(cluster_scope=scoped('c.tenant_id'), allocation_scope=scoped('a.tenant_id'))),
+        params
+    ).rowcount
+    db_session.execute(text(SUMMARY.format(tenant_scope=scoped('t.id'))), params)
+    # The dashboard summary is cached by data generation.
+    db_session.execute(
+        text(f"UPDATE tenants SET data_generation = data_generation + 1 WHERE TRUE {scoped('id')}"), params
+    )
+    db_session.commit()
+    return {
+        'recommendations': resources + workloads,
+        'seconds': round(time.perf_counter() - started, 3)
+    }
+
+
+def run_savings():
+    db = SessionLocal()
+    try:
+        stats = refresh_savings(db)
+        print(f"[✅] {stats['recommendations']} savings recommendations in {stats['seconds']}s")
+        return stats
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    run_savings()
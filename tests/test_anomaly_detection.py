@@ -0,0 +1,115 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pyarrow as pa
+import pytest
+
+from app.services import anomaly_detection
+from app.services.anomaly_detection import (
+    HISTORY_DAYS, MIN_DEVIATION, Z_THRESHOLD, _series_index, detect_anomalies, score_matrix
+)
+
+TENANT_ID = '00000000-0000-0000-0000-0000000000d1'
+END = date(2024, 3, 31)
+SCORED = 3
+
+
+def _weekly(days: int, level: float = 100.0) -> np.ndarray:
+    # A weekday/weekend pattern the same-weekday baseline predicts exactly
+    return np.array([level * (0.5 if d % 7 in (5, 6) else 1.0) for d in range(days)])
+
+
+def test_a_spike_scores_far_above_the_threshold_and_only_on_its_day():
+    costs = _weekly(HISTORY_DAYS + SCORED)[None, :]
+    costs[0, -1] += 500
+    expected, z, history = score_matrix(costs)
+
+    assert expected.shape == z.shape == history.shape == (1, SCORED)
+    assert expected[0, -1] == pytest.approx(_weekly(HISTORY_DAYS + SCORED)[-1])
+    assert z[0, -1] >= Z_THRESHOLD
+    assert np.all(np.abs(z[0, :-1]) < Z_THRESHOLD)
+    assert np.all(history == HISTORY_DAYS)
+
+
+def test_a_flat_series_scores_zero_and_small_changes_stay_under_the_floor():
+    costs = np.full((2, HISTORY_DAYS + SCORED), 100.0)
+    # Below MIN_DEVIATION: the spread floor keeps it from scoring as an anomaly
+    costs[1, -1] += MIN_DEVIATION / 2
+    expected, z, history = score_matrix(costs)
+
+    assert np.all(np.isfinite(z))
+    assert np.all(z[0] == 0)
+    assert np.all(expected == 100.0)
+    assert abs(z[1, -1]) < Z_THRESHOLD
+
+
+def test_history_counts_only_days_with_cost():
+    costs = _weekly(HISTORY_DAYS + SCORED)[None, :]
+    costs[0, :HISTORY_DAYS - 5] = 0
+    _, _, history = score_matrix(costs)
+    # Each scored day looks back HISTORY_DAYS days, the window sliding by one
+    assert history[0].tolist() == [5, 6, 7]
+
+
+def test_series_index_numbers_rows_by_key_with_nulls_as_a_value():
+    table = pa.table({
+        'tenant_id': ['t', 't', 't', 'u', 't'],
+        'provider': ['aws', 'aws', 'aws', 'aws', 'gcp'],
+        'account_id': [None, 'a1', None, None, None],
+        'service': ['EC2', 'EC2', 'EC2', 'EC2', 'EC2'],
+    })
+    series, first_rows = _series_index(table)
+    assert series[0] == series[2]
+    assert len(set(series.tolist())) == 4
+    assert first_rows.tolist() == [0, 1, 3, 4]
+
+
+def _history_table(series_count: int, spiking) -> pa.Table:
+    start = END - timedelta(days=HISTORY_DAYS + SCORED - 1)
+    columns = {'tenant_id': [], 'provider': [], 'account_id': [], 'service': [], 'cost_date': [], 'cost': []}
+    for s in range(series_count):
+        costs = _weekly(HISTORY_DAYS + SCORED, level=100.0 + s)
+        if s in spiking:
+            costs[-2] += 1000
+        for d, cost in enumerate(costs):
+            columns['tenant_id'].append(TENANT_ID)
+            columns['provider'].append('aws')
+            columns['account_id'].append(None)
+            columns['service'].append(f"service-{s}")
+            columns['cost_date'].append(start + timedelta(days=d))
+            columns['cost'].append(float(cost))
+    return pa.table({
+        **{c: pa.array(columns[c], pa.string()) for c in anomaly_detection.SERIES_COLUMNS},
+        'cost_date': pa.array(columns['cost_date'], pa.date32()),
+        'cost': pa.array(columns['cost'], pa.float64()),
+    })
+
+
+def _detect(monkeypatch, fake_session, table, chunk_series: int):
+    monkeypatch.setattr(anomaly_detection, '_fetch_series', lambda db, ranges: table)
+    monkeypatch.setattr(anomaly_detection, 'CHUNK_SERIES', chunk_series)
+    db = fake_session()
+    stats = detect_anomalies(db, {TENANT_ID: (END - timedelta(days=SCORED - 1), END)})
+    return stats, db
+
+
+def test_chunked_scoring_finds_the_same_anomalies(monkeypatch, fake_session):
+    table = _history_table(5, spiking={1, 4})
+    whole_stats, whole = _detect(monkeypatch, fake_session, table, chunk_series=1000)
+    # Chunks of 2 leave the last one short, with a spike in it
+    chunked_stats, chunked = _detect(monkeypatch, fake_session, table, chunk_series=2)
+    whole, chunked = whole.copied_rows(), chunked.copied_rows()
+
+    assert whole_stats['series'] == chunked_stats['series'] == 5
+    assert chunked == whole
+    assert [(r['service'], r['cost_date']) for r in chunked] == [
+        ('service-1', str(END - timedelta(days=1))), ('service-4', str(END - timedelta(days=1))),
+    ]
+    assert float(chunked[1]['expected_cost']) == pytest.approx(104.0)
+
+
+def test_an_empty_pull_still_clears_the_scored_days(monkeypatch, fake_session):
+    stats, db = _detect(monkeypatch, fake_session, _history_table(0, spiking=()), chunk_series=2)
+    assert stats['series'] == 0 and db.copied_rows() == []
+    assert any(sql.lstrip().startswith('DELETE FROM cost_anomalies') for sql, _ in db.statements)
+    assert db.commits == 1
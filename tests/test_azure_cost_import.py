@@ -0,0 +1,91 @@
+from datetime import date, timedelta
+
+import httpx
+import pytest
+
+import azure_cost_standin
+from app.core.database import DeadlineExceeded, set_deadline
+from app.importers.gcp_bq_importer import _page_rows, _subscription, azure_cost_import
+
+INTEGRATION_ID = '00000000-0000-0000-0000-0000000000a2'
+TENANT_ID = '00000000-0000-0000-0000-0000000000a1'
+
+
+@pytest.fixture
+def standin():
+    # Pages of 5 rows, with every 4th request refused with 429 and a zero retry-after
+    server = azure_cost_standin.serve(page_size=5, rows_per_day=7, throttle_every=4, retry_after=0)
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def test_import_follows_next_link_and_retries_throttled_requests(standin, fake_session):
+    today = date.today()
+    db = fake_session(watermark={'last_date': str(today - timedelta(days=5))})
+    stats = azure_cost_import(TENANT_ID, {
+        'endpoint_url': standin,
+        'scopes': ['/subscriptions/a', '/subscriptions/b'],
+        'restatement_days': 0,
+        'window_days': 2,
+    }, db, INTEGRATION_ID)
+
+    # 2 scopes x 3 two-day windows x 14 rows, i.e. 3 pages per window
+    assert stats['rows'] == 2 * 6 * 7
+    assert stats['pages'] == 2 * 3 * 3
+    # One request in four is refused, so 18 pages take 23 requests
+    assert stats['requests'] == 23
+
+    rows = db.copied_rows()
+    assert len(rows) == stats['rows']
+    assert {r['usage_date'] for r in rows} == {str(today - timedelta(days=d)) for d in range(6)}
+    assert all(r['currency'] == 'USD' and float(r['cost']) >= 0 for r in rows)
+    assert all(r['service'].rsplit(' ', 1)[0] in azure_cost_standin.SERVICES for r in rows)
+    assert db.watermark == {'last_date': str(today)}
+
+
+def test_columns_are_found_by_name():
+    columns = [
+        {'name': 'currency'}, {'name': 'ServiceName'}, {'name': 'PreTaxCost'}, {'name': 'usagedate'},
+    ]
+    (row,) = _page_rows(columns, [['EUR', 'Storage', '1.5', 20240131]])
+    assert row['usage_date'] == date(2024, 1, 31)
+    assert row['service'] == 'Storage'
+    assert row['cost'] == 1.5
+    assert row['currency'] == 'EUR'
+    assert row['product_family'] is None
+
+
+def test_rows_carry_their_subscription():
+    columns = [{'name': 'UsageDate'}, {'name': 'Cost'}, {'name': 'SubscriptionId'}]
+    (row,) = _page_rows(columns, [[20240131, 1.0, 'sub-1']], _subscription('/subscriptions/sub-0'))
+    assert row['account_identifier'] == 'sub-1'
+    # Without the column, the subscription the query was scoped to
+    (row,) = _page_rows(columns[:2], [[20240131, 1.0]], _subscription('/subscriptions/sub-0/resourceGroups/rg'))
+    assert row['account_identifier'] == 'sub-0'
+    assert _subscription('/providers/Microsoft.Billing/billingAccounts/1234') is None
+
+
+def test_missing_usage_date_column_is_an_error():
+    with pytest.raises(ValueError, match="UsageDate"):
+        list(_page_rows([{'name': 'Cost'}, {'name': 'ServiceName'}], [[1.0, 'Storage']]))
+
+
+def test_a_failed_window_fails_the_import(fake_session):
+    today = date.today()
+    db = fake_session(watermark={'last_date': str(today - timedelta(days=5))})
+    # Nothing listens on the discard port, so every window's first request fails
+    with pytest.raises(httpx.ConnectError):
+        azure_cost_import(TENANT_ID, {
+            'endpoint_url': 'http://127.0.0.1:9', 'scopes': ['/subscriptions/a'], 'window_days': 1, 'timeout': 5,
+        }, db, INTEGRATION_ID)
+    assert db.watermark == {'last_date': str(today - timedelta(days=5))}
+
+
+def test_an_import_past_its_deadline_stops(standin, fake_session):
+    today = date.today()
+    db = fake_session(watermark={'last_date': str(today - timedelta(days=5))})
+    set_deadline(db, 0)
+    with pytest.raises(DeadlineExceeded):
+        azure_cost_import(TENANT_ID, {'endpoint_url': standin, 'scopes': ['/subscriptions/a']}, db, INTEGRATION_ID)
+    assert db.copies == []
+    assert db.watermark == {'last_date': str(today - timedelta(days=5))}
@@ -0,0 +1,120 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+
+from app.importers.bulk_writer import UsageRawWriter
+from app.importers.focus_normalizer import normalize_range
+from app.importers.watermarks import save_watermark
+
+TENANT_ID = '00000000-0000-0000-0000-0000000000c1'
+
+
+def test_autocommit_writer_queues_each_batch_with_its_commit(fake_session):
+    db = fake_session()
+    with UsageRawWriter(db, TENANT_ID, 'aws', batch_size=2) as writer:
+        for day in ('2024-03-05', '2024-03-01', '2024-03-09', '2024-03-02', '2024-03-07'):
+            writer.add({'usage_date': day, 'service': 'EC2', 'cost': 1.0})
+
+    queued = [params for sql, params in db.statements if 'normalization_queue' in sql]
+    assert [(q['start_date'], q['end_date']) for q in queued] == [
+        ('2024-03-01', '2024-03-05'), ('2024-03-02', '2024-03-09'), ('2024-03-07', '2024-03-07'),
+    ]
+    # Three batch commits, then the writer's own on exit
+    assert db.commits == 4
+
+
+def _integration(db):
+    tenant_id = db.execute(text("INSERT INTO tenants (name) VALUES ('writer') RETURNING id")).scalar()
+    integration_id = db.execute(
+        text("INSERT INTO integrations (tenant_id, provider, type, config) VALUES (:t, 'aws', 's3_cur', '{}') RETURNING id"),
+        {'t': tenant_id}
+    ).scalar()
+    db.commit()
+    return str(tenant_id), str(integration_id)
+
+
+def _load(db, tenant_id, integration_id, days, cost, replace=None, fail_after=None):
+    with UsageRawWriter(db, tenant_id, 'aws', batch_size=2, integration_id=integration_id) as writer:
+        if replace is not None:
+            writer.replace_range(*replace)
+        for i, day in enumerate(days):
+            if i == fail_after:
+                raise RuntimeError("connection reset")
+            writer.add({'usage_date': day, 'service': 'EC2', 'cost': cost})
+        save_watermark(db, integration_id, {'cost': cost})
+
+
+def _visible(db, tenant_id, integration_id):
+    # What normalization reads, by day
+    normalize_range(db, tenant_id, integration_id, date(2024, 3, 1), date(2024, 3, 31))
+    rows = db.execute(text("""
+        SELECT cost_date, SUM(cost) FROM finops_focus_cost_data GROUP BY cost_date ORDER BY cost_date
+    """)).all()
+    db.rollback()
+    return {str(day): float(cost) for day, cost in rows}
+
+
+def test_loads_commit_per_batch_but_replace_their_range_atomically(pg_session):
+    db = pg_session
+    tenant_id, integration_id = _integration(db)
+    _load(db, tenant_id, integration_id, ['2024-03-01', '2024-03-02', '2024-03-03'], 1.0,
+          replace=(date(2024, 3, 1), date(2024, 4, 1)))
+    assert _visible(db, tenant_id, integration_id) == {'2024-03-01': 1.0, '2024-03-02': 1.0, '2024-03-03': 1.0}
+
+    # A restatement fails after two batches were committed
+    with pytest.raises(RuntimeError):
+        _load(db, tenant_id, integration_id, ['2024-03-02', '2024-03-03', '2024-03-04', '2024-03-05', '2024-03-06'],
+              5.0, replace=(date(2024, 3, 2), date(2024, 4, 1)), fail_after=4)
+    counts = dict(db.execute(text("SELECT load_generation, COUNT(*) FROM cloud_usage_raw GROUP BY 1")).all())
+    assert counts == {1: 3, 2: 4}
+    # ...and none of it is read: the old rows, the watermark and the generation stand
+    assert _visible(db, tenant_id, integration_id) == {'2024-03-01': 1.0, '2024-03-02': 1.0, '2024-03-03': 1.0}
+    assert db.execute(text("SELECT watermark, load_generation FROM integrations")).one() == ({'cost': 1.0}, 1)
+
+    # The retry clears the failed load's rows, then swaps the range in one commit
+    _load(db, tenant_id, integration_id, ['2024-03-02', '2024-03-04'], 7.0,
+          replace=(date(2024, 3, 2), date(2024, 4, 1)))
+    counts = dict(db.execute(text("SELECT load_generation, COUNT(*) FROM cloud_usage_raw GROUP BY 1")).all())
+    assert counts == {1: 1, 2: 2}
+    assert _visible(db, tenant_id, integration_id) == {'2024-03-01': 1.0, '2024-03-02': 7.0, '2024-03-04': 7.0}
+    assert db.execute(text("SELECT watermark, load_generation FROM integrations")).one() == ({'cost': 7.0}, 2)
+    queued = db.execute(text("SELECT start_date, end_date FROM normalization_queue ORDER BY id")).all()
+    assert [(str(s), str(e)) for s, e in queued] == [('2024-03-01', '2024-03-31'), ('2024-03-02', '2024-03-31')]
+
+
+def test_unbounded_replacement_drops_every_older_row(pg_session):
+    db = pg_session
+    tenant_id, integration_id = _integration(db)
+    _load(db, tenant_id, integration_id, ['2024-02-10', '2024-03-01'], 1.0, replace=())
+    _load(db, tenant_id, integration_id, ['2024-03-05'], 2.0, replace=())
+    assert db.execute(text("SELECT usage_date, load_generation FROM cloud_usage_raw")).all() == [
+        (date(2024, 3, 5), 2)
+    ]
+    # The dropped rows' days are re-normalized as well
+    queued = db.execute(text("SELECT start_date, end_date FROM normalization_queue ORDER BY id DESC LIMIT 1")).one()
+    assert (str(queued[0]), str(queued[1])) == ('2024-02-10', '2024-03-05')
+
+
+def test_rows_are_linked_to_one_account_per_provider_identifier(pg_session):
+    db = pg_session
+    tenant_id, _ = _integration(db)
+    existing = db.execute(
+        text("""
+            INSERT INTO cloud_accounts (tenant_id, provider, account_identifier, name)
+            VALUES (:t, 'aws', '111', 'prod') RETURNING id
+        """),
+        {'t': tenant_id}
+    ).scalar()
+    db.commit()
+    with UsageRawWriter(db, tenant_id, 'aws', batch_size=2) as writer:
+        for account in ('111', '222', None, '222'):
+            writer.add({'usage_date': '2024-03-01', 'cost': 1.0, 'account_identifier': account})
+        writer.add_columns({'usage_date': ['2024-03-02'] * 2, 'cost': [1.0, 1.0], 'account_identifier': ['333', '111']})
+
+    rows = db.execute(text("""
+        SELECT a.account_identifier, r.account_id = :existing, COUNT(*) FROM cloud_usage_raw r
+        LEFT JOIN cloud_accounts a ON a.id = r.account_id GROUP BY 1, 2 ORDER BY 1
+    """), {'existing': existing}).all()
+    assert rows == [('111', True, 2), ('222', False, 2), ('333', False, 1), (None, None, 1)]
+    assert db.execute(text("SELECT COUNT(*) FROM cloud_accounts")).scalar() == 3
@@ -0,0 +1,98 @@
+from datetime import date
+from uuid import UUID
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+from app.schemas.schemas import CostQuery
+from app.services.cost_query import OTHER, UNTAGGED, compile_cost_query
+
+TENANT_ID = UUID('00000000-0000-0000-0000-0000000000e1')
+
+
+def _sql(**query) -> str:
+    statement, _ = compile_cost_query(CostQuery(tenant_id=TENANT_ID, **query))
+    return str(statement.compile(dialect=postgresql.dialect()))
+
+
+@pytest.mark.parametrize("dimension", ["tenant_id", "cost; DROP TABLE tenants", "tags"])
+def test_dimensions_outside_the_whitelist_are_rejected(dimension):
+    with pytest.raises(HTTPException) as error:
+        _sql(dimensions=["service", dimension])
+    assert error.value.status_code == 400
+    assert dimension in error.value.detail
+
+
+def test_kubernetes_dimensions_do_not_mix_with_billing_ones():
+    with pytest.raises(HTTPException) as error:
+        _sql(dimensions=["namespace", "service"])
+    assert error.value.status_code == 400
+    assert "FROM kubernetes_cost_allocation" in _sql(dimensions=["provider", "namespace"])
+
+
+def test_the_narrowest_table_that_has_the_dimensions_is_read():
+    assert "FROM cost_daily_rollup" in _sql(dimensions=["provider", "service"])
+    assert "FROM cost_tag_rollup" in _sql(dimensions=["tag:env"], tags={"env": "prod"})
+    assert "FROM finops_focus_cost_data" in _sql(dimensions=["resource_id"])
+    # Filtering on a tag not grouped by needs the fact table's tags
+    assert "FROM finops_focus_cost_data" in _sql(dimensions=["service"], tags={"team": "a"})
+
+
+def test_keys_are_grouped_by_position():
+    sql = _sql(dimensions=["resource_id", "tag:env"], granularity="week")
+    # period, resource_id and the tag expression, whose bound key would not match textually
+    assert "GROUP BY 1, 2, 3" in sql
+    statement, columns = compile_cost_query(
+        CostQuery(tenant_id=TENANT_ID, dimensions=["service", "service"], granularity="day")
+    )
+    assert columns == ["period", "service", "cost"]
+
+
+def _seed(db):
+    db.execute(text("INSERT INTO tenants (id, name) VALUES (:id, 'cost-query')"), {'id': TENANT_ID})
+    daily = [('EC2', 50), ('S3', 30), ('RDS', 10), ('Lambda', 3), ('SQS', 2)]
+    for day in (1, 2):
+        for service, cost in daily:
+            db.execute(
+                text("""
+                    INSERT INTO cost_daily_rollup (tenant_id, provider, service, cost_date, cost, row_count)
+                    VALUES (:t, 'aws', :s, :d, :c, 1)
+                """),
+                {'t': TENANT_ID, 's': service, 'd': date(2024, 5, day), 'c': cost}
+            )
+    for service, value, cost in [('EC2', 'prod', 40), ('S3', 'dev', 5)]:
+        db.execute(
+            text("""
+                INSERT INTO cost_tag_rollup (tenant_id, tag_key, tag_value, provider, service, cost_date, cost, row_count)
+                VALUES (:t, 'env', :v, 'aws', :s, :d, :c, 1)
+            """),
+            {'t': TENANT_ID, 'v': value, 's': service, 'd': date(2024, 5, 1), 'c': cost}
+        )
+    db.commit()
+
+
+def _run(db, **query):
+    statement, columns = compile_cost_query(CostQuery(tenant_id=TENANT_ID, **query))
+    return [dict(zip(columns, row)) for row in db.execute(statement)]
+
+
+def test_top_n_folds_the_rest_into_other(pg_session):
+    _seed(pg_session)
+    rows = _run(pg_session, dimensions=["service"], top_n=2)
+    assert [(r['service'], float(r['cost'])) for r in rows] == [('EC2', 100), ('S3', 60), (OTHER, 30)]
+
+    # Ranking is over the whole range, so every period has the same series
+    rows = _run(pg_session, dimensions=["service"], top_n=2, granularity="day", sort="dimension")
+    assert [(r['period'].day, r['service'], float(r['cost'])) for r in rows] == [
+        (1, 'EC2', 50), (1, OTHER, 15), (1, 'S3', 30), (2, 'EC2', 50), (2, OTHER, 15), (2, 'S3', 30),
+    ]
+
+
+def test_tag_groups_include_the_untagged_remainder(pg_session):
+    _seed(pg_session)
+    rows = _run(pg_session, dimensions=["tag:env"], end_date=date(2024, 5, 1))
+    assert {r['tag:env']: float(r['cost']) for r in rows} == {'prod': 40, 'dev': 5, UNTAGGED: 50}
+    rows = _run(pg_session, dimensions=["tag:env"], tags={"env": "prod"})
+    assert [(r['tag:env'], float(r['cost'])) for r in rows] == [('prod', 40)]
@@ -0,0 +1,102 @@
+import asyncio
+from datetime import date
+from uuid import UUID
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.services import dashboard_data
+from app.services.dashboard_data import compile_group, widget_spec
+
+TENANT_ID = UUID('00000000-0000-0000-0000-0000000000f1')
+
+
+def test_widget_fields_map_to_dimensions_and_the_rest_is_reported():
+    spec = widget_spec(0, {
+        'id': 'w1',
+        'fields': ['week', 'service_name', 'cost', 'service', 'pg_sleep(10)'],
+        'filters': [
+            {'field': 'provider', 'operator': 'equals', 'value': 'aws'},
+            {'field': 'provider', 'operator': 'regex', 'value': '.*'},
+            {'field': 'date', 'operator': 'greater_than', 'value': '2024-05-01T00:00:00'},
+            {'field': 'date', 'operator': 'greater_than', 'value': 'yesterday'},
+        ],
+        'sortBy': 'service_name', 'sortDirection': 'asc',
+    }, [{'field': 'account_id', 'operator': 'not_equals', 'value': 'x'}], {})
+
+    assert spec['columns'] == ['period_week', 'service']
+    assert spec['filters'] == (
+        ('account_id', 'not_equals', 'x'), ('cost_date', 'greater_than', '2024-05-01'), ('provider', 'equals', 'aws'),
+    )
+    assert spec['unsupported'] == ['pg_sleep(10)', 'filter:provider:regex', 'filter:date:greater_than']
+    assert spec['rollup'] is True
+    assert (spec['sort_by'], spec['descending']) == ('service', False)
+
+
+def test_widgets_fall_back_to_their_charts_fields_and_leave_the_rollup_when_needed():
+    spec = widget_spec(3, {'chartId': 'c1'}, [], {'c1': ['month', 'resource_id', 'cost']})
+    assert spec['id'] == '3'
+    assert spec['columns'] == ['period_month', 'resource_id']
+    assert spec['rollup'] is False
+    # A filter on a dimension the rollup lacks also needs the fact table
+    spec = widget_spec(0, {'fields': ['service'], 'filters': [{'field': 'usage_type', 'value': 'x'}]}, [], {})
+    assert spec['rollup'] is False
+
+
+def _specs(*widgets):
+    return [widget_spec(i, {'id': name, 'fields': fields}, [], {}) for i, (name, fields) in enumerate(widgets)]
+
+
+def test_grouping_masks_mark_the_columns_each_set_leaves_out():
+    specs = _specs(
+        ('trend', ['day', 'service']), ('by_service', ['service']), ('by_provider', ['provider']),
+        ('same', ['service']), ('total', ['cost']),
+    )
+    statement, names, masks = compile_group(specs, TENANT_ID, None, None)
+    assert names == ['period_day', 'service', 'provider']
+    # Bit i (from the left) is set when names[i] is not in the set
+    assert masks == {('period_day', 'service'): 0b001, ('service',): 0b101, ('provider',): 0b110, (): 0b111}
+
+
+def _seed(db):
+    db.execute(text("INSERT INTO tenants (id, name) VALUES (:id, 'dashboards')"), {'id': TENANT_ID})
+    rows = [('aws', 'EC2', 1, 10), ('aws', 'EC2', 2, 20), ('aws', 'S3', 1, 5), ('gcp', 'BigQuery', 2, 7)]
+    for provider, service, day, cost in rows:
+        db.execute(
+            text("""
+                INSERT INTO cost_daily_rollup (tenant_id, provider, service, cost_date, cost, row_count)
+                VALUES (:t, :p, :s, :d, :c, 1)
+            """),
+            {'t': TENANT_ID, 'p': provider, 's': service, 'd': date(2024, 5, day), 'c': cost}
+        )
+    db.commit()
+
+
+def test_one_scan_answers_every_widget_in_the_group(pg_engine, pg_session, monkeypatch):
+    _seed(pg_session)
+    engine = create_async_engine(pg_engine.url.set(drivername='postgresql+asyncpg'))
+    monkeypatch.setattr(dashboard_data, 'AsyncSessionLocal', async_sessionmaker(engine))
+    specs = _specs(
+        ('trend', ['day', 'service']), ('by_service', ['service']), ('by_provider', ['provider']), ('total', ['cost']),
+    )
+    specs[1]['sort_by'], specs[1]['descending'] = 'service', False
+
+    async def evaluate():
+        try:
+            return await dashboard_data.evaluate_widgets(specs, TENANT_ID, end_date=date(2024, 5, 31))
+        finally:
+            await engine.dispose()
+
+    result = asyncio.run(evaluate())
+    assert result['queries'] == 1
+    widgets = result['widgets']
+    trend = widgets['trend']['data']
+    # Time series come back in period order; within a period the order is the database's
+    assert trend['period'] == sorted(trend['period'])
+    assert sorted(zip(trend['period'], trend['service'], trend['cost'])) == [
+        ('2024-05-01', 'EC2', 10.0), ('2024-05-01', 'S3', 5.0), ('2024-05-02', 'BigQuery', 7.0),
+        ('2024-05-02', 'EC2', 20.0),
+    ]
+    assert widgets['by_service']['data'] == {'service': ['BigQuery', 'EC2', 'S3'], 'cost': [7.0, 30.0, 5.0]}
+    assert widgets['by_provider']['data'] == {'provider': ['aws', 'gcp'], 'cost': [35.0, 7.0]}
+    assert widgets['total']['data'] == {'cost': [42.0]}
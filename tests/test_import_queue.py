@@ -0,0 +1,270 @@
+import asyncio
+import threading
+import time
+from collections import Counter
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from app.services import import_dispatcher, import_queue
+from app.services.import_queue import claim_jobs, complete_job, enqueue_integrations, fail_job
+
+UNLIMITED = 2 ** 31 - 1
+
+
+def _seed(db, integrations: dict) -> dict:
+    # integrations: tenant name -> [provider, ...]; returns integration id -> tenant name
+    owners = {}
+    for tenant, providers in integrations.items():
+        tenant_id = db.execute(text("INSERT INTO tenants (name) VALUES (:n) RETURNING id"), {'n': tenant}).scalar()
+        for provider in providers:
+            integration_id = db.execute(
+                text("""
+                    INSERT INTO integrations (tenant_id, provider, type, config)
+                    VALUES (:t, :p, 'fake', '{}') RETURNING id
+                """),
+                {'t': tenant_id, 'p': provider}
+            ).scalar()
+            owners[str(integration_id)] = tenant
+    db.commit()
+    return owners
+
+
+def _running(db) -> dict:
+    rows = db.execute(text("""
+        SELECT t.name, j.provider, COUNT(*) FROM import_jobs j JOIN tenants t ON t.id = j.tenant_id
+        WHERE j.status = 'running' GROUP BY t.name, j.provider
+    """)).all()
+    return {(name, provider): n for name, provider, n in rows}
+
+
+def test_claims_respect_tenant_and_provider_caps_across_workers(pg_session):
+    db = pg_session
+    owners = _seed(db, {'a': ['aws'] * 6, 'b': ['azure'] * 6, 'c': ['aws'] * 2})
+    assert enqueue_integrations(db) == 14
+    # Queuing again adds nothing while the jobs are still queued
+    assert enqueue_integrations(db) == 0
+
+    first = claim_jobs(db, 'w1', 10, 2, {'azure': 1}, UNLIMITED)
+    assert len(first) == 5
+    assert _running(db) == {('a', 'aws'): 2, ('b', 'azure'): 1, ('c', 'aws'): 2}
+    # The caps count what other workers hold
+    assert claim_jobs(db, 'w2', 10, 2, {'azure': 1}, UNLIMITED) == []
+
+    # A provider cap binds across tenants: tenant a has room again, aws does not
+    a_jobs = [j for j in first if owners[str(j.integration_id)] == 'a']
+    c_jobs = [j for j in first if owners[str(j.integration_id)] == 'c']
+    assert complete_job(db, a_jobs[0].id, 'w1', {'rows': 1})
+    assert claim_jobs(db, 'w2', 10, 2, {'aws': 3, 'azure': 1}, UNLIMITED) == []
+    assert complete_job(db, c_jobs[0].id, 'w1', {})
+    (second,) = claim_jobs(db, 'w2', 10, 2, {'aws': 3, 'azure': 1}, UNLIMITED)
+    assert owners[str(second.integration_id)] == 'a'
+    # Only the lease holder can finish a job
+    assert not complete_job(db, second.id, 'w1', {})
+    assert complete_job(db, second.id, 'w2', {})
+
+
+def test_a_capped_tenant_does_not_use_up_its_providers_room(pg_session):
+    db = pg_session
+    owners = _seed(db, {'a': ['aws'] * 6, 'c': ['aws'] * 2})
+    enqueue_integrations(db)
+    # Jobs from a queued first would take every aws slot if they were ranked
+    # before the tenant cap drops them
+    db.execute(text("""
+        UPDATE import_jobs j SET priority = 1 FROM tenants t
+        WHERE t.id = j.tenant_id AND t.name = 'a'
+    """))
+    db.commit()
+    claimed = claim_jobs(db, 'w1', 10, 1, {'aws': 3}, UNLIMITED)
+    assert sorted(owners[str(j.integration_id)] for j in claimed) == ['a', 'c']
+
+
+def test_expired_leases_requeue_and_failures_back_off(pg_session, monkeypatch):
+    db = pg_session
+    _seed(db, {'a': ['aws']})
+    enqueue_integrations(db)
+    (job,) = claim_jobs(db, 'w1', 1, UNLIMITED, {}, UNLIMITED)
+    assert job.attempts == 1
+
+    # The worker died: once its lease runs out the job is claimable again
+    db.execute(text("UPDATE import_jobs SET lease_expires_at = now() - interval '1 second'"))
+    db.commit()
+    (again,) = claim_jobs(db, 'w2', 1, UNLIMITED, {}, UNLIMITED)
+    assert again.id == job.id and again.attempts == 2
+    # The old holder no longer owns it
+    assert fail_job(db, job.id, 'w1', 'late') is None
+
+    # Retry n waits base * 2^(n-1), jittered down to half of it
+    status, run_after = fail_job(db, job.id, 'w2', 'boom')
+    db_now = db.execute(text("SELECT now()::timestamp")).scalar()
+    assert status == 'queued'
+    wait = (run_after - db_now).total_seconds()
+    backoff = import_queue.BACKOFF_BASE_SECONDS * 2
+    assert backoff / 2 - 1 <= wait <= backoff + 1
+    # Not claimable before run_after
+    assert claim_jobs(db, 'w2', 1, UNLIMITED, {}, UNLIMITED) == []
+
+    db.execute(text("UPDATE import_jobs SET run_after = now()"))
+    db.commit()
+    (third,) = claim_jobs(db, 'w3', 1, UNLIMITED, {}, UNLIMITED)
+    status, _ = fail_job(db, third.id, 'w3', 'unsupported', retry=False)
+    assert status == 'failed'
+
+
+def test_out_of_attempts_fails_for_good(pg_session):
+    db = pg_session
+    _seed(db, {'a': ['aws']})
+    enqueue_integrations(db)
+    db.execute(text("UPDATE import_jobs SET max_attempts = 1"))
+    db.commit()
+    (job,) = claim_jobs(db, 'w1', 1, UNLIMITED, {}, UNLIMITED)
+    assert fail_job(db, job.id, 'w1', 'boom')[0] == 'failed'
+    # An expired lease on the last attempt fails too, rather than requeuing
+    enqueue_integrations(db)
+    db.execute(text("UPDATE import_jobs SET max_attempts = 1 WHERE status = 'queued'"))
+    db.commit()
+    claim_jobs(db, 'w1', 1, UNLIMITED, {}, UNLIMITED)
+    db.execute(text("UPDATE import_jobs SET lease_expires_at = now() - interval '1 second' WHERE status = 'running'"))
+    db.commit()
+    assert claim_jobs(db, 'w2', 1, UNLIMITED, {}, UNLIMITED) == []
+    assert db.execute(text("SELECT COUNT(*) FROM import_jobs WHERE status = 'failed'")).scalar() == 2
+
+
+def test_concurrent_workers_run_every_job_exactly_once_within_the_caps(pg_engine, monkeypatch):
+    Session = sessionmaker(bind=pg_engine, autoflush=False)
+    db = Session()
+    owners = _seed(db, {f"t{i}": ['aws', 'aws', 'gcp', 'azure', 'azure'] * 4 for i in range(6)})
+    enqueue_integrations(db)
+
+    monkeypatch.setattr(import_dispatcher, 'SessionLocal', Session)
+    monkeypatch.setattr(import_dispatcher, 'MAX_WORKERS', 4)
+    monkeypatch.setattr(import_dispatcher, 'TENANT_CONCURRENCY', 2)
+    monkeypatch.setattr(import_dispatcher, 'PROVIDER_CONCURRENCY', {'azure': 3})
+    monkeypatch.setattr(import_dispatcher, 'POLL_SECONDS', 0.02)
+    monkeypatch.setattr(import_dispatcher, 'record_import', lambda *args, **kwargs: None)
+
+    lock = threading.Lock()
+    runs = Counter()
+    active = Counter()
+    peak = Counter()
+
+    def runner(integration_id, tenant_id, provider, integration_type, config):
+        keys = (('tenant', owners[integration_id]), ('provider', provider))
+        with lock:
+            runs[integration_id] += 1
+            for key in keys:
+                active[key] += 1
+                peak[key] = max(peak[key], active[key])
+        time.sleep(0.01)
+        with lock:
+            for key in keys:
+                active[key] -= 1
+        return {'rows': 0}
+
+    def worker(n):
+        asyncio.run(import_dispatcher.run_worker(f"w{n}", drain=True, runner=runner))
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(5)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=120)
+    elapsed = time.perf_counter() - started
+
+    assert not any(t.is_alive() for t in threads)
+    assert set(runs) == set(owners) and set(runs.values()) == {1}
+    assert max(n for (kind, _), n in peak.items() if kind == 'tenant') <= 2
+    assert peak[('provider', 'azure')] <= 3
+    statuses = dict(db.execute(text("SELECT status, COUNT(*) FROM import_jobs GROUP BY status")).all())
+    assert statuses == {'succeeded': len(owners)}
+    print(f"{len(owners)} jobs on 5 workers in {elapsed:.2f}s")
+    db.close()
+
+
+def test_a_job_stuck_past_its_grace_period_is_failed_and_retried_later(pg_engine, monkeypatch):
+    Session = sessionmaker(bind=pg_engine, autoflush=False)
+    db = Session()
+    _seed(db, {'a': ['aws']})
+    enqueue_integrations(db)
+    monkeypatch.setattr(import_dispatcher, 'SessionLocal', Session)
+    monkeypatch.setattr(import_dispatcher, 'JOB_TIMEOUT', 0.1)
+    monkeypatch.setattr(import_dispatcher, 'JOB_GRACE_SECONDS', 0.1)
+    monkeypatch.setattr(import_dispatcher, 'POLL_SECONDS', 0.02)
+    monkeypatch.setattr(import_dispatcher, 'record_import', lambda *args, **kwargs: None)
+
+    # Blocked somewhere no deadline check reaches, until the test lets it go
+    release = threading.Event()
+    calls = []
+
+    def runner(*args):
+        calls.append(args)
+        release.wait(30)
+        return {'rows': 0}
+
+    timer = threading.Timer(1.0, release.set)
+    timer.start()
+    started = time.perf_counter()
+    asyncio.run(import_dispatcher.run_worker('w1', drain=True, runner=runner))
+    timer.cancel()
+
+    status, attempts, error, leased_by = db.execute(
+        text("SELECT status, attempts, last_error, leased_by FROM import_jobs")
+    ).one()
+    assert len(calls) == 1
+    assert (status, attempts, leased_by) == ('queued', 1, None)
+    assert error.startswith('JobAbandoned: still running')
+    # The worker only returned once the stuck thread did
+    assert time.perf_counter() - started >= 1.0
+    db.close()
+
+
+def test_an_import_reallocates_and_reprices_what_it_rewrote(pg_engine, monkeypatch):
+    from datetime import date, timedelta
+    from app.importers.bulk_writer import UsageRawWriter
+    Session = sessionmaker(bind=pg_engine, autoflush=False)
+    db = Session()
+    owners = _seed(db, {'a': ['aws']})
+    (integration_id,) = owners
+    tenant_id = db.execute(text("SELECT id FROM tenants")).scalar()
+    cluster_id = db.execute(
+        text("INSERT INTO kubernetes_clusters (tenant_id, name, provider) VALUES (:t, 'prod', 'aws') RETURNING id"),
+        {'t': tenant_id}
+    ).scalar()
+    db.execute(
+        text("""
+            INSERT INTO kubernetes_usage (cluster_id, namespace, resource_name, usage_date, cpu_request, memory_request)
+            VALUES (:c, 'apps', 'api', '2024-03-01', 1, 1)
+        """),
+        {'c': cluster_id}
+    )
+    # An instance idle for the whole metric window
+    db.execute(
+        text("""
+            INSERT INTO cloud_metrics (tenant_id, provider, resource_id, metric_name, metric_value, measured_at)
+            SELECT :t, 'aws', 'i-idle', 'CPUUtilization', 1, now() - make_interval(hours => h)
+            FROM generate_series(1, 24) h
+        """),
+        {'t': tenant_id}
+    )
+    db.commit()
+
+    yesterday = date.today() - timedelta(days=1)
+
+    def importer(tenant_id, config, session, integration_id):
+        with UsageRawWriter(session, tenant_id, 'aws', integration_id=integration_id) as writer:
+            writer.replace_range()
+            writer.add({'usage_date': '2024-03-01', 'service': 'EC2', 'cost': 40.0,
+                        'tags': {'eks:cluster-name': 'prod'}})
+            writer.add({'usage_date': str(yesterday), 'service': 'EC2', 'resource_id': 'i-idle', 'cost': 3.0})
+        return writer.stats()
+
+    monkeypatch.setattr(import_dispatcher, 'get_importer', lambda provider, integration_type: importer)
+    monkeypatch.setattr(import_dispatcher, 'SessionLocal', Session)
+    import_dispatcher.run_integration(integration_id, str(tenant_id), 'aws', 'fake', {})
+
+    allocated = db.execute(text("SELECT namespace, workload, cost FROM kubernetes_cost_allocation")).all()
+    assert [(namespace, workload, float(cost)) for namespace, workload, cost in allocated] == [('apps', 'api', 40.0)]
+    recommendation = db.execute(text("SELECT resource_id, kind FROM savings_recommendations")).one()
+    assert tuple(recommendation) == ('i-idle', 'idle')
+    assert db.execute(text("SELECT recommendation_count FROM savings_summary")).scalar() == 1
+    db.close()
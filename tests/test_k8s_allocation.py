@@ -0,0 +1,70 @@
+from datetime import date
+
+from sqlalchemy import text
+
+from app.services import k8s_allocation
+from app.services.k8s_allocation import IDLE_NAMESPACE, allocate_range
+
+DAY = date(2024, 3, 1)
+
+
+def _cluster(db, name: str = 'prod'):
+    tenant_id = db.execute(text("INSERT INTO tenants (name) VALUES ('k8s') RETURNING id")).scalar()
+    cluster_id = db.execute(
+        text("INSERT INTO kubernetes_clusters (tenant_id, name, provider) VALUES (:t, :n, 'aws') RETURNING id"),
+        {'t': tenant_id, 'n': name}
+    ).scalar()
+    db.execute(
+        text("""
+            INSERT INTO finops_focus_cost_data (tenant_id, provider, cost_date, service, cost, tags)
+            VALUES (:t, 'aws', :d, 'EC2', 100, CAST(:tags AS jsonb))
+        """),
+        {'t': tenant_id, 'd': DAY, 'tags': f'{{"eks:cluster-name": "{name}"}}'}
+    )
+    return tenant_id, cluster_id
+
+
+def _usage(db, cluster_id, name, kind, cpu, memory):
+    db.execute(
+        text("""
+            INSERT INTO kubernetes_usage (cluster_id, namespace, resource_name, resource_type, usage_date,
+                                          cpu_request, cpu_usage, memory_request, memory_usage)
+            VALUES (:c, 'apps', :n, :k, :d, :cpu, :cpu, :mem, :mem)
+        """),
+        {'c': cluster_id, 'n': name, 'k': kind, 'd': DAY, 'cpu': cpu, 'mem': memory}
+    )
+
+
+def _allocation(db) -> dict:
+    rows = db.execute(text("SELECT namespace, workload, cost FROM kubernetes_cost_allocation")).all()
+    return {(namespace, workload): round(float(cost), 6) for namespace, workload, cost in rows}
+
+
+def test_node_rows_give_the_capacity_left_over_as_idle(pg_session, capsys, monkeypatch):
+    monkeypatch.setattr(k8s_allocation, 'IDLE_MODE', 'separate')
+    db = pg_session
+    tenant_id, cluster_id = _cluster(db)
+    _usage(db, cluster_id, 'api', 'pod', cpu=2, memory=4)
+    _usage(db, cluster_id, 'node-1', 'node', cpu=8, memory=16)
+    db.commit()
+
+    assert allocate_range(db, DAY, DAY, tenant_id) == 2
+    # A quarter of both CPU and memory is claimed
+    assert _allocation(db) == {('apps', 'api'): 25.0, (IDLE_NAMESPACE, None): 75.0}
+    assert "no node rows" not in capsys.readouterr().out
+
+
+def test_days_without_node_rows_are_reported(pg_session, capsys, monkeypatch):
+    monkeypatch.setattr(k8s_allocation, 'IDLE_MODE', 'separate')
+    db = pg_session
+    tenant_id, cluster_id = _cluster(db, 'staging')
+    _usage(db, cluster_id, 'api', 'pod', cpu=2, memory=4)
+    # A node row without allocatable capacity counts as missing
+    _usage(db, cluster_id, 'node-1', 'node', cpu=None, memory=None)
+    db.commit()
+
+    allocate_range(db, DAY, DAY, tenant_id)
+    assert _allocation(db) == {('apps', 'api'): 100.0}
+    assert "[⚠️] Kubernetes cluster staging: 1 day(s) in 2024-03-01..2024-03-01 have no node rows" in (
+        capsys.readouterr().out
+    )
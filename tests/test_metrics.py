@@ -0,0 +1,51 @@
+import logging
+
+from fastapi import APIRouter, Depends, FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from app.core import metrics
+from app.core.metrics import add_metrics, record_import, request_tenant
+
+
+def _count(route: str, status: str) -> float:
+    labels = {'method': 'GET', 'route': route, 'status': status}
+    return REGISTRY.get_sample_value('http_request_duration_seconds_count', labels) or 0
+
+
+def test_requests_are_labelled_with_the_route_they_matched(monkeypatch):
+    seen = []
+    app = FastAPI()
+    router = APIRouter(dependencies=[Depends(request_tenant)])
+
+    @router.get("/tenants/{tenant_id}/costs")
+    def costs(tenant_id: str):
+        seen.append(metrics._request_stats.get()[2:])
+        return {}
+
+    app.include_router(router)
+    add_metrics(app)
+    client = TestClient(app)
+
+    before = _count("/tenants/{tenant_id}/costs", "200")
+    assert client.get("/tenants/t-1/costs").status_code == 200
+    assert client.get("/tenants/t-2/costs").status_code == 200
+    assert _count("/tenants/{tenant_id}/costs", "200") == before + 2
+    # Inside the handler the route and tenant are already known, for slow query logs
+    assert seen == [["/tenants/{tenant_id}/costs", "t-1"], ["/tenants/{tenant_id}/costs", "t-2"]]
+
+    before = _count("unmatched", "404")
+    assert client.get("/nowhere").status_code == 404
+    assert _count("unmatched", "404") == before + 1
+    assert client.get("/metrics").status_code == 200
+    assert 'route="/metrics"' in client.get("/metrics").text
+
+
+def test_each_import_job_is_logged_with_its_ids(caplog):
+    with caplog.at_level(logging.INFO, logger="nukae.metrics"):
+        record_import("aws", {"rows": 12, "bytes": 3400}, 1.5, "ok",
+                      job={"job_id": 7, "integration_id": "i-1", "tenant_id": "t-1", "attempt": 2})
+        record_import("gcp", None, 0.2, "error")
+    (line,) = [r.getMessage() for r in caplog.records]
+    assert line == ("import job=7 integration=i-1 tenant=t-1 provider=aws attempt=2 status=ok "
+                    "seconds=1.500 rows=12 bytes=3400")
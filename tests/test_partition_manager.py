@@ -0,0 +1,87 @@
+from datetime import date
+from uuid import uuid4
+
+import pyarrow.parquet as pq
+from sqlalchemy import text
+
+from app.core.raw_archive import LocalStore
+from app.services import partition_manager
+from app.services.partition_manager import (
+    archive_key, create_partition, list_detached, list_partitions, maintain_partitions
+)
+
+MARCH = date(2024, 3, 1)
+
+
+def _tenants(db, count: int):
+    ids = [db.execute(text("INSERT INTO tenants (name) VALUES (:n) RETURNING id"), {'n': f"t{i}"}).scalar()
+           for i in range(count)]
+    db.commit()
+    return ids
+
+
+def _insert(db, tenant_id, day: date, cost: float = 1.0):
+    db.execute(
+        text("INSERT INTO cloud_usage_raw (tenant_id, provider, usage_date, cost) VALUES (:t, 'aws', :d, :c)"),
+        {'t': tenant_id, 'd': day, 'c': cost}
+    )
+
+
+def test_months_can_be_sub_partitioned_by_tenant(pg_session):
+    db = pg_session
+    tenants = _tenants(db, 4)
+    # A row loaded before its month existed sits in the default partition
+    _insert(db, tenants[0], date(2024, 3, 15))
+    db.commit()
+
+    assert create_partition(db, 'cloud_usage_raw', MARCH, tenant_buckets=2)
+    assert not create_partition(db, 'cloud_usage_raw', MARCH, tenant_buckets=2)
+    for tenant_id in tenants:
+        _insert(db, tenant_id, date(2024, 3, 2))
+    db.commit()
+
+    counts = dict(db.execute(text("""
+        SELECT tableoid::regclass::text, COUNT(*) FROM cloud_usage_raw GROUP BY 1
+    """)).all())
+    assert set(counts) <= {'cloud_usage_raw_202403_t0', 'cloud_usage_raw_202403_t1'}
+    assert sum(counts.values()) == 5
+    assert list_partitions(db, 'cloud_usage_raw') == {MARCH: 'cloud_usage_raw_202403'}
+
+
+def test_retention_archives_old_months_then_drops_them(pg_session, tmp_path, monkeypatch):
+    db = pg_session
+    monkeypatch.setattr(partition_manager, 'MONTHS_BACK', 2)
+    monkeypatch.setattr(partition_manager, 'MONTHS_AHEAD', 0)
+    monkeypatch.setattr(partition_manager, 'ARCHIVE_FILE_ROWS', 2)
+    (tenant_id,) = _tenants(db, 1)
+    maintain_partitions(db, today=date(2024, 4, 10))
+    for day in (1, 2, 3):
+        _insert(db, tenant_id, date(2024, 2, day), cost=day)
+    _insert(db, tenant_id, date(2024, 4, 1))
+    db.commit()
+
+    monkeypatch.setattr(partition_manager, 'RETENTION_MONTHS', 1)
+    # Without a store, old months are only detached
+    monkeypatch.setattr(partition_manager, 'get_store', lambda: None)
+    result = maintain_partitions(db, today=date(2024, 4, 10))
+    assert result['detached'] == ['cloud_usage_raw_202402', 'finops_focus_cost_data_202402']
+    assert result['archived'] == []
+    assert date(2024, 2, 1) in list_detached(db, 'cloud_usage_raw')
+    assert db.execute(text("SELECT COUNT(*) FROM cloud_usage_raw")).scalar() == 1
+
+    # A later run with a store archives and drops what it left detached
+    store = LocalStore(str(tmp_path))
+    result = maintain_partitions(db, today=date(2024, 4, 10), store=store)
+    assert result['detached'] == []
+    assert result['archived'] == [('cloud_usage_raw_202402', 3), ('finops_focus_cost_data_202402', 0)]
+    assert list_detached(db, 'cloud_usage_raw') == {}
+    assert db.execute(text("SELECT to_regclass('cloud_usage_raw_202402')")).scalar() is None
+
+    feb = date(2024, 2, 1)
+    parts = [pq.read_table(tmp_path / archive_key('cloud_usage_raw', feb, n)) for n in (0, 1)]
+    assert not (tmp_path / archive_key('cloud_usage_raw', feb, 2)).exists()
+    archived = [row for part in parts for row in part.to_pylist()]
+    assert sorted((r['usage_date'], float(r['cost'])) for r in archived) == [
+        ('2024-02-01', 1.0), ('2024-02-02', 2.0), ('2024-02-03', 3.0)
+    ]
+    assert {r['tenant_id'] for r in archived} == {str(tenant_id)}
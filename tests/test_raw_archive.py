@@ -0,0 +1,73 @@
+import pytest
+
+from app.core import raw_archive
+from app.core.raw_archive import LocalStore, RawArchiveBatch, get_store, read_rows
+
+TENANT_ID = '00000000-0000-0000-0000-000000000a01'
+
+
+def test_archived_rows_read_back_through_their_pointers(tmp_path, monkeypatch):
+    monkeypatch.setattr(raw_archive, 'ROW_GROUP_ROWS', 3)
+    store = LocalStore(str(tmp_path))
+    batch = RawArchiveBatch(store, TENANT_ID, 'aws')
+    rows = [
+        {'lineItem/UsageAccountId': f"1234{i}", 'lineItem/UnblendedCost': f"{i}.5", 'resourceTags/user:env': 'prod'}
+        for i in range(7)
+    ]
+    # Rows need not share columns; non-text values are kept as JSON text
+    rows.append({'product/sku': 'ABC', 'usage': {'hours': 2}, 'empty': None})
+    pointers = [batch.add(row) for row in rows]
+    first_key = batch.key
+    batch.write()
+
+    assert {key for key, _, _ in pointers} == {first_key}
+    assert [(group, offset) for _, group, offset in pointers] == [(i // 3, i % 3) for i in range(8)]
+    assert (tmp_path / first_key).is_file()
+    assert first_key.startswith(f"{TENANT_ID}/aws/")
+    assert (batch.files, batch.key != first_key) == (1, True)
+
+    wanted = [pointers[1], pointers[4], pointers[7]]
+    read = read_rows(wanted, store)
+    assert read[pointers[1]] == rows[1]
+    assert read[pointers[4]] == rows[4]
+    # Columns a row lacked, and nulls, are left out
+    assert read[pointers[7]] == {'product/sku': 'ABC', 'usage': '{"hours": 2}'}
+
+
+def test_an_empty_batch_writes_nothing(tmp_path):
+    batch = RawArchiveBatch(LocalStore(str(tmp_path)), TENANT_ID, 'gcp')
+    batch.write()
+    assert batch.files == 0 and not any(tmp_path.iterdir())
+
+
+def test_store_urls():
+    assert get_store('') is None
+    assert isinstance(get_store('file:///var/lib/nukae/raw'), LocalStore)
+    assert get_store('file:///var/lib/nukae/raw').root == '/var/lib/nukae/raw'
+    with pytest.raises(ValueError, match="gs"):
+        get_store('gs://bucket/raw')
+
+
+def test_a_rolled_back_batch_leaves_no_archive_file(pg_session, tmp_path, monkeypatch):
+    from sqlalchemy import text
+    from app.importers import bulk_writer
+    from app.importers.bulk_writer import UsageRawWriter
+    store = LocalStore(str(tmp_path))
+    monkeypatch.setattr(bulk_writer, 'get_store', lambda: store)
+    monkeypatch.setattr(raw_archive, 'get_store', lambda: store)
+    db = pg_session
+    tenant_id = db.execute(text("INSERT INTO tenants (name) VALUES ('archive') RETURNING id")).scalar()
+    db.commit()
+
+    with pytest.raises(Exception, match="invalid input syntax for type date"):
+        with UsageRawWriter(db, tenant_id, 'aws', batch_size=2) as writer:
+            writer.add({'usage_date': '2024-03-01', 'cost': 1, 'raw_data': {'a': 1}})
+            writer.add({'usage_date': '2024-03-02', 'cost': 1, 'raw_data': {'a': 2}})
+            # The second batch's file is written before its COPY fails
+            writer.add({'usage_date': '2024-03-03', 'cost': 1, 'raw_data': {'a': 3}})
+            writer.add({'usage_date': 'yesterday-ish', 'cost': 1, 'raw_data': {'a': 4}})
+
+    kept = db.execute(text("SELECT DISTINCT raw_file FROM cloud_usage_raw")).scalars().all()
+    files = sorted(str(p.relative_to(tmp_path)) for p in tmp_path.rglob('*.parquet'))
+    assert writer.archive.files == 2
+    assert files == kept and len(kept) == 1
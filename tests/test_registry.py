@@ -0,0 +1,45 @@
+from importlib.metadata import EntryPoint
+
+import pytest
+
+from app.importers import registry
+from app.importers.aws_cur_importer import aws_cur_import
+from app.importers.registry import ENTRY_POINT_GROUP, get_importer, register_importer, supported_integrations
+
+
+def oci_import(tenant_id, config, db_session, integration_id=None):
+    return {'rows': 0}
+
+
+@pytest.fixture(autouse=True)
+def fresh_registry(monkeypatch):
+    monkeypatch.setattr(registry, 'IMPORTERS', dict(registry.IMPORTERS))
+    monkeypatch.setattr(registry, '_loaded', {})
+    monkeypatch.setattr(registry, '_plugins', None)
+    plugin = EntryPoint(name='oci.usage_report', value=f"{__name__}:oci_import", group=ENTRY_POINT_GROUP)
+    monkeypatch.setattr(registry, 'entry_points', lambda group: [plugin] if group == ENTRY_POINT_GROUP else [])
+
+
+def test_built_in_importers_resolve_from_their_module_paths():
+    assert get_importer('aws', 's3_cur') is aws_cur_import
+    assert get_importer('azure', 'cost_api').__name__ == 'azure_cost_import'
+    assert get_importer('gcp', 'bq_export').__name__ == 'gcp_bq_import'
+
+
+def test_installed_packages_add_importers_through_entry_points():
+    assert get_importer('oci', 'usage_report') is oci_import
+    assert ('oci', 'usage_report') in supported_integrations()
+    assert ('aws', 's3_cur') in supported_integrations()
+
+
+def test_unknown_integrations_have_no_importer():
+    assert get_importer('oci', 'cost_api') is None
+    assert get_importer('aws', 'cost_api') is None
+
+
+def test_registered_importers_replace_what_was_loaded():
+    assert get_importer('aws', 's3_cur') is aws_cur_import
+    register_importer('aws', 's3_cur', oci_import)
+    assert get_importer('aws', 's3_cur') is oci_import
+    register_importer('aws', 's3_cur', 'app.importers.aws_cur_importer:aws_cur_import')
+    assert get_importer('aws', 's3_cur') is aws_cur_import